@@ -1,6 +1,56 @@
 from keysAndDefs import *
+from featureStore import *
+from streamSVG import SVGStream, svg_to_png
+import copy
+import gc
+import tracemalloc
+
+
+def default_colour(colour, key):
+    """
+    Colour to draw with, HEXES[key] unless one was given. Defaults are looked up when drawing,
+    so that importing doesn't convert the palette (see LazyPalette).
+    """
+    if colour is None:
+        return palette_colour(HEXES, key)
+    return colour
+
+
+SHADE_LEVELS = 20 # with opaque shading, opacities are rounded to the nearest 1/SHADE_LEVELS
+SHADES = {} # background colour : {colour : list of its SHADE_LEVELS + 1 shades}
+
+
+def shade_table(colours, background):
+    """
+    Opaque shades of colours over a background (see oklab_shades), worked out together and kept for later
+    :param colours: list of colours, e.g. the values of a palette
+    :param background: colour underneath
+    :return: dictionary of colour : list of shades, from the background at 0 to the colour at SHADE_LEVELS
+    """
+    table = SHADES.setdefault(background, {})
+    missing = [c for c in dict.fromkeys(colours) if c not in table and c != 'none']
+    for c, shades in zip(missing, oklab_shades(missing, background, SHADE_LEVELS)):
+        table[c] = shades
+    return table
+
+
+def shade(colour, opacity, background):
+    """
+    Opaque colour to draw instead of colour at some opacity over a background, so that nothing has to be
+    alpha blended when the drawing is displayed
+    >>> shade('#000000', 0.5, '#ffffff'), shade('#000000', 0.52, '#ffffff'), shade('#000000', 1, '#ffffff')
+    ('#636363', '#636363', '#000000')
+    """
+    if colour == 'none' or opacity >= 1:
+        return colour
+    table = SHADES.get(background)
+    if table is None or colour not in table:
+        table = shade_table([colour], background)
+    return table[colour][round(opacity * SHADE_LEVELS)]
+
 
 class BaseFeature:
+    __slots__ = ('qty', 'cells', 'status', 'material', 'alt_text', 'original', 'probability', 'name', 'hex')
     def __init__(self, name, colours=(), probability=1, qty=1):
         """
         Create BaseFeature object with a name and material.
@@ -28,62 +78,109 @@ class BaseFeature:
         >>> str(BaseFeature('#+Blah'))
         'empty:planned:bring'
         """
-        self.qty = float(qty)
+        qty = float(qty)
         if QTY_MARKER in name and not name.startswith(TOTEXT):
             qty_info = name.split(QTY_MARKER)
             name = qty_info[0]
-            self.qty = float(qty_info[1])
+            qty = float(qty_info[1])
 
-        self.status, self.material = status_from_prefixes(name)
+        status, material = status_from_prefixes(name)
 
-        self.alt_text = ''
+        alt_text = ''
 
         if not name or name.startswith(TOTEXT):
             if name.startswith(TOTEXT):
-                self.alt_text = name
+                alt_text = name
                 for pref in PREFIXES:
-                    if pref in self.alt_text and pref != TOTEXT:
-                        self.alt_text = self.alt_text.replace(pref,'')
+                    if pref in alt_text and pref != TOTEXT:
+                        alt_text = alt_text.replace(pref,'')
             name = EMPTY
 
-        self.original = name
-        self.probability = probability
+        original = name
 
-        self.name = name.lower()
+        key = name.lower()
         for pref in PREFIXES:
-            self.name = self.name.replace(pref, '')
+            key = key.replace(pref, '')
 
 
-        if PROBABILITY_DELIM in self.name:
-            info = self.name.split(PROBABILITY_DELIM)
-            self.name = info[0]
-            self.probability = float(info[1])
+        if PROBABILITY_DELIM in key:
+            info = key.split(PROBABILITY_DELIM)
+            key = info[0]
+            probability = float(info[1])
 
-        assert self.name in ASSETS, self.name
-        if self.material == MAKE:
-            if self.name in TODO_TYPES:
-                self.material = TODO_TYPES[self.name]
+        assert key in ASSETS, key
+        if material == MAKE:
+            if key in TODO_TYPES:
+                material = TODO_TYPES[key]
             else:
-                assert self.name in MOVABLES, f'{name} is not movable'
+                assert key in MOVABLES, f'{name} is not movable'
                 print('Warning: old system used for bringing', name)
-                self.material = BRING
-        elif self.material == BRING:
-            assert self.name in MOVABLES, f'{name} is not movable'
-        elif self.material == REMOVE:
-            if self.name in MOVABLES:
-                assert self.name in MOVABLES, f'{name} is not movable'
-                self.material = TAKE
+                material = BRING
+        elif material == BRING:
+            assert key in MOVABLES, f'{name} is not movable'
+        elif material == REMOVE:
+            if key in MOVABLES:
+                assert key in MOVABLES, f'{name} is not movable'
+                material = TAKE
             else:
-                self.material = DESTROY
+                material = DESTROY
 
         # for drawing
-        self.hex = '#000000'
+        hex = '#000000'
         if colours:
-            self.hex = colours[self.material]
-        self.filepath = 'assets/' + ASSETS[self.name]
+            hex = palette_colour(colours, material)
+
+        # set once here and never again, since interned features are shared (see intern_feature)
+        self.__setstate__({'qty': qty,
+                           'cells': 1, # cells of the grid this stands for, more than one once folded by compact_features
+                           'status': status, 'material': material, 'alt_text': alt_text, 'original': original,
+                           'probability': probability, 'name': key, 'hex': hex})
+    def __setattr__(self, attr, value):
+        raise AttributeError('BaseFeature is read-only, as it may be shared (see intern_feature); use replace')
+    def __delattr__(self, attr):
+        raise AttributeError('BaseFeature is read-only, as it may be shared (see intern_feature)')
+    def __getstate__(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+    def __setstate__(self, state):
+        for attr, value in state.items():
+            object.__setattr__(self, attr, value)
+    def replace(self, **changes):
+        """
+        Copy of the feature with some attributes changed
+        >>> hammer = BaseFeature('+hammer')
+        >>> hammer.qty = 3
+        Traceback (most recent call last):
+        ...
+        AttributeError: BaseFeature is read-only, as it may be shared (see intern_feature); use replace
+        >>> hammers = hammer.replace(qty=3.0)
+        >>> hammers, hammers.qty, hammer.qty
+        (hammer:planned:bring, 3.0, 1.0)
+        """
+        feature = copy.copy(self)
+        feature.__setstate__(changes)
+        return feature
+    @property
+    def filepath(self):
+        return ASSET_PATHS[self.name]
     def __repr__(self):
         return f'{self.name}:{self.status}:{self.material}'
-    def draw(self, g, x=0, y=0, wid=20, hei=20, bg_colour=HEXES[BASE], opacity=0.5):
+    def draw(self, g, x=0, y=0, wid=20, hei=20, bg_colour=None, opacity=0.5, merge=None, shade_over=None):
+        """
+        Draw the icon (or text) for the feature
+        :param g: drawing object
+        :param merge: if given, dictionary of (fill, stroke, stroke width, opacity) : list of path strings, which the
+        icon's paths are added to instead of being drawn (see BaseLocation.draw_feature_grid)
+        :param shade_over: if given, the colour underneath; anything translucent is drawn in an opaque shade instead
+        >>> merge = {}
+        >>> BaseFeature('-hacksaw', HEXES).draw(None, x=10, y=20, merge=merge)
+        >>> [(k, len(merge[k])) for k in merge]
+        [(('#0090a2', 'none', 0.221, 1), 3)]
+        >>> merge = {}
+        >>> BaseFeature('bear/0.5', HEXES).draw(None, merge=merge, shade_over='#ffffff')
+        >>> list(merge)
+        [('#92a495', 'none', 0.0, 1)]
+        """
+        bg_colour = default_colour(bg_colour, BASE)
         if self.alt_text:
             font_size = font_size_for_box(self.alt_text, wid, hei)
             mid_y = y + hei/2
@@ -98,18 +195,124 @@ class BaseFeature:
             new_wid = wid*scaling
             diff = hei - new_wid
             new_y = y + (diff)
-            import_svg(g, self.filepath, x=x, y=new_y, wid=new_wid,
-                   hei=new_wid, fill=self.hex, opacity=self.probability)
+            self.draw_icon(g, x=x, y=new_y, wid=new_wid, merge=merge, shade_over=shade_over)
             tbox_wid = new_wid * scaling
-            g.append(draw.Rectangle(x+wid/2, y, tbox_wid, tbox_wid, fill=self.hex, opacity=.3))
+            if shade_over is None:
+                g.append(draw.Rectangle(x+wid/2, y, tbox_wid, tbox_wid, fill=self.hex, opacity=.3))
+            else:
+                g.append(draw.Rectangle(x+wid/2, y, tbox_wid, tbox_wid, fill=shade(self.hex, .3, shade_over)))
             g.append(draw.Text( str(int(self.qty)), tbox_wid*.8,
                                x = x+wid-tbox_wid*.9, y=y+tbox_wid*.75,
                                 text_anchor='middle'))
         else:
-            import_svg(g, self.filepath, x=x, y=y, wid=wid,
-                   hei=hei, fill=self.hex, opacity=self.probability) # shading for probabalistic features
+            self.draw_icon(g, x=x, y=y, wid=wid, merge=merge, shade_over=shade_over)
+    def draw_icon(self, g, x=0, y=0, wid=20, merge=None, shade_over=None):
+        count('icons drawn')
+        if merge is not None:
+            pieces = transformed_path_data(load_svg(self.filepath), x=x, y=y, wid=wid)
+            if pieces is not None:
+                for style, path_data in pieces:
+                    key = (self.hex, style['stroke'], style['stroke-width'], self.probability)
+                    if shade_over is not None:
+                        key = (shade(self.hex, self.probability, shade_over),
+                               shade(style['stroke'], self.probability, shade_over), style['stroke-width'], 1)
+                    if key not in merge:
+                        merge[key] = []
+                    merge[key].append(path_data)
+                return
+        with phase('import icons'):
+            if shade_over is not None and self.probability < 1:
+                import_svg(g, self.filepath, x=x, y=y, wid=wid, hei=wid, fill=self.hex,
+                           recolour=lambda c: shade(c, self.probability, shade_over))
+            else:
+                import_svg(g, self.filepath, x=x, y=y, wid=wid,
+                           hei=wid, fill=self.hex, opacity=self.probability) # shading for probabalistic features
+
+FEATURE_TABLE = {} # palette_key of a colours dictionary : its interned features, most recently used last
+FEATURE_TABLE_LIMIT = 8 # palettes to keep the interned features of
+
+
+def palette_key(colours):
+    """
+    Hashable stand-in for a colour dictionary, for looking up interned features. A frozenset rather than a sorted
+    tuple, as it's worked out for every base: it needs no sorting, and unlike a tuple of this size it isn't kept on
+    CPython's free list once dropped, which would otherwise hold on to one per base loaded
+    >>> palette_key({'base': '#000000', 'bring': '#ff0000'}) == palette_key({'bring': '#ff0000', 'base': '#000000'})
+    True
+    >>> palette_key(())
+    frozenset()
+    """
+    if not colours:
+        return frozenset()
+    return frozenset(colours.items())
+
+
+def feature_table(colours=()):
+    """
+    The table of interned features for one colour palette (see intern_feature), looked up by the palette's colours,
+    so a dictionary changed since it was last used gets the features for its new colours. Only the tables of the
+    FEATURE_TABLE_LIMIT palettes used most recently are kept.
+    >>> feature_table(HEXES) is feature_table(dict(HEXES))
+    True
+    >>> colours = dict(HEXES)
+    >>> before = feature_table(colours)
+    >>> colours[TAKE] = '#ff0000'
+    >>> feature_table(colours) is before
+    False
+    """
+    key = palette_key(colours)
+    table = FEATURE_TABLE.pop(key, None)
+    if table is None:
+        table = {}
+        if len(FEATURE_TABLE) >= FEATURE_TABLE_LIMIT:
+            del FEATURE_TABLE[next(iter(FEATURE_TABLE))]
+    FEATURE_TABLE[key] = table
+    return table
+
+
+def intern_feature(token, colours=(), table=None):
+    """
+    Look up the BaseFeature for a cell of the feature grid, parsing each distinct token only once per palette.
+    The same object is shared by every cell with that token, which is why BaseFeatures are read-only.
+    :param token: the text of the cell, e.g. '-hammer'
+    :param colours: dictionary of colours, as for BaseFeature
+    :param table: feature_table(colours), if already known
+    :return: BaseFeature object
+    >>> intern_feature('-hammer', HEXES) is intern_feature('-hammer', HEXES)
+    True
+    >>> intern_feature('-hammer', HEXES) is intern_feature('-hammer')
+    False
+    >>> intern_feature('+hammer')
+    hammer:planned:bring
+    """
+    if table is None:
+        table = feature_table(colours)
+    feature = table.get(token)
+    if feature is None:
+        count('features parsed')
+        feature = BaseFeature(token, colours)
+        table[token] = feature
+    return feature
+
+
+CORNERS = {}
+
+
+def parse_corner(s):
+    """
+    Split a corner like "top,left" into a (shared) tuple
+    >>> parse_corner('bottom, right')
+    ('bottom', 'right')
+    >>> parse_corner('top,left') is parse_corner('top,left')
+    True
+    """
+    if s not in CORNERS:
+        CORNERS[s] = tuple(s.replace(' ','').split(','))
+    return CORNERS[s]
+
 
 class BaseConnection:
+    __slots__ = ('source', 'sink', 'source_corner', 'sink_corner', '_corners', 'direction', 'kind', 'colour', 'dasharray')
     def __init__(self, source, direction, source_corner, sink, sink_corner, kind, colours=False):
         """
         Create BaseConnection object, saving its destinations, corners, and kind of connection (road, rail, etc).
@@ -122,24 +325,59 @@ class BaseConnection:
         """
         self.source = source
         self.sink = sink
-        self.vertices = [source, sink]
 
         self.source_corner = source_corner
         self.sink_corner = sink_corner
-        self.corners = {}
-        self.corners[self.source] = source_corner.replace(' ','').split(',')
-        self.corners[self.sink] = sink_corner.replace(' ','').split(',')
+        self._corners = None
 
+        assert direction in REVERSE, direction
         self.direction = direction
-        self.reverse = REVERSE[direction]
 
         self.kind = kind
         self.colour = 'green'
         self.dasharray = DASHSTYLE[kind]
         if colours:
-            self.colour = colours[kind]
+            self.colour = palette_colour(colours, kind)
+    @property
+    def vertices(self):
+        return [self.source, self.sink]
+    @property
+    def reverse(self):
+        return REVERSE[self.direction]
+    @property
+    def corners(self):
+        """
+        Corners of each base's box that the connection is drawn between, indexed by base name
+        >>> BaseConnection("Quonset", "south", "bottom,right", "CommuterCar", "top,right", "path").corners
+        {'Quonset': ('bottom', 'right'), 'CommuterCar': ('top', 'right')}
+        """
+        if self._corners is None:
+            self._corners = {self.source: parse_corner(self.source_corner), self.sink: parse_corner(self.sink_corner)}
+        return self._corners
     def invert(self, colours):
         return BaseConnection(self.sink, self.reverse, self.sink_corner, self.source, self.source_corner, self.kind, colours)
+    def mirrors(self, other):
+        """
+        Whether other is the same connection seen from the other end
+        >>> cob = BaseConnection("Quonset", "south", "bottom,right", "CommuterCar", "top,right", "path")
+        >>> cob.mirrors(cob.invert(False)), cob.mirrors(cob)
+        (True, False)
+        """
+        return (self.source == other.sink and self.sink == other.source and self.direction == other.reverse and
+                self.corners == other.corners and self.kind == other.kind)
+    def validate(self):
+        """
+        Check that the connection joins two different bases, between corners that exist
+        >>> BaseConnection("Quonset", "south", "bottom,middle", "CommuterCar", "top,right", "path").validate()
+        Traceback (most recent call last):
+        ...
+        AssertionError: Quonset to CommuterCar: bad corner bottom,middle
+        """
+        assert self.source != self.sink, f'{self.source} connected to itself'
+        for corner in (self.source_corner, self.sink_corner):
+            c = parse_corner(corner)
+            assert len(c) == 2 and c[CORN_Y] in (TOP, BOTTOM) and c[CORN_X] in (LEFT, RIGHT), \
+                f'{self.source} to {self.sink}: bad corner {corner}'
     def __repr__(self):
         """
         Textual representation of the connection
@@ -268,11 +506,16 @@ class BaseConnection:
 
 
 class BaseLocation:
-    def __init__(self, name, data, colours=()):
+    __slots__ = ('name', 'is_drawn', 'placed_by', 'features', 'region', 'customizable', 'loading', 'indoors',
+                 'explored', 'cabinfeverrisk', 'num_features', 'longest_row', 'connections', 'edges', 'edges_drawn',
+                 'icon_size', 'margin_size', 'cell_size', 'box_width', 'box_height', 'feature_grid_height',
+                 'feature_grid_top', 'box_x', 'box_y', 'box_top', 'box_bottom', 'box_left', 'box_right', '_columns')
+    def __init__(self, name, data, colours=(), compact=False):
         """
         Set up a base as an object with a name, and a 2D list of BaseFeatures
         :param name: name of the base
         :param data: data from JSON file
+        :param compact: fold runs of identical features in a row into one feature with a quantity (see compact_features)
         >>> b, e = parse_input('tests/testinput.json')
         >>> b['Quonset'][FEATURES][0]
         'bear,deer,wolf'
@@ -302,9 +545,18 @@ class BaseLocation:
         [bed:actual:base, trader:actual:base, quality:actual:base]
         [workbench:planned:cedar, furnbench:planned:cedar, bearbed:planned:fir]
         ---
+        >>> compact_quonset = BaseLocation('Quonset', b['Quonset'], compact=True)
+        >>> [(f.name, f.qty) for f in compact_quonset.features[6]]
+        [('trunk', 4.0), ('rockcache', 1.0), ('suitcase', 1.0)]
+        >>> compact_quonset.longest_row
+        6
+        >>> quonset.features[6][0] is quonset.features[7][0] # cells with the same text share one BaseFeature
+        True
         """
         self.name = name
         self.is_drawn = False
+        self.placed_by = None
+        self._columns = None
 
         self.features = []
         self.region = data[REGION]
@@ -321,14 +573,17 @@ class BaseLocation:
         self.longest_row = 0
         # set up the features
         if data[FEATURES] != '' and data[FEATURES] != ['']:
+            table = feature_table(colours)
             for row in data[FEATURES]:
                 row_info = row.split(',')
-                self.longest_row = max(self.longest_row, len(row_info))
                 row_objects = []
                 for feature in row_info:
-                    row_objects.append( BaseFeature(feature.strip(), colours) )
+                    row_objects.append( intern_feature(feature.strip(), colours, table) )
                     if feature.strip() != EMPTY:
                         self.num_features += 1
+                if compact:
+                    row_objects = compact_features(row_objects)
+                self.longest_row = max(self.longest_row, len(row_objects))
                 self.features.append(row_objects)
 
         # connections
@@ -339,8 +594,15 @@ class BaseLocation:
             for dir in data[CONNECTIONS]:
                 sink_name = data[CONNECTIONS][dir]
                 self.connections[sink_name] = dir
+    @property
+    def columns(self):
+        # features stored column-wise for FeatureStore, built on first use
+        if self._columns is None:
+            self._columns = feature_columns(self.features)
+        return self._columns
     def reset_drawing(self):
         self.is_drawn = False
+        self.placed_by = None
         for e in self.edges_drawn:
             self.edges_drawn[e] = False
     def add_connection(self, boc):
@@ -423,7 +685,7 @@ class BaseLocation:
 
         return self.box_width, self.box_height, self.cell_size, self.margin_size
     def draw_base_box(self, d, x=0, y=0,
-                      fill=HEXES[BG], border=HEXES[BASE], outdoor=HEXES[OUTDOOR], unexplored=HEXES[UNEXPLORED]):
+                      fill=None, border=None, outdoor=None, unexplored=None, opaque=False):
         """
         Draw just the box for the base.
         :param d: drawing object
@@ -431,6 +693,7 @@ class BaseLocation:
         :param y: upper left corner of box on canvas
         :param fill: box fill colour
         :param border: box border colour
+        :param opaque: draw a faded border in an opaque shade over the fill, rather than translucent
         :return:
         >>> bases, colours = process_input('tests/testinput.json')
         >>> w, h, c, m = bases['Quonset'].box_dimensions(20)
@@ -438,6 +701,10 @@ class BaseLocation:
         >>> bases['Quonset'].draw_base_box(d)
         >>> d.save_svg('tests/quonset_box.svg')
         """
+        fill = default_colour(fill, BG)
+        border = default_colour(border, BASE)
+        outdoor = default_colour(outdoor, OUTDOOR)
+        unexplored = default_colour(unexplored, UNEXPLORED)
         self.box_x = x
         self.box_y = y
 
@@ -456,6 +723,9 @@ class BaseLocation:
             stroke_opacity = OUTDOOR_OPACITY
         if not self.explored:
             border = unexplored
+        if opaque:
+            border = shade(border, stroke_opacity, fill)
+            stroke_opacity = 1
 
         margin = self.margin_size/2
         self.box_top = self.box_y + margin
@@ -467,12 +737,14 @@ class BaseLocation:
                                  self.box_width-self.margin_size, self.box_height-self.margin_size,
                                  rx=rx, ry=ry, stroke_dasharray=stroke_dasharray, stroke_opacity=stroke_opacity,
                                  fill=fill, stroke_width=self.margin_size, stroke=border ) )
-    def draw_feature_grid(self, d, x=0, y=0, draw_guide_box=False):
+    def draw_feature_grid(self, d, x=0, y=0, draw_guide_box=False, merge_icons=False, shade_over=None):
         """
         Draw just the grid of features (icons like wolf, coal)
         :param d: drawing object
         :param x: top-left corner of the box on the canvas
         :param y: top-left corner of the box on the canvas
+        :param merge_icons: draw all icons of the same colour and opacity as one path, instead of a group per icon
+        :param shade_over: see BaseFeature.draw
         :return: y-axis position for the top of the feature grid (useful for figuring out header height)
         >>> bases, colours = process_input('tests/testinput.json')
         >>> i = 20
@@ -482,6 +754,12 @@ class BaseLocation:
         >>> bases['Harris'].draw_feature_grid(d, 0, 0)
         17.5
         >>> d.save_svg('tests/harris.svg')
+        >>> w, h, c, m = bases['Quonset'].box_dimensions(i)
+        >>> d = draw.Drawing(w, h)
+        >>> bases['Quonset'].draw_feature_grid(d, 0, 0, merge_icons=True)
+        37.5
+        >>> len(d.elements[0].children) # rather than 60 icons
+        16
         """
         # matrix of icons
         g = draw.Group(id=self.name + ":features")
@@ -496,17 +774,31 @@ class BaseLocation:
         if draw_guide_box:
             g.append(draw.Rectangle(start_x, icon_y, self.cell_size*self.longest_row, self.cell_size*len(self.features), fill='none', stroke='green'))
 
+        merge = None
+        if merge_icons:
+            merge = {}
+
         for i, row in enumerate(self.features):
             icon_x = start_x + self.margin_size/2
             for j, bob in enumerate(row):
-                icon_group = draw.Group(id=f'{bob.name}:{self.name}:{j}:{i}')
-                bob.draw(icon_group, x=icon_x, y=icon_y, wid=self.icon_size, hei=self.icon_size)
-                g.append(icon_group)
+                if merge_icons:
+                    bob.draw(g, x=icon_x, y=icon_y, wid=self.icon_size, hei=self.icon_size, merge=merge,
+                             shade_over=shade_over)
+                else:
+                    icon_group = draw.Group(id=f'{bob.name}:{self.name}:{j}:{i}')
+                    bob.draw(icon_group, x=icon_x, y=icon_y, wid=self.icon_size, hei=self.icon_size,
+                             shade_over=shade_over)
+                    g.append(icon_group)
                 icon_x += self.cell_size
             icon_y += self.cell_size
+
+        if merge_icons:
+            for fill, stroke, stroke_width, opacity in merge:
+                g.append(draw.Path(' '.join(merge[(fill, stroke, stroke_width, opacity)]),
+                                   fill=fill, stroke=stroke, stroke_width=stroke_width, opacity=opacity))
         d.append(g)
         return self.feature_grid_top
-    def draw_header(self, d, x=0, y=0, text_colour=HEXES[BASE], border=HEXES[BASE], unexplored=HEXES[UNEXPLORED]):
+    def draw_header(self, d, x=0, y=0, text_colour=None, border=None, unexplored=None):
         """
         Draw just the grid of features (icons like wolf, coal)
         :param d: drawing object
@@ -530,6 +822,9 @@ class BaseLocation:
         >>> bases['MTFarm'].draw_header(d, 0, 0)
         >>> d.save_svg('tests/mtfarm.svg')
         """
+        text_colour = default_colour(text_colour, BASE)
+        border = default_colour(border, BASE)
+        unexplored = default_colour(unexplored, UNEXPLORED)
         g = draw.Group(id=self.name + ":header")
 
         min_text_top = y + 2 * self.margin_size
@@ -564,12 +859,15 @@ class BaseLocation:
                             text_anchor='middle' ) )
         d.append(g)
 
-    def draw(self, d, icon_size, margin_ratio=1/8, x=0, y=0, fill=HEXES[BASE_BG], border=HEXES[BASE], unexplored=HEXES[UNEXPLORED]):
+    def draw(self, d, icon_size, margin_ratio=1/8, x=0, y=0, fill=None, border=None, unexplored=None,
+             merge_icons=False, opaque=False):
         """
         Draw the base with drawsvg
         :param d: Drawing object
         :param icon_size: icon height in pixels (square)
         :param margin_ratio: margin between icons, as a fraction of icon size
+        :param merge_icons: see draw_feature_grid
+        :param opaque: draw probabilities and faded borders as opaque shades over the fill (see shade)
         :return:
         >>> bases, colours = process_input('tests/testinput.json')
         >>> w, h, c, m = bases['Quonset'].box_dimensions(20)
@@ -583,6 +881,9 @@ class BaseLocation:
         >>> bases['Misanthrope'].draw(d, 20)
         >>> d.save_svg('tests/misanthrope.svg')
         """
+        fill = default_colour(fill, BASE_BG)
+        border = default_colour(border, BASE)
+        unexplored = default_colour(unexplored, UNEXPLORED)
         box_width, box_height, cell_size, margin_size = self.box_dimensions(icon_size, margin_ratio)
         g = draw.Group(id=self.name)
 
@@ -592,8 +893,8 @@ class BaseLocation:
             x = self.box_x
             y = self.box_y
 
-        self.draw_base_box(g, x=x, y=y, fill=fill, border=border, unexplored=unexplored)
-        self.draw_feature_grid(g, x=x, y=y)
+        self.draw_base_box(g, x=x, y=y, fill=fill, border=border, unexplored=unexplored, opaque=opaque)
+        self.draw_feature_grid(g, x=x, y=y, merge_icons=merge_icons, shade_over=fill if opaque else None)
         self.draw_header(g, x=x, y=y, border=border, unexplored=unexplored )
 
         d.append(g)
@@ -602,11 +903,13 @@ class BaseLocation:
     def draw_connection(self, d, neighbour, arrow_ratio=1.0,
                         most_north=BIGNUM, most_south=0, most_west=BIGNUM, most_east=0,
                         print_output=False,
-                        unexplored=HEXES[UNEXPLORED], border=HEXES[BASE], fill=HEXES[BASE_BG]):
+                        unexplored=None, border=None, fill=None, batches=None,
+                        merge_icons=False, opaque=False):
         """
         Draw connection from self to neighbouring base
         :param d: drawing object
         :param neighbour: BaseLocation object
+        :param batches: if given, dictionary to collect the line into instead of drawing it (see draw_connection_batches)
         :return:
         >>> bases, colours = process_input('tests/testinput.json')
         >>> w, h, c, m = bases['Hibernia'].box_dimensions(20)
@@ -631,7 +934,15 @@ class BaseLocation:
         >>> bases['Hibernia'].add_connection(BaseConnection("Hibernia", "west", "bottom,left", "LonelyLighthouse", "top,right", "tinder", colours))
         >>> bases['Hibernia'].draw_connection(d, bases['LonelyLighthouse'])
         >>> d.save_svg('tests/hibernia.svg')
+        >>> batches = {}
+        >>> bases['Hibernia'].edges_drawn['Riken'] = False
+        >>> bases['Hibernia'].draw_connection(d, bases['Riken'], batches=batches)
+        >>> batches
+        {('charcoal', '#0f1528', '2,1', 2.5): [(103.75, 243.75, 103.75, 263.75)]}
         """
+        unexplored = default_colour(unexplored, UNEXPLORED)
+        border = default_colour(border, BASE)
+        fill = default_colour(fill, BASE_BG)
         neigh_name = neighbour.name
         arrow_size = self.icon_size  # self.cell_size*arrow_ratio #
         most_north, most_south, most_west, most_east = update_extremes(self, most_north, most_south, most_west, most_east)
@@ -640,8 +951,6 @@ class BaseLocation:
         assert cob.source == self.name
 
         if not self.edges_drawn[neigh_name]:
-            p = draw.Path(stroke_width=self.margin_size, stroke=cob.colour, stroke_dasharray=cob.dasharray)
-
             assert cob.corners[self.name][CORN_Y] in [BOTTOM, TOP]
             if cob.corners[self.name][CORN_Y] == BOTTOM:
                 source_y = self.box_bottom #+ self.margin_size/2
@@ -653,8 +962,6 @@ class BaseLocation:
             else:
                 source_x = self.box_right
 
-            p.M(source_x, source_y)
-
             if not neighbour.is_drawn:
                 sink_x, sink_y = source_x, source_y
                 if cob.direction == SOUTH:
@@ -665,8 +972,7 @@ class BaseLocation:
                     sink_x += arrow_size
                 if cob.direction == WEST:
                     sink_x -= arrow_size
-                p.L(sink_x, sink_y)
-                d.append(p)
+                self.draw_connection_line(d, cob, source_x, source_y, sink_x, sink_y, batches)
                 self.edges_drawn[neigh_name] = True
                 neighbour.edges_drawn[self.name] = True
 
@@ -685,7 +991,9 @@ class BaseLocation:
 
                 if print_output:
                     print(' '*TABSIZE*2 + 'Drawing', neigh_name, "as child of", self.name)
-                neighbour.draw(d, self.icon_size, x=neigh_left, y=neigh_top, unexplored=unexplored, border=border, fill=fill)
+                neighbour.draw(d, self.icon_size, x=neigh_left, y=neigh_top, unexplored=unexplored, border=border, fill=fill,
+                               merge_icons=merge_icons, opaque=opaque)
+                neighbour.placed_by = self.name
             else:
                 if cob.corners[neigh_name][CORN_Y] == BOTTOM:
                     sink_y = neighbour.box_bottom #+ self.margin_size/2
@@ -695,13 +1003,78 @@ class BaseLocation:
                     sink_x = neighbour.box_left
                 else:
                     sink_x = neighbour.box_right
-                p.L(sink_x, sink_y)
-                d.append(p)
+                self.draw_connection_line(d, cob, source_x, source_y, sink_x, sink_y, batches)
 
                 if print_output:
                     print(' '*TABSIZE*2 + 'Connecting', self.name, "to", neigh_name)
                 self.edges_drawn[neigh_name] = True
                 neighbour.edges_drawn[self.name] = True
+    def draw_connection_line(self, d, cob, source_x, source_y, sink_x, sink_y, batches=None):
+        """
+        Draw the line for a connection, or add it to batches, keyed by its style, to be drawn later.
+        """
+        if batches is None:
+            p = draw.Path(stroke_width=self.margin_size, stroke=cob.colour, stroke_dasharray=cob.dasharray)
+            p.M(source_x, source_y)
+            p.L(sink_x, sink_y)
+            d.append(p)
+        else:
+            style = (cob.kind, cob.colour, cob.dasharray, self.margin_size)
+            if style not in batches:
+                batches[style] = []
+            batches[style].append((source_x, source_y, sink_x, sink_y))
+
+
+def draw_connection_batches(d, batches):
+    """
+    Draw the connections collected by draw_connection as one path per style of connection,
+    with each connection as its own subpath.
+    :param d: drawing object
+    :param batches: dictionary of (kind, colour, dasharray, stroke width) : list of (x1, y1, x2, y2)
+    :return:
+    >>> d = draw.Drawing(100, 100)
+    >>> draw_connection_batches(d, {('path', '#78b6a3', '', 2.5): [(0, 0, 0, 20), (10, 0, 30, 0)]})
+    >>> print(d.as_svg().splitlines()[-2])
+    <path d="M0,0 L0,20 M10,0 L30,0" stroke-width="2.5" stroke="#78b6a3" stroke-dasharray="" />
+    """
+    for style in batches:
+        kind, colour, dasharray, stroke_width = style
+        p = draw.Path(stroke_width=stroke_width, stroke=colour, stroke_dasharray=dasharray)
+        for source_x, source_y, sink_x, sink_y in batches[style]:
+            p.M(source_x, source_y)
+            p.L(sink_x, sink_y)
+        d.append(p)
+
+
+def compact_features(row):
+    """
+    Fold consecutive identical features (same name, status and material) into a single feature whose
+    quantity is the total, so that it is drawn once with a quantity badge. Only certain features are folded:
+    cells and qty are read as how many there are (legend counts, distributions, hauls), which two bear/0.5
+    cells are not.
+    :param row: list of BaseFeature objects
+    :return: new list of BaseFeature objects
+    >>> compact_features([BaseFeature('+hammer'), BaseFeature('+hammer'), BaseFeature('hammer'), BaseFeature('+hammer:2')])
+    [hammer:planned:bring, hammer:actual:base, hammer:planned:bring]
+    >>> [(f.qty, f.cells) for f in compact_features([BaseFeature('+hammer'), BaseFeature('+hammer:2'), BaseFeature('hammer')])]
+    [(3.0, 2), (1.0, 1)]
+    >>> compact_features([BaseFeature(''), BaseFeature(''), BaseFeature('#Note'), BaseFeature('#Note')])
+    [empty:actual:base, empty:actual:base, empty:actual:base, empty:actual:base]
+    >>> [(f.qty, f.cells) for f in compact_features([BaseFeature('bear/0.5'), BaseFeature('bear/0.5')])]
+    [(1.0, 1), (1.0, 1)]
+    """
+    compacted = []
+    for feature in row:
+        if compacted:
+            prev = compacted[-1]
+            if (feature.name == prev.name and feature.name != EMPTY
+                    and feature.status == prev.status and feature.material == prev.material
+                    and feature.probability == prev.probability == 1
+                    and not feature.alt_text and not prev.alt_text):
+                compacted[-1] = prev.replace(qty=prev.qty + feature.qty, cells=prev.cells + feature.cells)
+                continue
+        compacted.append(feature)
+    return compacted
 
 
 def font_size_for_box(s, max_text_width, max_text_height):
@@ -784,10 +1157,50 @@ def parse_input(filename='bases.json'):
     return bases, edges
 
 
+class EdgeIndex(dict):
+    def __init__(self):
+        """
+        Connections indexed both ways round, as base name : {neighbour name : BaseConnection from that base},
+        plus one canonical entry per pair of bases (in the orientation given in the JSON), indexed by the
+        sorted pair of names.
+        >>> edges = EdgeIndex()
+        >>> edges.add(BaseConnection("Quonset", "south", "bottom,right", "CommuterCar", "top,right", "path"))
+        >>> edges['CommuterCar']['Quonset'].direction, edges['Quonset']['CommuterCar'].direction
+        ('north', 'south')
+        >>> list(edges.canonical)
+        [('CommuterCar', 'Quonset')]
+        >>> edges.connection('CommuterCar', 'Quonset').source
+        'Quonset'
+        """
+        super().__init__()
+        self.canonical = {}
+    @staticmethod
+    def key(a, b):
+        if a < b:
+            return a, b
+        return b, a
+    def add(self, lob, colours=False):
+        lob.validate()
+        rev_lob = lob.invert(colours)
+        assert lob.mirrors(rev_lob), lob
+        if lob.source not in self:
+            self[lob.source] = {}
+        self[lob.source][lob.sink] = lob
+        if lob.sink not in self:
+            self[lob.sink] = {}
+        self[lob.sink][lob.source] = rev_lob # reverse it
+        self.canonical[self.key(lob.source, lob.sink)] = lob # a repeated connection replaces the earlier one
+    def connection(self, a, b):
+        """
+        The connection between two bases, as given in the JSON
+        """
+        return self.canonical[self.key(a, b)]
+
+
 def parse_edges(edges, colours=False):
     """
     Convert the lists of edges from the JSON into BaseConnection objects.
-    :return: dictionary, indexed by base names, each with a list of BaseConnection objects that go to/from the base.
+    :return: EdgeIndex, indexed by base names, each with a dictionary of BaseConnection objects that go to/from the base.
     >>> b, e = parse_input('tests/testinput.json')
     >>> edges = parse_edges(e)
     >>> len(edges['Hibernia'])
@@ -808,28 +1221,19 @@ def parse_edges(edges, colours=False):
     False
     >>> parse_edges({})
     {}
+    >>> edges = parse_edges(e, HEXES)
+    >>> e == parse_input('tests/testinput.json')[1] # the lists from the JSON are left as they were
+    True
     """
-    connections = {}
+    connections = EdgeIndex()
     for e in edges:
         if type(e) != str:
-            data = e
-            if colours:
-                data.append(colours)
-            lob = BaseConnection(*data)
-            rev_lob = lob.invert(colours)
-            assert str(lob) == str(rev_lob), lob
-            if lob.source not in connections:
-                connections[lob.source] = {}
-            connections[lob.source][lob.sink] = lob
-
-            if lob.sink not in connections:
-                connections[lob.sink] = {}
-            connections[lob.sink][lob.source] = rev_lob # reverse it
+            connections.add(BaseConnection(*e, colours), colours)
     return connections
 
 
-def add_base(b, base_info, base_objects, colours, edges, to_print=False):
-    bob = BaseLocation(b, base_info, colours)
+def add_base(b, base_info, base_objects, colours, edges, to_print=False, compact=False):
+    bob = BaseLocation(b, base_info, colours, compact=compact)
     if b in edges:
         for connection_to_b in edges[b]:
             bob.add_connection(edges[b][connection_to_b])
@@ -837,11 +1241,12 @@ def add_base(b, base_info, base_objects, colours, edges, to_print=False):
     if to_print:
         print(bob)
 
-def process_input(filename='bases.json', to_print=False, style_file='styling.json'):
+def process_input(filename='bases.json', to_print=False, style_file='styling.json', compact=False):
     """
     Parse input JSON and then turn it into BaseLocation objects.
     :param filename: input JSON filepath
-    :return: list of BaseLocation objects.
+    :param compact: fold runs of identical features into quantities (see compact_features)
+    :return: BaseWorld (dictionary of BaseLocation objects that keeps feature counts up to date), colours
     >>> bases, colours = process_input('tests/testinput.json', to_print=False)
     >>> bases['Misanthrope']
     ---
@@ -857,26 +1262,60 @@ def process_input(filename='bases.json', to_print=False, style_file='styling.jso
     >>> bases, colours = process_input('mybases.json')
     >>> #bases
     """
-    bases, edges = parse_input(filename)
-    if style_file == STYLE_FILE:
-        colours = HEXES
-    else:
-        raw_colours, DASHSTYLE, FILLS, STROKES = parse_styling(style_file)
-        colours = parse_colours(raw_colours)
-
-    edges = parse_edges(edges, colours)
-    if len(edges) == 0:
-        print('No edges! Old system!')
-    base_objects = {}
-    for b in bases:
-        if not b.startswith(COMMENT):
-            add_base(b, bases[b], base_objects, colours, edges, to_print=to_print)
+    with phase('parse json'):
+        bases, edges = parse_input(filename)
+    with phase('styling'):
+        if style_file == STYLE_FILE:
+            colours = HEXES.fill() if isinstance(HEXES, LazyPalette) else HEXES
         else:
-            for k in bases[b]:
-                add_base(k, bases[b][k], base_objects, colours, edges, to_print=to_print)
+            raw_colours, DASHSTYLE, FILLS, STROKES = parse_styling(style_file)
+            colours = cached_colours(style_file, raw_colours)
+
+    with phase('build bases'):
+        edges = parse_edges(edges, colours)
+        if len(edges) == 0:
+            print('No edges! Old system!')
+        base_objects = BaseWorld()
+        for b in bases:
+            if not b.startswith(COMMENT):
+                add_base(b, bases[b], base_objects, colours, edges, to_print=to_print, compact=compact)
+            else:
+                for k in bases[b]:
+                    add_base(k, bases[b][k], base_objects, colours, edges, to_print=to_print, compact=compact)
+    if is_profiling():
+        count('bases', len(base_objects))
+        count('feature cells', sum(len(row) for b in base_objects.values() for row in b.features))
     return base_objects, colours
 
 
+def model_memory(filename='bases.json'):
+    """
+    Measure with tracemalloc how much memory the loaded model holds on to, per base.
+    If memory is already being traced (e.g. by --memory) that trace is left running.
+    :param filename: input JSON filepath
+    :return: bytes per BaseLocation
+    >>> model_memory('loottable4.json') < 3000 # was ~5200 before slots and interned features
+    True
+    >>> tracemalloc.start()
+    >>> model_memory('loottable4.json') < 3000, tracemalloc.is_tracing()
+    (True, True)
+    >>> tracemalloc.stop()
+    """
+    process_input(filename) # so that icon and feature tables are already filled
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        bases, colours = process_input(filename)
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return retained / len(bases)
+
+
 def update_extremes(bob, most_north, most_south, most_west, most_east):
     """
     Track the furthest dimensions that have been drawn thus far
@@ -950,10 +1389,21 @@ def redraw_bases(bases, colours, icon_size=20, output='tests/rebases.svg', add_l
 
 def draw_bases(bases, colours, icon_size=20, output='tests/bases.svg',
                base_x=200, base_y=150, width=800, height=800,
-               add_legend=True, output_png=True, print_output=False):
+               add_legend=True, output_png=True, print_output=False, batch_edges=False, merge_icons=False,
+               compact=False, opaque=False, themeable=False, stream=False):
     """
     Draw all bases
     :param bases:
+    :param batch_edges: draw all connections of the same kind as a single path, after the bases
+    :param merge_icons: draw the icons of each base that share a colour and opacity as a single path
+    :param compact: draw the outstanding bring/take items as quantities rather than one icon each
+    :param opaque: draw probabilities and faded borders as opaque shades rather than translucent (see shade),
+                   which is quicker to display with thousands of icons
+    :param themeable: colour elements by class, with the palette in a style block, so the drawing can be
+                      given another palette by swapping the style block (see retheme_svg)
+    :param stream: write each base to the SVG as soon as it's drawn (see SVGStream), rather than building the
+                   whole drawing and writing it at the end, so memory doesn't grow with the number of bases.
+                   The file is the same either way
     :return:
     >>> bases, edges = process_input('tests/testinput.json')
     >>> colours = HEXES
@@ -999,59 +1449,212 @@ def draw_bases(bases, colours, icon_size=20, output='tests/bases.svg',
     Visiting LittleIsland
     Visiting MTFarm
     """
-    d = draw.Drawing(width, height)
-    d.append(draw.Rectangle(0,0,d.width,d.height,fill=colours[BG]))
-    visited = []
-
-    gb = draw.Group(id='bases')
-    unexplored_colour = colours[UNEXPLORED]
+    colours = palette_colours(colours) # so that themeable drawings can be given classes by what each colour is for
+    if stream:
+        def prepare(el):
+            # what would otherwise be done to the whole drawing before saving it
+            if themeable:
+                theme_classes(el)
+            if is_profiling():
+                count_drawing(el)
+        d = SVGStream(output, width, height, css=[palette_css(colours)] if themeable else (), prepare=prepare)
+    else:
+        d = draw.Drawing(width, height)
+    try:
+        d.append(draw.Rectangle(0,0,d.width,d.height,fill=colours[BG]))
+        visited = []
 
-    for b in bases:
-        if print_output:
-            print('Visiting', b)
-        arrow_size = icon_size
-        #print('\n', b, '*'*35)
-        bob = bases[b]
-        w, h, c, m = bob.box_dimensions(icon_size)
-        if not bob.is_drawn:
-            g = draw.Group(id=b)
-            bob.draw(g, icon_size, x=base_x, y=base_y,
-                     unexplored=unexplored_colour, border=colours[BASE], fill=colours[BASE_BG])
-            gb.append(g)
-            if print_output:
-                print(' '*TABSIZE + 'Drawing', b)
-            visited.append(b)
-
-        # then the neighbours
-        for connection_name in bob.connections:
-            if connection_name in bases:
-                dir = bob.connections[connection_name]
-                bases[b].draw_connection(gb, bases[connection_name],
-                                         unexplored=unexplored_colour, border=colours[BASE], fill=colours[BASE_BG],
-                                         print_output=print_output)
+        if stream:
+            gb = d.open_group(id='bases')
+        else:
+            gb = draw.Group(id='bases')
+        unexplored_colour = colours[UNEXPLORED]
+        batches = None
+        if batch_edges:
+            batches = {}
+        if opaque:
+            shade_table(colours.values(), colours[BASE_BG])
+
+        with phase('draw bases'):
+            for b in bases:
+                if print_output:
+                    print('Visiting', b)
+                arrow_size = icon_size
+                #print('\n', b, '*'*35)
+                bob = bases[b]
+                w, h, c, m = bob.box_dimensions(icon_size)
+                if not bob.is_drawn:
+                    g = draw.Group(id=b)
+                    bob.draw(g, icon_size, x=base_x, y=base_y,
+                             unexplored=unexplored_colour, border=colours[BASE], fill=colours[BASE_BG], merge_icons=merge_icons,
+                             opaque=opaque)
+                    gb.append(g)
+                    if print_output:
+                        print(' '*TABSIZE + 'Drawing', b)
+                    visited.append(b)
+
+                # then the neighbours
+                for connection_name in bob.connections:
+                    if connection_name in bases:
+                        dir = bob.connections[connection_name]
+                        bases[b].draw_connection(gb, bases[connection_name],
+                                                 unexplored=unexplored_colour, border=colours[BASE], fill=colours[BASE_BG],
+                                                 print_output=print_output, batches=batches, merge_icons=merge_icons,
+                                                 opaque=opaque)
+                    else:
+                        print('Warning: connected base not in bases', connection_name)
+
+        if batch_edges:
+            with phase('draw connections'):
+                ge = draw.Group(id='connections')
+                draw_connection_batches(ge, batches)
+                gb.append(ge)
+        if stream:
+            d.close_group()
+        else:
+            d.append(gb)
+        #d.append(draw.Use(gb, 0, 0))
+
+        with phase('draw outstanding'):
+            if CURR_INVENTORY in bases:
+                to_bring, to_take = verify_taking_numbers(bases)
+                out_bring = 'outstanding bring'
+                out_take = 'outstanding take'
+                bob = special_base(bases, out_bring, to_bring, USED_UP, SOUTH, compact=compact)
+                tob = special_base(bases, out_take, to_take, out_bring, SOUTH, compact=compact)
+                bases[USED_UP].draw_connection(d, bob, unexplored=colours[TAKE], border=colours[TAKE], fill=colours[BASE_BG],
+                                               opaque=opaque)
+                bases[out_bring].draw_connection(d, tob, unexplored=colours[BRING], border=colours[BRING], fill=colours[BASE_BG],
+                                                 opaque=opaque)
+
+        if add_legend:
+            with phase('legend'):
+                counts = count_features(bases)
+                draw_legend(d, colours, x=d.width-210, y=100, counts=counts, background_colour=colours[BG], opaque=opaque)
+
+        if themeable and not stream:
+            with phase('theme'):
+                theme_classes(d)
+                d.append_css(palette_css(colours))
+
+        if is_profiling() and not stream:
+            count_drawing(d)
+        with phase('save svg'):
+            if stream:
+                d.close()
+            else:
+                d.save_svg(output)
+    except BaseException:
+        if stream:
+            d.abort() # rather than leave half a drawing where the last one was
+        raise
+    if is_profiling():
+        count('svg bytes written', os.path.getsize(output))
+    if output_png:
+        with phase('save png'):
+            if stream:
+                svg_to_png(output, output.replace('.svg','.png'))
             else:
-                print('Warning: connected base not in bases', connection_name)
+                d.save_png(output.replace('.svg','.png'))
+        if is_profiling():
+            count('png bytes written', os.path.getsize(output.replace('.svg','.png')))
+
+
+def count_drawing(d):
+    """
+    Count the elements of a drawing, or of one element and what's in it, by kind (see profiling.count), e.g. paths emitted
+    """
+    kinds = {}
+    to_visit = list(d.elements) if isinstance(d, draw.Drawing) else [d]
+    while to_visit:
+        el = to_visit.pop()
+        to_visit.extend(getattr(el, 'children', ()))
+        kind = getattr(el, 'TAG_NAME', type(el).__name__)
+        kinds[kind] = kinds.get(kind, 0) + 1
+    for kind in sorted(kinds):
+        count(f'{kind} elements', kinds[kind])
+
 
-    d.append(gb)
-    #d.append(draw.Use(gb, 0, 0))
+THEME_FILL = 'fill-' # class prefixes, followed by the colour's name in the style file
+THEME_STROKE = 'stroke-'
+THEME_START = '/* palette */'
+THEME_END = '/* end palette */'
 
-    if CURR_INVENTORY in bases:
-        to_bring, to_take = verify_taking_numbers(bases)
-        out_bring = 'outstanding bring'
-        out_take = 'outstanding take'
-        bob = special_base(bases, out_bring, to_bring, USED_UP, SOUTH)
-        tob = special_base(bases, out_take, to_take, out_bring, SOUTH)
-        bases[USED_UP].draw_connection(d, bob, unexplored=colours[TAKE], border=colours[TAKE], fill=colours[BASE_BG])
-        bases[out_bring].draw_connection(d, tob, unexplored=colours[BRING], border=colours[BRING], fill=colours[BASE_BG])
 
-    if add_legend:
-        counts = count_features(bases)
-        draw_legend(d, colours, x=d.width-210, y=100, counts=counts)
+def theme_classes(d):
+    """
+    Replace every fill or stroke drawn in a palette colour (see PaletteColour) with a class named after what it is
+    for, i.e. the material, status or kind of connection (e.g. fill="#623e29" becomes class="fill-tinder"), so the
+    colours can come from a style block instead. Other colours (e.g. the black outlines in icons, or opaque shades)
+    are left as they are, even when they happen to be the same as a palette colour.
+    :param d: drawing object, or one element to replace the colours in along with everything in it
+    :return: number of colours replaced
+    >>> colours = {'outdoor': '#72aba7', 'stone': '#72aba7'}
+    >>> d = draw.Drawing(20, 20)
+    >>> d.append(draw.Rectangle(0, 0, 20, 20, fill=palette_colour(colours, 'outdoor'), stroke=palette_colour(HEXES, TAKE)))
+    >>> d.append(draw.Rectangle(0, 0, 20, 20, fill=palette_colour(colours, 'stone')))
+    >>> d.append(draw.Rectangle(0, 0, 20, 20, fill='#72aba7'))
+    >>> theme_classes(d)
+    3
+    >>> [el.args.get('class', el.args.get('fill')) for el in d.elements]
+    ['fill-outdoor stroke-take', 'fill-stone', '#72aba7']
+    """
+    replaced = 0
+    to_visit = list(d.elements) if isinstance(d, draw.Drawing) else [d]
+    while to_visit:
+        el = to_visit.pop()
+        to_visit.extend(getattr(el, 'children', ()))
+        args = getattr(el, 'args', None)
+        if not args:
+            continue
+        classes = []
+        for attr, prefix in (('fill', THEME_FILL), ('stroke', THEME_STROKE)):
+            if isinstance(args.get(attr), PaletteColour):
+                classes.append(prefix + args.pop(attr).key)
+        if classes:
+            if 'class' in args:
+                classes.insert(0, args['class'])
+            args['class'] = ' '.join(classes)
+            replaced += len(classes)
+    return replaced
+
+
+def palette_css(colours):
+    """
+    Style block giving the colours of a palette to the classes from theme_classes
+    >>> palette_css({'take': '#ff0000', 'path': '#00ff00'})
+    '/* palette */.fill-take{fill:#ff0000}.stroke-take{stroke:#ff0000}.fill-path{fill:#00ff00}.stroke-path{stroke:#00ff00}/* end palette */'
+    """
+    rules = [f'.{THEME_FILL}{k}{{fill:{colours[k]}}}.{THEME_STROKE}{k}{{stroke:{colours[k]}}}' for k in colours]
+    return THEME_START + ''.join(rules) + THEME_END
 
 
-    d.save_svg(output)
-    if output_png:
-        d.save_png(output.replace('.svg','.png'))
+def retheme_svg(svg_file, style_file, output=None):
+    """
+    Give a drawing made with draw_bases(..., themeable=True) the colours of another style file,
+    by swapping its palette style block; nothing is redrawn
+    :param svg_file: themeable SVG filepath
+    :param style_file: style JSON filepath, see parse_styling
+    :param output: SVG filepath to write to, by default svg_file with the style file's name added
+    :return: output filepath
+    >>> bases, colours = process_input('tests/testinput.json')
+    >>> draw_bases(bases, colours, add_legend=False, output='tests/themeable.svg', output_png=False, themeable=True)
+    >>> retheme_svg('tests/themeable.svg', 'hicontraststyling.json')
+    'tests/themeable_hicontraststyling.svg'
+    >>> with open('tests/themeable_hicontraststyling.svg') as f:
+    ...     palette_css(cached_colours('hicontraststyling.json')) in f.read()
+    True
+    """
+    if output is None:
+        output = svg_file.replace('.svg', '_' + os.path.basename(style_file).replace('.json', '.svg'))
+    with open(svg_file, 'r') as f:
+        svg = f.read()
+    start = svg.find(THEME_START)
+    end = svg.find(THEME_END, start)
+    assert start >= 0 and end >= 0, f'{svg_file} has no palette to replace, draw it with themeable=True'
+    with open(output, 'w') as f:
+        f.write(svg[:start] + palette_css(cached_colours(style_file)) + svg[end + len(THEME_END):])
+    return output
 
 
 def draw_region(region, source_info, output='tests/', print_output=False, add_legend=False):
@@ -1125,17 +1728,18 @@ def count_features(bases, statuses_to_count=(ACTUAL, REMOVE, FIND)):
     >>> nums = count_features(bases)
     >>> [nums['forge'], nums['milling'], nums['radio'], nums['trader'], nums['salt'], nums['range'], nums['woodworking']] # fixed for any given sandbox
     [4, 2, 10, 1, 14, 7, 4]
+    >>> nums['stick'] # each cell counts once, quantities such as stick:20 included
+    2
+    >>> compacted, colours = process_input('mybases.json', compact=True)
+    >>> count_features(compacted) == nums
+    True
+    >>> count_features(dict(bases)) == nums # without the running totals of a BaseWorld
+    True
     """
-    count = {}
-    for a in ASSETS:
-        count[a] = 0
-
-    for b in bases:
-        for row in bases[b].features:
-            for feature in row:
-                if feature.status in statuses_to_count or feature.material in statuses_to_count:
-                    count[feature.name] += feature.probability
-    return count
+    counter = feature_counter(bases)
+    counts, guessed = counter.counts(statuses_to_count), counter.guessed(statuses_to_count)
+    # like summing the probabilities themselves: floats where any was given in the input (e.g. forge/0.5), else ints
+    return {a: float(counts[i]) if guessed[i] else as_count(counts[i]) for i, a in enumerate(ASSET_KEYS)}
 
 
 def verify_fixed_numbers(bases, nums):
@@ -1154,15 +1758,27 @@ def verify_fixed_numbers(bases, nums):
     False
     """
     all_matching = True
-    round_to = 2
-    for i in ICONS:
-        if type(i.fixednum) == float:
-            if round(i.fixednum,round_to) != round(nums[i.key],round_to):
-                all_matching = False
-                print('Warning: expecting', i.fixednum, 'many', i.key, 'found', nums[i.key], 'instead')
+    for a, expected, found in fixed_number_mismatches(nums):
+        all_matching = False
+        print('Warning: expecting', expected, 'many', a, 'found', found, 'instead')
     return all_matching
 
 
+def fixed_number_mismatches(nums, round_to=2):
+    """
+    Assets whose count differs from the number every sandbox has (FIXEDNUM in the legend)
+    :param nums: dictionary of counts, as from count_features
+    :return: list of (asset name, expected count, count found)
+    >>> bases, colours = process_input('mybases.json')
+    >>> fixed_number_mismatches(count_features(bases))
+    [('maglens', 3.0, 2), ('skillet', 14.0, 15), ('prybar', 15.0, 20), ('stim', 11.0, 12)]
+    """
+    found = np.array([nums[a] for a in ASSET_KEYS], dtype=float)
+    fixed = fixed_numbers()
+    wrong = ~np.isnan(fixed) & (np.round(fixed, round_to) != np.round(found, round_to))
+    return [(ASSET_KEYS[i], float(fixed[i]), nums[ASSET_KEYS[i]]) for i in np.flatnonzero(wrong)]
+
+
 def verify_taking_numbers(bases):
     """
     Verify that for each feature, the number of items flagged as to-take equals the number of items flagged as to-bring.
@@ -1173,31 +1789,156 @@ def verify_taking_numbers(bases):
     >>> len(b) == 0
     True
     """
-    to_take = count_features(bases, statuses_to_count=[TAKE])
-    to_bring = count_features(bases, statuses_to_count=[BRING])
-    issues_found = False
+    counter = feature_counter(bases)
+    diffs = counter.counts([BRING]) - counter.counts([TAKE])
+    diffs[ASSET_IDS[EMPTY]] = 0
     unknown_take = []
     unknown_bring = []
-    for a in to_bring:
-        if to_bring[a] != to_take[a]:
-            if a != EMPTY:
-                if not issues_found:
-                    issues_found = True
-                diff = to_bring[a] - to_take[a]
-
-                posn = '+'
-                if diff > 0:
-                    posn = '-'
-
-                to_add = ','.join(abs(math.ceil(round(diff,3))) * [posn + a])
-                if diff > 0:
-                    unknown_take += [to_add]
-                else:
-                    unknown_bring += [to_add]
+    for i in np.flatnonzero(diffs):
+        a = ASSET_KEYS[i]
+        diff = float(diffs[i])
+
+        posn = '+'
+        if diff > 0:
+            posn = '-'
+
+        to_add = ','.join(abs(math.ceil(round(diff,3))) * [posn + a])
+        if diff > 0:
+            unknown_take += [to_add]
+        else:
+            unknown_bring += [to_add]
 
     return unknown_take, unknown_bring
 
 
+def check_issue(check, level, message, base=''):
+    return {'check': check, 'level': level, 'base': base, 'message': message}
+
+
+def check_save(filename='bases.json'):
+    """
+    Run every integrity check on a save without drawing it (or importing anything needed to draw it).
+    Problems that would stop the map from being drawn are errors; the rest are warnings.
+    :param filename: input JSON filepath
+    :return: list of issues, each a dictionary with check, level (CHECK_ERROR or CHECK_WARNING), base and message
+    >>> issues = check_save('mybases.json')
+    >>> sorted(set((i['check'], i['level']) for i in issues))
+    [('balance', 'warning'), ('corner', 'warning'), ('duplicate-edge', 'warning'), ('fixed-number', 'warning')]
+    >>> [i['message'] for i in issues if i['check'] == 'duplicate-edge']
+    ['LangstonMine and MinersFootpath connected more than once']
+    >>> [i['message'] for i in check_save('loottable4.json') if i['check'] == 'balance']
+    ['nothing to take for transmitter (6 more brought than taken)', 'nothing to take for climb (1 more brought than taken)']
+    >>> b, e = parse_input('tests/testinput.json')
+    >>> b['Quonset'][FEATURES][1] += ',hamer,stick:abc'
+    >>> b['Harris'][LOADING], b['Harris'][CABINFEVERRISK] = True, False
+    >>> e += [['Quonset', 'up', 'top,left', 'Misanthrope', 'bottom,left', 'path'], ['Quonset', 'north', 'top,left', 'Nowhere', 'bottom,left', 'path']]
+    >>> with open('tests/broken.json', 'w') as f:
+    ...     json.dump({BASES: b, CONNECTIONS: e}, f)
+    >>> for i in check_save('tests/broken.json'):
+    ...     if i['check'] not in ('fixed-number', 'balance'):
+    ...         print(i['level'], i['check'], i['base'], i['message'])
+    error unknown-asset Quonset unknown keyword hamer
+    error bad-number Quonset can not read the number in stick:abc
+    error cabin-fever Harris has a loading screen but no cabin fever risk
+    error bad-edge  can not read connection ['Quonset', 'up', 'top,left', 'Misanthrope', 'bottom,left', 'path']: AssertionError('up')
+    warning dangling-edge Quonset connected base Nowhere not in bases
+    """
+    issues = []
+    raw_bases, edges = parse_input(filename)
+    flat = {}
+    for b in raw_bases:
+        if b.startswith(COMMENT):
+            flat.update(raw_bases[b])
+        else:
+            flat[b] = raw_bases[b]
+
+    # the features and settings of each base
+    bases = BaseWorld()
+    for b in flat:
+        data = flat[b]
+        missing = [k for k in (REGION, CUSTOMIZABLE, LOADING, INDOORS, EXPLORED, CABINFEVERRISK, FEATURES) if k not in data]
+        if missing:
+            issues.append(check_issue('missing-field', CHECK_ERROR, 'missing ' + ', '.join(missing), b))
+            continue
+        broken = False
+        if data[LOADING] and not data[CABINFEVERRISK]:
+            issues.append(check_issue('cabin-fever', CHECK_ERROR, 'has a loading screen but no cabin fever risk', b))
+            broken = True
+        if data[FEATURES] != '' and data[FEATURES] != ['']:
+            for row in data[FEATURES]:
+                for token in row.split(','):
+                    try:
+                        intern_feature(token.strip())
+                    except ValueError:
+                        issues.append(check_issue('bad-number', CHECK_ERROR, f'can not read the number in {token.strip()}', b))
+                        broken = True
+                    except AssertionError as e:
+                        if 'movable' in str(e):
+                            issues.append(check_issue('not-movable', CHECK_ERROR, str(e), b))
+                        else:
+                            issues.append(check_issue('unknown-asset', CHECK_ERROR, f'unknown keyword {token.strip()}', b))
+                        broken = True
+        if not broken:
+            bases[b] = BaseLocation(b, data)
+        for sink in data.get(CONNECTIONS, {}).values():
+            if sink not in flat:
+                issues.append(check_issue('dangling-edge', CHECK_WARNING, f'connected base {sink} not in bases', b))
+
+    # the connections between them
+    seen = set()
+    for e in edges:
+        if type(e) == str:
+            continue
+        try:
+            cob = BaseConnection(*e[:6])
+        except (TypeError, AssertionError, KeyError) as err:
+            issues.append(check_issue('bad-edge', CHECK_ERROR, f'can not read connection {e}: {err!r}'))
+            continue
+        for name in cob.vertices:
+            if name not in flat:
+                issues.append(check_issue('dangling-edge', CHECK_WARNING, f'connected base {name} not in bases', cob.source))
+        key = EdgeIndex.key(cob.source, cob.sink)
+        if key in seen:
+            issues.append(check_issue('duplicate-edge', CHECK_WARNING, f'{key[0]} and {key[1]} connected more than once', cob.source))
+        seen.add(key)
+        source_options, sink_options = CORNER_OPTIONS[cob.direction]
+        if cob.corners[cob.source] not in [parse_corner(c) for c in source_options] or \
+                cob.corners[cob.sink] not in [parse_corner(c) for c in sink_options]:
+            issues.append(check_issue('corner', CHECK_WARNING,
+                                      f'{cob.source} to {cob.sink} goes {cob.direction} from {cob.source_corner} to {cob.sink_corner}',
+                                      cob.source))
+
+    # the island as a whole
+    for a, expected, found in fixed_number_mismatches(count_features(bases)):
+        issues.append(check_issue('fixed-number', CHECK_WARNING, f'expecting {expected:g} {a}, found {found}'))
+    unknown_take, unknown_bring = verify_taking_numbers(bases)
+    # each is the markers missing to balance it, e.g. '-stick,-stick' for two sticks brought but not taken
+    for t in unknown_take:
+        if t: # less than one item missing, from probabilities
+            missing = t.split(',')
+            issues.append(check_issue('balance', CHECK_WARNING,
+                                      f'nothing to take for {missing[0][1:]} ({len(missing)} more brought than taken)'))
+    for t in unknown_bring:
+        if t:
+            missing = t.split(',')
+            issues.append(check_issue('balance', CHECK_WARNING,
+                                      f'nowhere to bring {missing[0][1:]} ({len(missing)} more taken than brought)'))
+    return issues
+
+
+def print_issues(issues):
+    """
+    >>> print_issues([check_issue('cabin-fever', CHECK_ERROR, 'has a loading screen but no cabin fever risk', 'Quonset')])
+    error    cabin-fever     Quonset: has a loading screen but no cabin fever risk
+    1 errors, 0 warnings
+    """
+    for i in issues:
+        where = i['base'] + ': ' if i['base'] else ''
+        print(f"{i['level']:<8} {i['check']:<15} {where}{i['message']}")
+    errors = len([i for i in issues if i['level'] == CHECK_ERROR])
+    print(errors, 'errors,', len(issues) - errors, 'warnings')
+
+
 def convert_edge_info(bases):
     """
     Convert edge information formatting for JSON
@@ -1232,10 +1973,12 @@ def convert_edge_info(bases):
 
 
 
-def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_colour='purple', counts=False, background_colour='white'):
+def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_colour='purple', counts=False, background_colour='white',
+                opaque=False):
     """
     Draw a legend
     :param d: drawing object
+    :param opaque: draw the translucent examples as opaque shades over background_colour (see shade)
     :return: y position of the bottom of the legend
     >>> d = draw.Drawing(200, (36+12)*25)
     >>> d.append(draw.Rectangle(0, 0, d.width, d.height, fill='white'))
@@ -1260,7 +2003,7 @@ def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_col
                        x=icon_x, y=icon_y + cell_size / 2,
                        fill=legend_colour, stroke=legend_colour))
     for i, a in enumerate(ORDERING):
-        filepath = 'assets/' + ASSETS[a]
+        filepath = ASSET_PATHS[a]
 
         to_draw = True
         if counts: # don't draw if there are none in the data
@@ -1285,8 +2028,12 @@ def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_col
 
     icon_y += cell_size
     text_y += cell_size
-    import_svg(d, 'assets/bear.svg', x=icon_x, y=icon_y, wid=icon_size,
-               hei=icon_size, fill=legend_colour, opacity=0.5)
+    if opaque:
+        import_svg(d, 'assets/bear.svg', x=icon_x, y=icon_y, wid=icon_size,
+                   hei=icon_size, fill=legend_colour, recolour=lambda c: shade(c, 0.5, background_colour))
+    else:
+        import_svg(d, 'assets/bear.svg', x=icon_x, y=icon_y, wid=icon_size,
+                   hei=icon_size, fill=legend_colour, opacity=0.5)
     pb = 'opacity indicates probability (0.5 -> 50%)'
     d.append(draw.Text(pb, legend_font_size, font_family=FONTFAM,
                        x=icon_x + cell_size, y=text_y,
@@ -1322,7 +2069,10 @@ def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_col
 
     icon_y += cell_size
     text_y += cell_size
-    d.append(draw.Rectangle(fill='none', stroke=colours[BASE], x=icon_x, y=icon_y, width=icon_size, height=icon_size, opacity=OUTDOOR_OPACITY))
+    faded_stroke, faded = colours[BASE], {'opacity': OUTDOOR_OPACITY}
+    if opaque:
+        faded_stroke, faded = shade(colours[BASE], OUTDOOR_OPACITY, background_colour), {}
+    d.append(draw.Rectangle(fill='none', stroke=faded_stroke, x=icon_x, y=icon_y, width=icon_size, height=icon_size, **faded))
     d.append(draw.Text('non-customizable indoor location', legend_font_size, font_family=FONTFAM,
                        x=icon_x+cell_size, y=text_y,
                        fill=legend_colour))
@@ -1330,8 +2080,8 @@ def draw_legend(d, colours, x=0, y=0, icon_size=10, margin_ratio=1/8, legend_col
 
     icon_y += cell_size
     text_y += cell_size
-    d.append(draw.Rectangle(fill='none', stroke=colours[BASE], x=icon_x, y=icon_y, width=icon_size, height=icon_size,
-                            rx=icon_size/2.5, ry=icon_size/2.5, opacity=OUTDOOR_OPACITY))
+    d.append(draw.Rectangle(fill='none', stroke=faded_stroke, x=icon_x, y=icon_y, width=icon_size, height=icon_size,
+                            rx=icon_size/2.5, ry=icon_size/2.5, **faded))
     d.append(draw.Text('outdoors (cannot cure hides)', legend_font_size, font_family=FONTFAM,
                        x=icon_x+cell_size, y=text_y,
                        fill=legend_colour))
@@ -1434,10 +2184,10 @@ def legends_for_documentation(icon_wid=50):
     theme_n = list(set(theme_n))
 
 
-def special_base(bases, name, features, connec_name, connec_dir):
+def special_base(bases, name, features, connec_name, connec_dir, compact=False):
     tob = BaseLocation(name,
                        {REGION: 'notingame', CUSTOMIZABLE: False, LOADING: False, INDOORS: False, FEATURES: features,
-                        EXPLORED: False, CABINFEVERRISK: False}, colours=HEXES)
+                        EXPLORED: False, CABINFEVERRISK: False}, colours=HEXES, compact=compact)
     conn = BaseConnection(connec_name, connec_dir, 'bottom,left', name, 'top,left', 'todo')
     bases[connec_name].add_connection(conn)
     tob.add_connection(conn)
@@ -1445,8 +2195,56 @@ def special_base(bases, name, features, connec_name, connec_dir):
     return tob
 
 
+def print_query(bases, text):
+    """
+    Print where the features matching a query are, one line per base, or what is wrong with the query
+    :param bases: BaseWorld, as returned by process_input
+    :param text: query, see FeatureIndex.query
+    :return: list of issues with the query, as for check_save
+    >>> bases, colours = process_input('tests/testinput.json')
+    >>> print_query(bases, 'quality take|destroy')
+    Quonset: row 9 column 0, row 9 column 1, row 9 column 2, row 9 column 3, row 9 column 4
+    5 found
+    []
+    >>> issues = print_query(bases, 'hammer colour=red')
+    error    query           unknown field colour in colour=red, expecting one of name, status, material, note
+    1 errors, 0 warnings
+    """
+    try:
+        found = bases.index.query(text)
+    except ValueError as e:
+        issues = [check_issue('query', CHECK_ERROR, str(e))]
+        print_issues(issues)
+        return issues
+    by_base = {}
+    for b, r, c in found:
+        by_base.setdefault(b, []).append(f'row {r} column {c}')
+    for b in by_base:
+        print(b + ':', ', '.join(by_base[b]))
+    print(len(found), 'found')
+    return []
+
+
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
+    import doctest
+    if len(sys.argv) > 2 and sys.argv[1] == 'query':
+        bases, colours = process_input(sys.argv[2])
+        if print_query(bases, ' '.join(sys.argv[3:])):
+            sys.exit(1)
+    elif len(sys.argv) > 2 and sys.argv[1] == 'check':
+        issues = check_save(sys.argv[2])
+        errors = [i for i in issues if i['level'] == CHECK_ERROR]
+        if '--json' in sys.argv[3:]:
+            print(json.dumps({'file': sys.argv[2], 'errors': len(errors), 'warnings': len(issues) - len(errors),
+                              'issues': issues}, indent=1))
+        else:
+            print_issues(issues)
+        if errors or (issues and '--strict' in sys.argv[3:]):
+            sys.exit(1)
+    elif len(sys.argv) > 3 and sys.argv[1] == 'retheme':
+        output = sys.argv[4] if len(sys.argv) > 4 else None
+        print('Wrote', retheme_svg(sys.argv[2], sys.argv[3], output))
+    elif len(sys.argv) > 1:
         fname = sys.argv[1]
         print('Drawing', fname)
         if fname.endswith('.json'):
@@ -1463,15 +2261,59 @@ if __name__ == '__main__':
                 style_file = sys.argv[i+1]
                 assert style_file.endswith('.json'), f'style file {style_file} should end with .json'
 
-            bases, colours = process_input(fname, style_file=style_file)
-
-            draw_bases(bases, colours, output=outfile,
-                       width=2800, height=1800, base_x=2200, base_y=20,
-                       output_png=False, print_output=to_print)
+            batch_edges = len(sys.argv) > 2 and '-b' in sys.argv[2:]
+            merge_icons = len(sys.argv) > 2 and '-m' in sys.argv[2:]
+            compact = len(sys.argv) > 2 and '-q' in sys.argv[2:]
+            opaque = len(sys.argv) > 2 and '-o' in sys.argv[2:]
+            themeable = len(sys.argv) > 2 and '-c' in sys.argv[2:]
+            stream = '--stream' in sys.argv[2:]
+            pstats_file = None
+            if '--pstats' in sys.argv[2:]:
+                pstats_file = sys.argv[sys.argv.index('--pstats') + 1]
+            memory = '--memory' in sys.argv[2:]
+            memory_budget = None
+            if '--memory-budget' in sys.argv[2:]:
+                memory_budget = int(float(sys.argv[sys.argv.index('--memory-budget') + 1]) * MIB)
+            if '--profile' in sys.argv[2:] or pstats_file or memory or memory_budget:
+                start_profiling(pstats_file, memory, memory_budget)
+
+            over_budget = None
+            try:
+                bases, colours = process_input(fname, style_file=style_file, compact=compact)
+
+                draw_bases(bases, colours, output=outfile,
+                           width=2800, height=1800, base_x=2200, base_y=20,
+                           output_png=False, print_output=to_print, batch_edges=batch_edges,
+                           merge_icons=merge_icons, compact=compact, opaque=opaque, themeable=themeable,
+                           stream=stream)
+            except MemoryBudgetExceeded as err:
+                over_budget = err
+
+            profiler = stop_profiling()
+            if profiler is not None:
+                print(profiler.table())
+                profiler.save_json(outfile.replace('.svg', '.profile.json'))
+                print('Wrote', outfile.replace('.svg', '.profile.json'), pstats_file or '')
+            if over_budget is not None:
+                print('Stopped:', over_budget)
+                sys.exit(1)
 
     else:
         doctest.testmod()
         print('To run: python3 TLDBaseViz.py mybases.json')
         print('Optional parameters to add after the input json filename:')
         print('\t-v \t\t verbose mode')
-        print('\t-s {filename} \t use alternate style file')
\ No newline at end of file
+        print('\t-s {filename} \t use alternate style file')
+        print('\t-b \t\t draw connections of the same kind as one path')
+        print('\t-m \t\t merge icons of the same colour in a base into one path')
+        print('\t-q \t\t draw runs of identical icons as one icon with a quantity')
+        print('\t-o \t\t draw probabilities as opaque shades instead of translucent icons')
+        print('\t-c \t\t colour by CSS classes, so the drawing can be rethemed')
+        print('\t--stream \t write each base to the SVG as it is drawn, to draw big saves in less memory')
+        print('\t--profile \t print the time taken by each phase and write it to mybases.profile.json')
+        print('\t--pstats {filename} \t also write cProfile stats, for python3 -m pstats')
+        print('\t--memory \t also trace the peak memory of each phase, and what holds the most (slow)')
+        print('\t--memory-budget {MiB} \t trace memory and stop with an error if a phase goes over this')
+        print('To find features: python3 TLDBaseViz.py query mybases.json hammer !take')
+        print('To check a save without drawing it: python3 TLDBaseViz.py check mybases.json [--json] [--strict]')
+        print('To recolour a drawing made with -c: python3 TLDBaseViz.py retheme mybases.svg hicontraststyling.json [out.svg]')
\ No newline at end of file
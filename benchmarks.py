@@ -0,0 +1,312 @@
+from synthetic import *
+import platform
+import statistics
+import subprocess
+import time
+
+BENCH_WORLDS = ('mybases.json', 'loottable4.json')
+BENCH_SIZES = (1000, 10000, 100000) # bases in each generated world
+BENCH_FOLDER = PALETTE_CACHE # generated worlds and drawings are kept out of the way with the palette cache
+DRAW_LIMIT = 1000 # bases. Drawing bigger worlds takes minutes, so they're only drawn when asked for
+MIN_RUNS = 3
+MAX_RUNS = 20
+MIN_TIME = 0.5 # seconds to spend on each benchmark, if MIN_RUNS runs take less than that
+REGRESSION_THRESHOLD = 0.1 # a benchmark this much slower (as a fraction of the old time) fails a comparison
+BENCH_SEED = 0
+WORLD_BENCHMARKS = ('process_input', 'parse_edges', 'count_features', 'draw_legend')
+DRAW_BENCHMARKS = ('draw_bases svg', 'draw_bases svg streamed', 'draw_bases svg+png')
+
+
+def world_file(n, folder=BENCH_FOLDER):
+    """
+    A generated world of n bases (see synthetic.generate_world), the same every time
+    :return: filepath of the world
+    >>> base_count(world_file(500, folder='tests')), base_count('mybases.json')
+    (500, 275)
+    """
+    os.makedirs(folder, exist_ok=True)
+    return write_world(n, os.path.join(folder, f'synthetic_{n}_{BENCH_SEED}.json'), BENCH_SEED)
+
+
+def base_count(fname):
+    bases, edges = parse_input(fname)
+    return sum(len(bases[b]) if b.startswith(COMMENT) else 1 for b in bases)
+
+
+def time_runs(run, setup=None, min_runs=MIN_RUNS, max_runs=MAX_RUNS, min_time=MIN_TIME):
+    """
+    Time a function over several runs
+    :param run: function to time, given whatever setup returns if there is a setup
+    :param setup: function run before each run, not timed, e.g. to make something that run uses up
+    :return: dictionary of the best and median time in seconds, and the number of runs
+    >>> t = time_runs(lambda x: sum(x), setup=lambda: range(1000), min_time=0)
+    >>> sorted(t), t['runs'], t['best'] <= t['median']
+    (['best', 'median', 'runs'], 3, True)
+    """
+    times = []
+    while len(times) < max_runs and (len(times) < min_runs or sum(times) < min_time):
+        if setup is None:
+            start = time.perf_counter()
+            run()
+        else:
+            args = setup()
+            start = time.perf_counter()
+            run(args)
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'median': statistics.median(times), 'runs': len(times)}
+
+
+def icon_benchmarks():
+    """
+    Benchmarks of reading icons and styles, which don't depend on the world. Every icon in the legend is imported
+    :return: dictionary of benchmark name : (setup, run), see time_runs
+    """
+    icons = sorted(set(ASSET_PATHS.values()))
+    paths = [p[0] for f in icons for p in load_svg(f)['paths']]
+    raw_colours = parse_styling(STYLE_FILE)[0]
+    def import_icons(args=None):
+        g = draw.Group()
+        for f in icons:
+            import_svg(g, f, wid=20, hei=20)
+    return {
+        'import_svg[icons]': (None, import_icons),
+        'import_svg uncached[icons]': (ICON_CACHE.clear, import_icons),
+        'separate_svg_path[icons]': (None, lambda: [separate_svg_path(p) for p in paths]),
+        f'parse_colours[{STYLE_FILE}]': (None, lambda: parse_colours(raw_colours)),
+    }
+
+
+def selected(name, only):
+    """
+    Whether a benchmark is to be run
+    :param name: benchmark name, with or without the [world]
+    :param only: list of benchmark names (without the [world]) to run, or None for all
+    >>> selected('draw_legend[mybases.json]', ['draw_legend']), selected('draw_legend', ['process_input'])
+    (True, False)
+    """
+    return only is None or name.split('[')[0] in only
+
+
+def world_benchmarks(fname, draw_world=True, only=None):
+    """
+    Benchmarks of loading, counting and drawing a world. The world is only loaded for the benchmarks that need it.
+    :param fname: input JSON filepath
+    :param draw_world: include the drawing benchmarks
+    :param only: if given, list of benchmark names (without the [world]) to include, see run_benchmarks
+    :return: dictionary of benchmark name : (setup, run), see time_runs
+    >>> world_benchmarks('no such world.json', only=['import_svg'])
+    {}
+    >>> list(world_benchmarks('mybases.json', draw_world=False, only=['count_features', 'draw_bases svg']))
+    ['count_features[mybases.json]']
+    """
+    wanted = [b for b in WORLD_BENCHMARKS + draw_world * DRAW_BENCHMARKS if selected(b, only)]
+    if not wanted:
+        return {}
+    world = os.path.basename(fname)
+    output = os.path.join(BENCH_FOLDER, 'bench.svg')
+    benches = {}
+    if 'process_input' in wanted:
+        benches[f'process_input[{world}]'] = (None, lambda: process_input(fname))
+    if {'parse_edges', 'count_features', 'draw_legend'} & set(wanted):
+        bases, colours = process_input(fname)
+    if 'parse_edges' in wanted:
+        bases_json, edges_json = parse_input(fname)
+        benches[f'parse_edges[{world}]'] = (None, lambda: parse_edges(edges_json, colours))
+    if 'count_features' in wanted:
+        benches[f'count_features[{world}]'] = (None, lambda: count_features(bases))
+    if 'draw_legend' in wanted:
+        counts = count_features(bases)
+        benches[f'draw_legend[{world}]'] = (lambda: draw.Drawing(2800, 1800),
+                                            lambda d: draw_legend(d, colours, x=d.width-210, y=100, counts=counts,
+                                                                  background_colour=colours[BG]))
+    if draw_world:
+        # drawing marks the bases as drawn, so each run needs them loaded afresh
+        benches[f'draw_bases svg[{world}]'] = (lambda: process_input(fname),
+                                               lambda bc: draw_bases(*bc, output=output, output_png=False,
+                                                                     width=2800, height=1800, base_x=2200, base_y=20))
+        benches[f'draw_bases svg streamed[{world}]'] = (lambda: process_input(fname),
+                                                        lambda bc: draw_bases(*bc, output=output, output_png=False,
+                                                                              stream=True, width=2800, height=1800,
+                                                                              base_x=2200, base_y=20))
+        benches[f'draw_bases svg+png[{world}]'] = (lambda: process_input(fname),
+                                                   lambda bc: draw_bases(*bc, output=output, output_png=True,
+                                                                         width=2800, height=1800, base_x=2200, base_y=20))
+    return {name: bench for name, bench in benches.items() if selected(name, only)}
+
+
+def run_benchmarks(worlds=BENCH_WORLDS, sizes=BENCH_SIZES, only=None, draw_limit=DRAW_LIMIT, min_time=MIN_TIME):
+    """
+    Time everything, printing each result as it comes
+    :param worlds: input JSON filepaths
+    :param sizes: numbers of bases of generated worlds
+    :param only: if given, list of benchmark names (without the [world]) to run, leaving out the rest
+    :param draw_limit: only draw worlds with up to this many bases
+    :return: dictionary of name[world] : dictionary of times (see time_runs), or of the error if it couldn't run
+    """
+    results = {}
+    results.update(run_selected(icon_benchmarks, only, min_time))
+    if any(selected(b, only) for b in WORLD_BENCHMARKS + DRAW_BENCHMARKS):
+        # one world at a time, and generated only when there is something to run on it
+        for world in list(worlds) + list(sizes):
+            results.update(run_selected(lambda: load_world_benchmarks(world, only, draw_limit), only, min_time))
+    return results
+
+
+def load_world_benchmarks(world, only, draw_limit=DRAW_LIMIT):
+    """
+    world_benchmarks of an input JSON filepath, or of a generated world of that many bases (see world_file)
+    """
+    fname = world if type(world) == str else world_file(world)
+    draw_world = any(selected(b, only) for b in DRAW_BENCHMARKS) and base_count(fname) <= draw_limit
+    return world_benchmarks(fname, draw_world=draw_world, only=only)
+
+
+def run_selected(benchmarks, only, min_time=MIN_TIME):
+    """
+    Time the selected benchmarks of one set, printing each result as it comes
+    :param benchmarks: function giving a dictionary of benchmark name : (setup, run), see time_runs
+    :param only: list of benchmark names (without the [world]) to run, or None for all
+    :return: dictionary of name[world] : dictionary of times (see time_runs), or of the error if it couldn't run
+    """
+    with open(os.devnull, 'w') as devnull:
+        # drawing prints warnings about connections, once per run
+        sys.stdout, stdout = devnull, sys.stdout
+        try:
+            benches = benchmarks()
+        finally:
+            sys.stdout = stdout
+
+    results = {}
+    for name, (setup, run) in benches.items():
+        if not selected(name, only):
+            continue
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout, stdout = devnull, sys.stdout
+            try:
+                results[name] = time_runs(run, setup, min_time=min_time)
+            except (ImportError, OSError) as err: # e.g. no cairo library for PNGs
+                results[name] = {'error': str(err).splitlines()[0]}
+            finally:
+                sys.stdout = stdout
+        print(result_line(name, results[name]))
+    return results
+
+
+def result_line(name, result):
+    if 'error' in result:
+        return f"{name:<50} {'skipped':>12}  {result['error']}"
+    return f"{name:<50} {result['best'] * 1000:>9.2f} ms  median {result['median'] * 1000:.2f} ms, {result['runs']} runs"
+
+
+def git_commit():
+    """
+    Short hash of the commit being benchmarked, marked +dirty if there are uncommitted changes
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit.stdout.strip() + ('+dirty' if status.stdout.strip() else '')
+
+
+def save_results(results, fname=None):
+    """
+    Write benchmark results as JSON, along with what they were run on
+    :param fname: filepath, by default benchmarks_<commit>.json
+    :return: filepath written
+    """
+    commit = git_commit()
+    if fname is None:
+        fname = f'benchmarks_{commit}.json'
+    report = {'commit': commit, 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+              'machine': platform.platform(), 'results': results}
+    with open(fname, 'w') as f:
+        json.dump(report, f, indent=1)
+    return fname
+
+
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare the best times of the benchmarks run in both reports
+    :param old: report as written by save_results, as a dictionary
+    :param new: likewise
+    :param threshold: fraction slower than before that counts as a regression
+    :return: list of (name, old seconds, new seconds, new/old), list of names of regressions
+    >>> old = {'results': {'a': {'best': 0.10}, 'b': {'best': 0.20}, 'c': {'error': 'no cairo'}}}
+    >>> new = {'results': {'a': {'best': 0.12}, 'b': {'best': 0.15}, 'c': {'best': 1.0}}}
+    >>> compare_results(old, new)
+    ([('a', 0.1, 0.12, 1.2), ('b', 0.2, 0.15, 0.75)], ['a'])
+    >>> compare_results(old, new, threshold=0.25)[1]
+    []
+    """
+    rows = []
+    regressions = []
+    for name in new['results']:
+        before = old['results'].get(name, {})
+        after = new['results'][name]
+        if 'best' in before and 'best' in after:
+            ratio = round(after['best'] / before['best'], 3)
+            rows.append((name, before['best'], after['best'], ratio))
+            if ratio > 1 + threshold:
+                regressions.append(name)
+    return rows, regressions
+
+
+def print_comparison(old, new, threshold=REGRESSION_THRESHOLD):
+    """
+    :return: True if nothing got slower by more than threshold
+    """
+    rows, regressions = compare_results(old, new, threshold)
+    print(f"{'benchmark':<50} {old['commit']:>14} {new['commit']:>14}  change")
+    for name, before, after, ratio in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f'{name:<50} {before * 1000:>11.2f} ms {after * 1000:>11.2f} ms  {ratio - 1:+.0%}{flag}')
+    if regressions:
+        print(len(regressions), f'benchmarks are more than {threshold:.0%} slower')
+    return not regressions
+
+
+if __name__ == '__main__':
+    import doctest
+    threshold = REGRESSION_THRESHOLD
+    if '--threshold' in sys.argv:
+        threshold = float(sys.argv[sys.argv.index('--threshold') + 1])
+    if len(sys.argv) > 3 and sys.argv[1] == 'compare':
+        with open(sys.argv[2], 'r') as f:
+            old = json.load(f)
+        with open(sys.argv[3], 'r') as f:
+            new = json.load(f)
+        if not print_comparison(old, new, threshold):
+            sys.exit(1)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'run':
+        sizes = BENCH_SIZES
+        if '--sizes' in sys.argv:
+            sizes = [int(n) for n in sys.argv[sys.argv.index('--sizes') + 1].split(',') if n]
+        only = None
+        if '--only' in sys.argv:
+            only = sys.argv[sys.argv.index('--only') + 1].split(',')
+        draw_limit = DRAW_LIMIT
+        if '--draw-limit' in sys.argv:
+            draw_limit = int(sys.argv[sys.argv.index('--draw-limit') + 1])
+        out = None
+        if '--out' in sys.argv:
+            out = sys.argv[sys.argv.index('--out') + 1]
+
+        results = run_benchmarks(sizes=sizes, only=only, draw_limit=draw_limit)
+        out = save_results(results, out)
+        print('Wrote', out)
+        if '--compare' in sys.argv:
+            with open(sys.argv[sys.argv.index('--compare') + 1], 'r') as f:
+                old = json.load(f)
+            with open(out, 'r') as f:
+                new = json.load(f)
+            if not print_comparison(old, new, threshold):
+                sys.exit(1)
+    else:
+        doctest.testmod()
+        print('To run: python3 benchmarks.py run [--sizes 1000,10000,100000] [--only process_input,draw_bases svg]')
+        print('                                  [--draw-limit 1000] [--out results.json] [--compare old.json]')
+        print('To compare two runs: python3 benchmarks.py compare old.json new.json [--threshold 0.1]')
+        print(f'Either fails (exit status 1) if a benchmark is more than the threshold ({REGRESSION_THRESHOLD:.0%}) slower')
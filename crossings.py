@@ -0,0 +1,224 @@
+from TLDBaseViz import *
+import copy
+import heapq
+
+
+def corner_point(bob, corner):
+    """
+    Position of one corner of a base's box, once the base has been drawn
+    :param bob: BaseLocation object
+    :param corner: list like ['top', 'left'], as stored in BaseConnection.corners
+    :return: (x, y)
+    """
+    if corner[CORN_Y] == BOTTOM:
+        y = bob.box_bottom
+    else:
+        y = bob.box_top
+    if corner[CORN_X] == LEFT:
+        x = bob.box_left
+    else:
+        x = bob.box_right
+    return x, y
+
+
+def edge_key(a, b):
+    return EdgeIndex.key(a, b)
+
+
+def edge_segments(bases):
+    """
+    Turn every drawn connection into a line segment between the corners of its two boxes.
+    :param bases: dictionary of BaseLocation objects that have been drawn (e.g. by draw_bases)
+    :return: dictionary of (base name, base name) : [(x1, y1), (x2, y2)], one entry per connection
+    >>> bases, colours = process_input('tests/testinput.json')
+    >>> draw_bases(bases, colours, add_legend=False, output='tests/crossings.svg', output_png=False)
+    >>> segs = edge_segments(bases)
+    >>> len(segs)
+    19
+    >>> segs[('BrokenBridge', 'Hibernia')]
+    [(621.25, 593.75), (621.25, 573.75)]
+    """
+    segments = {}
+    for b in bases:
+        bob = bases[b]
+        for sink in bob.edges:
+            if sink not in bases or not bob.is_drawn or not bases[sink].is_drawn:
+                continue
+            key = edge_key(b, sink)
+            if key in segments:
+                continue
+            cob = bob.edges[sink]
+            segments[key] = [corner_point(bob, cob.corners[b]), corner_point(bases[sink], cob.corners[sink])]
+    return segments
+
+
+def orientation(p, q, r):
+    val = (q[0] - p[0]) * (r[1] - p[1]) - (q[1] - p[1]) * (r[0] - p[0])
+    if val > 0:
+        return 1
+    if val < 0:
+        return -1
+    return 0
+
+
+def segments_cross(s, t):
+    """
+    Whether two segments properly cross. Touching at an end point (e.g. two connections sharing
+    the corner of a box) or running along each other does not count as a crossing.
+    :param s: [(x1, y1), (x2, y2)]
+    :param t: [(x1, y1), (x2, y2)]
+    :return: boolean
+    >>> segments_cross([(0, 0), (10, 10)], [(0, 10), (10, 0)])
+    True
+    >>> segments_cross([(0, 0), (10, 10)], [(10, 10), (20, 0)])
+    False
+    >>> segments_cross([(0, 0), (0, 10)], [(0, 5), (0, 20)])
+    False
+    >>> segments_cross([(0, 0), (10, 0)], [(5, -5), (5, 0)])
+    False
+    """
+    o1 = orientation(s[0], s[1], t[0])
+    o2 = orientation(s[0], s[1], t[1])
+    o3 = orientation(t[0], t[1], s[0])
+    o4 = orientation(t[0], t[1], s[1])
+    return o1 * o2 < 0 and o3 * o4 < 0
+
+
+def find_crossings(segments):
+    """
+    Find every pair of crossing segments by sweeping a vertical line from left to right. Segments
+    are only compared while both are under the sweep line and their vertical extents overlap,
+    so connections on opposite sides of the map are never tested against each other.
+    :param segments: dictionary of key : [(x1, y1), (x2, y2)], e.g. from edge_segments
+    :return: list of (key, key) pairs that cross
+    >>> find_crossings({'a': [(0, 0), (10, 10)], 'b': [(0, 10), (10, 0)], 'c': [(20, 0), (30, 10)]})
+    [('a', 'b')]
+    >>> find_crossings({'a': [(0, 0), (0, 10)], 'b': [(-5, 5), (5, 5)], 'c': [(-5, 8), (5, 8)], 'd': [(1, 0), (1, 10)]})
+    [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'd')]
+    >>> find_crossings({})
+    []
+    """
+    events = []
+    for key in segments:
+        (x1, y1), (x2, y2) = segments[key]
+        events.append((min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2), key))
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    crossings = []
+    active = {}  # key: (max x, min y, max y)
+    leaving = []  # heap of (max x, order, key) to retire segments the sweep line has passed
+    for order, (low_x, high_x, low_y, high_y, key) in enumerate(events):
+        while leaving and leaving[0][0] < low_x:
+            del active[heapq.heappop(leaving)[2]]
+        for other in active:
+            other_high_x, other_low_y, other_high_y = active[other]
+            if other_low_y <= high_y and low_y <= other_high_y:
+                if segments_cross(segments[key], segments[other]):
+                    crossings.append(tuple(sorted([key, other])))
+        active[key] = (high_x, low_y, high_y)
+        heapq.heappush(leaving, (high_x, order, key))
+    return sorted(crossings)
+
+
+def count_crossings_with(segment, segments, skip):
+    n = 0
+    low_x, high_x = min(segment[0][0], segment[1][0]), max(segment[0][0], segment[1][0])
+    low_y, high_y = min(segment[0][1], segment[1][1]), max(segment[0][1], segment[1][1])
+    for key in segments:
+        if key == skip:
+            continue
+        (x1, y1), (x2, y2) = segments[key]
+        if max(x1, x2) < low_x or min(x1, x2) > high_x or max(y1, y2) < low_y or min(y1, y2) > high_y:
+            continue
+        if segments_cross(segment, segments[key]):
+            n += 1
+    return n
+
+
+def optimize_corners(bases, edges, rounds=3, include_tree_edges=False, print_output=False):
+    """
+    Greedily choose the source and sink corners of each connection to reduce the number of crossings
+    in the current layout. Connections that were used to place a base next to its neighbour are left
+    alone unless include_tree_edges is set, since changing their corners moves the neighbour as well.
+    :param bases: dictionary of BaseLocation objects that have been drawn (e.g. by draw_bases)
+    :param edges: list of connections, as loaded from the JSON by parse_input
+    :param rounds: maximum number of passes over all connections
+    :return: copy of edges with the chosen corners filled in
+    >>> bases, colours = process_input('mybases.json')
+    >>> b, e = parse_input('mybases.json')
+    >>> draw_bases(bases, colours, add_legend=False, output='tests/crossings.svg', output_png=False,
+    ...            width=2800, height=1800, base_x=2200, base_y=20)
+    >>> optimized = optimize_corners(bases, e, print_output=True)
+    Crossings: 4 -> 1
+    >>> len([c for c, d in zip(optimized, e) if c != d])
+    3
+    >>> len(optimized) == len(e)
+    True
+    """
+    segments = edge_segments(bases)
+    before = len(find_crossings(segments))
+
+    chosen = {}
+    for rnd in range(rounds):
+        changed = False
+        for key in segments:
+            a, b = key
+            cob = bases[a].edges[b]
+            if not include_tree_edges and (bases[a].placed_by == b or bases[b].placed_by == a):
+                continue
+            source_options, sink_options = CORNER_OPTIONS[cob.direction]
+            options = [(cob.source_corner, cob.sink_corner)]
+            options += [(sc, tc) for sc in source_options for tc in sink_options]
+            if key in chosen:
+                options.insert(0, chosen[key])
+
+            best = None
+            best_n = BIGNUM
+            for source_corner, sink_corner in options:
+                seg = [corner_point(bases[cob.source], source_corner.replace(' ', '').split(',')),
+                       corner_point(bases[cob.sink], sink_corner.replace(' ', '').split(','))]
+                n = count_crossings_with(seg, segments, key)
+                if n < best_n:
+                    best, best_n, best_seg = (source_corner, sink_corner), n, seg
+            if best != chosen.get(key, options[0]):
+                changed = True
+            chosen[key] = best
+            segments[key] = best_seg
+        if not changed:
+            break
+
+    if print_output:
+        print('Crossings:', before, '->', len(find_crossings(segments)))
+
+    optimized = copy.deepcopy(edges)
+    for e in optimized:
+        if type(e) != str:
+            key = edge_key(e[0], e[3])
+            if key in chosen:
+                source_corner, sink_corner = chosen[key]
+                if e[0] != key[0]:
+                    source_corner, sink_corner = sink_corner, source_corner
+                e[2], e[4] = source_corner, sink_corner
+    return optimized
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+        bases, colours = process_input(fname)
+        b, edges = parse_input(fname)
+        # placing the bases needs a drawing; kept apart from the user's own render of the same input
+        draw_bases(bases, colours, output=fname.replace('.json', '_crossings.svg'),
+                   width=2800, height=1800, base_x=2200, base_y=20,
+                   add_legend=False, output_png=False)
+        optimized = optimize_corners(bases, edges, print_output=True)
+        for e in optimized:
+            if type(e) == str:
+                print(f'"{e}",')
+            else:
+                print('[' + ', '.join(f'"{x}"' for x in e) + '],')
+    else:
+        doctest.testmod()
+        print('To run: python3 crossings.py mybases.json')
+        print('Draws mybases_crossings.svg (without a legend) and prints the optimized edges')
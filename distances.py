@@ -0,0 +1,253 @@
+from TLDBaseViz import *
+import numpy as np
+import copy
+import hashlib
+import heapq
+
+ONEWAY = 'oneway'
+# cost of travelling along a connection of each kind, for kinds not listed it's DEFAULT_WEIGHT
+# a weight of None means the connection can't be travelled at all
+KIND_WEIGHTS = {}
+DEFAULT_WEIGHT = 1
+# above this many bases, repeated Dijkstra is used instead of Floyd-Warshall, since connection graphs are sparse
+# (on loottable4.json's connections Dijkstra catches up at around 150 bases)
+FLOYD_LIMIT = 150
+
+DISTANCE_CACHE = {} # sha256 of names, steps and method : TravelDistances, most recently used last
+DISTANCE_CACHE_LIMIT = 4 # worlds to keep the distances of, e.g. while watching a save for changes
+
+
+def travel_edges(edges, weights=None):
+    """
+    Steps that can be travelled along the connections, going both ways except for one-way connections,
+    which only go from the source base to the sink base.
+    :param edges: list of connections, as loaded from the JSON by parse_input
+    :param weights: dictionary of connection kind : cost, overriding KIND_WEIGHTS
+    :return: list of (from base name, to base name, cost)
+    >>> travel_edges([["A", "south", "bottom,left", "B", "top,left", "path"], "comment",
+    ...               ["B", "east", "top,right", "C", "top,left", "oneway"]], {'path': 2})
+    [('A', 'B', 2), ('B', 'A', 2), ('B', 'C', 1)]
+    """
+    kind_weights = dict(KIND_WEIGHTS)
+    if weights:
+        kind_weights.update(weights)
+    steps = []
+    for e in edges:
+        if type(e) != str:
+            cob = BaseConnection(*e[:6])
+            cost = kind_weights.get(cob.kind, DEFAULT_WEIGHT)
+            if cost is None:
+                continue
+            steps.append((cob.source, cob.sink, cost))
+            if cob.kind != ONEWAY:
+                steps.append((cob.sink, cob.source, cost))
+    return steps
+
+
+def floyd_warshall(dist):
+    """
+    All-pairs shortest paths, one numpy operation per intermediate base
+    :param dist: n x n array of direct costs, inf where there is no connection and 0 on the diagonal
+    :return: array of shortest distances, array of the next base to go to on each shortest path (-1 if unreachable)
+    >>> inf = float('inf')
+    >>> d, nxt = floyd_warshall(np.array([[0, 1, inf], [1, 0, 5], [inf, inf, 0]]))
+    >>> d.tolist(), nxt.tolist()
+    ([[0.0, 1.0, 6.0], [1.0, 0.0, 5.0], [inf, inf, 0.0]], [[0, 1, 1], [0, 1, 2], [-1, -1, 2]])
+    """
+    dist = np.array(dist, dtype=float)
+    n = len(dist)
+    nxt = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)
+    for k in range(n):
+        via = dist[:, k, None] + dist[None, k, :]
+        better = via < dist
+        dist = np.where(better, via, dist)
+        nxt = np.where(better, nxt[:, k, None], nxt)
+    return dist, nxt
+
+
+def dijkstra(adjacency, source, n):
+    """
+    Shortest paths from one base, with a binary heap
+    :param adjacency: list, for each base id, of (neighbour id, cost)
+    :param source: base id
+    :param n: number of bases
+    :return: list of distances, list of the first step on each shortest path (-1 if unreachable)
+    >>> dijkstra([[(1, 1)], [(0, 1), (2, 5)], []], 0, 3)
+    ([0, 1, 6], [0, 1, 1])
+    """
+    dist = [math.inf] * n
+    first = [-1] * n
+    dist[source] = 0
+    first[source] = source
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for v, cost in adjacency[u]:
+            if d + cost < dist[v]:
+                dist[v] = d + cost
+                first[v] = v if u == source else first[u]
+                heapq.heappush(heap, (dist[v], v))
+    return dist, first
+
+
+class TravelDistances:
+    def __init__(self, names, steps, method=None):
+        """
+        Shortest travel distance between every pair of bases, and the route taken.
+        Use travel_distances to build one, so the result is cached.
+        :param names: list of base names
+        :param steps: list of (from base name, to base name, cost), see travel_edges
+        :param method: 'floyd' or 'dijkstra', by default chosen by the number of bases (see FLOYD_LIMIT)
+        >>> steps = [('A', 'B', 1), ('B', 'A', 1), ('B', 'C', 2), ('C', 'B', 2), ('C', 'D', 1)]
+        >>> td = TravelDistances(['A', 'B', 'C', 'D'], steps)
+        >>> td.distance('A', 'D'), td.distance('D', 'A')
+        (4.0, inf)
+        >>> td.route('A', 'D')
+        ['A', 'B', 'C', 'D']
+        >>> td.dist.tolist() == TravelDistances(['A', 'B', 'C', 'D'], steps, method='dijkstra').dist.tolist()
+        True
+        """
+        self.names = list(names)
+        self.ids = {b: i for i, b in enumerate(self.names)}
+        n = len(self.names)
+        if method is None:
+            method = 'floyd' if n <= FLOYD_LIMIT else 'dijkstra'
+        self.method = method
+        if method == 'floyd':
+            direct = np.full((n, n), np.inf)
+            np.fill_diagonal(direct, 0)
+            for a, b, cost in steps:
+                i, j = self.ids[a], self.ids[b]
+                direct[i, j] = min(direct[i, j], cost)
+            self.dist, self.next = floyd_warshall(direct)
+        else:
+            adjacency = [[] for i in range(n)]
+            for a, b, cost in steps:
+                adjacency[self.ids[a]].append((self.ids[b], cost))
+            self.dist = np.empty((n, n))
+            self.next = np.empty((n, n), dtype=int)
+            for i in range(n):
+                self.dist[i], self.next[i] = dijkstra(adjacency, i, n)
+        self.nearest_base = None
+        self.nearest_dist = None
+    def distance(self, a, b):
+        return float(self.dist[self.ids[a], self.ids[b]])
+    def route(self, a, b):
+        """
+        Bases passed through going from a to b, including both, or [] if b can't be reached
+        """
+        i, j = self.ids[a], self.ids[b]
+        if self.next[i, j] < 0:
+            return []
+        path = [a]
+        while i != j:
+            i = self.next[i, j]
+            path.append(self.names[i])
+        return path
+    def locate_assets(self, bases, statuses=(ACTUAL,)):
+        """
+        Work out, for every asset and every base, the closest base that has that asset, so that
+        nearest() is a lookup.
+        :param bases: dictionary of BaseLocation objects
+        :param statuses: which features count as having the asset (see FeatureStore.counts)
+        """
+        store = FeatureStore(bases)
+        has = np.zeros((len(ASSET_KEYS), len(self.names)), dtype=bool)
+        m = store.mask(statuses)
+        base_ids = np.array([self.ids.get(b, -1) for b in store.names], dtype=int)[store.base[m]]
+        known = base_ids >= 0
+        has[store.asset[m][known], base_ids[known]] = True
+
+        n = len(self.names)
+        self.nearest_base = np.full((len(ASSET_KEYS), n), -1)
+        self.nearest_dist = np.full((len(ASSET_KEYS), n), np.inf)
+        for a in np.flatnonzero(has.any(axis=1)):
+            columns = np.flatnonzero(has[a])
+            closest = self.dist[:, columns].argmin(axis=1)
+            self.nearest_base[a] = columns[closest]
+            self.nearest_dist[a] = self.dist[np.arange(n), columns[closest]]
+        self.nearest_base[~np.isfinite(self.nearest_dist)] = -1
+    def nearest(self, base, asset):
+        """
+        Closest base with an asset, once locate_assets has been called
+        :param base: base name to start from
+        :param asset: e.g. 'forge'
+        :return: (base name, distance), or (None, inf) if no base with the asset can be reached
+        >>> bases, colours = process_input('tests/testinput.json')
+        >>> b, e = parse_input('tests/testinput.json')
+        >>> td = travel_distances(bases, e)
+        >>> td.nearest('Quonset', 'forge')
+        ('Riken', 8.0)
+        >>> td.nearest('Quonset', 'workbench')
+        ('Quonset', 0.0)
+        """
+        i = self.nearest_base[ASSET_IDS[asset], self.ids[base]]
+        if i < 0:
+            return None, math.inf
+        return self.names[i], float(self.nearest_dist[ASSET_IDS[asset], self.ids[base]])
+
+
+def travel_distances(bases, edges, weights=None, method=None):
+    """
+    Shortest travel distances between all bases, with nearest() ready for every asset.
+    The distances are cached on the connections, weights and base names, so asking again only locates the assets
+    afresh, as the features of the bases may have changed. Only the DISTANCE_CACHE_LIMIT used most recently are kept.
+    :param bases: dictionary of BaseLocation objects
+    :param edges: list of connections, as loaded from the JSON by parse_input
+    :param weights: dictionary of connection kind : cost, overriding KIND_WEIGHTS
+    :return: TravelDistances object
+    >>> bases, colours = process_input('loottable4.json')
+    >>> b, e = parse_input('loottable4.json')
+    >>> td = travel_distances(bases, e)
+    >>> td.dist is travel_distances(bases, e).dist
+    True
+    >>> td.nearest('Quonset', 'forge')
+    ('Riken', 8.0)
+    >>> bases['Riken'].features = [[f for f in row if f.name != 'forge'] for row in bases['Riken'].features]
+    >>> bases.refresh('Riken')
+    >>> travel_distances(bases, e).nearest('Quonset', 'forge')
+    ('Spence', 14.0)
+    >>> td.distance('Quonset', 'Misanthrope') == len(td.route('Quonset', 'Misanthrope')) - 1
+    True
+    >>> for cost in range(DISTANCE_CACHE_LIMIT + 2):
+    ...     td = travel_distances(bases, e, weights={'path': cost + 2})
+    >>> len(DISTANCE_CACHE) == DISTANCE_CACHE_LIMIT
+    True
+    """
+    steps = travel_edges(edges, weights)
+    names = list(bases)
+    for a, b, cost in steps:
+        for name in (a, b):
+            if name not in bases and name not in names:
+                names.append(name)
+    key = hashlib.sha256(json.dumps([names, steps, method]).encode()).hexdigest()
+    cached = DISTANCE_CACHE.pop(key, None)
+    if cached is None:
+        cached = TravelDistances(names, steps, method)
+        if len(DISTANCE_CACHE) >= DISTANCE_CACHE_LIMIT:
+            del DISTANCE_CACHE[next(iter(DISTANCE_CACHE))]
+    DISTANCE_CACHE[key] = cached
+    td = copy.copy(cached) # sharing the distances, but not where the assets are
+    td.locate_assets(bases)
+    return td
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 3:
+        fname = sys.argv[1]
+        bases, colours = process_input(fname)
+        b, edges = parse_input(fname)
+        td = travel_distances(bases, edges)
+        start = sys.argv[2]
+        for a in sys.argv[3:]:
+            if a in ASSET_IDS:
+                nearest, dist = td.nearest(start, a)
+                print(f'Nearest {a}: {nearest} ({dist:g} steps)', ' > '.join(td.route(start, nearest)) if nearest else '')
+            else:
+                print(f'{a}: {td.distance(start, a):g} steps', ' > '.join(td.route(start, a)))
+    else:
+        doctest.testmod()
+        print('To run: python3 distances.py mybases.json Quonset forge workbench Misanthrope')
@@ -0,0 +1,190 @@
+from TLDBaseViz import *
+import numpy as np
+
+
+def poisson_binomial(groups, probabilities, qtys, num_groups, cells=None):
+    """
+    Distribution of the total in each group, where each cell adds its quantity with its probability
+    (a Poisson binomial distribution when quantities are 1). Every group is worked out at once: the n-th
+    uncertain cell of every group is folded in by the same numpy operation.
+    :param groups: array of group id for each entry
+    :param probabilities: array of probability for each cell of an entry
+    :param qtys: array of quantity for each cell of an entry, rounded to whole numbers
+    :param num_groups: number of groups
+    :param cells: array of how many cells each entry stands for (see compact_features), each one there or not
+                  independently of the others; 1 each if not given
+    :return: 2D array of P(uncertain part of the total = k), one row per group; array of the certain part of each total
+    >>> pmf, certain = poisson_binomial(np.array([0, 0, 1, 1]), np.array([0.5, 0.5, 1, 0.25]), np.array([1, 1, 3, 2]), 2)
+    >>> pmf.tolist(), certain.tolist()
+    ([[0.25, 0.5, 0.25], [0.75, 0.0, 0.25]], [0, 3])
+    >>> pmf, certain = poisson_binomial(np.array([0, 1]), np.array([0.5, 1]), np.array([1, 3]), 2, cells=np.array([2, 2]))
+    >>> pmf.tolist(), certain.tolist() # two cells of bear/0.5 folded into one, not one draw of two
+    ([[0.25, 0.5, 0.25], [1.0, 0.0, 0.0]], [0, 6])
+    """
+    if cells is not None:
+        groups, probabilities, qtys = (np.repeat(a, cells) for a in (groups, probabilities, qtys))
+    qtys = np.rint(qtys).astype(int)
+    sure = probabilities >= 1
+    certain = np.bincount(groups[sure], weights=qtys[sure], minlength=num_groups).astype(int)
+
+    maybe = (probabilities > 0) & ~sure
+    groups, probabilities, qtys = groups[maybe], probabilities[maybe], qtys[maybe]
+    width = int(np.bincount(groups, weights=qtys, minlength=num_groups).max(initial=0)) + 1
+    pmf = np.zeros((num_groups, width))
+    pmf[:, 0] = 1
+    if not len(groups):
+        return pmf, certain
+
+    # number each group's cells 0, 1, 2... so that one round takes at most one cell from each group
+    order = np.argsort(groups, kind='stable')
+    groups, probabilities, qtys = groups[order], probabilities[order], qtys[order]
+    starts = np.searchsorted(groups, groups)
+    rank = np.arange(len(groups)) - starts
+    totals = np.arange(width)[None, :]
+    for r in range(rank.max() + 1):
+        cells = rank == r
+        g, p, q = groups[cells], probabilities[cells, None], qtys[cells, None]
+        rows = pmf[g]
+        before = totals - q
+        shifted = np.where(before >= 0, np.take_along_axis(rows, np.maximum(before, 0), axis=1), 0)
+        pmf[g] = (1 - p) * rows + p * shifted
+    return pmf, certain
+
+
+class CountDistribution:
+    def __init__(self, labels, pmf, certain):
+        """
+        Distribution of how many of something there are, for several things at once
+        :param labels: name of each row (e.g. asset names)
+        :param pmf: 2D array, P(total = certain + k) in column k, see poisson_binomial
+        :param certain: array of the part of each total that is certain
+        >>> dist = CountDistribution(['bear', 'wolf'], np.array([[0.25, 0.5, 0.25], [1, 0, 0]]), np.array([1, 2]))
+        >>> dist.mean('bear'), dist.at_least('bear', 2), dist.at_least('bear', 4), dist.at_least('wolf', 2)
+        (2.0, 0.75, 0.0, 1.0)
+        >>> dist.quantile('bear', 0.1), dist.quantile('bear', 0.5), dist.quantile('bear', 0.9)
+        (1, 2, 3)
+        """
+        self.labels = list(labels)
+        self.rows = {label: i for i, label in enumerate(self.labels)}
+        self.pmf = pmf
+        self.certain = certain
+        self.tail = np.cumsum(pmf[:, ::-1], axis=1)[:, ::-1] # P(uncertain part >= k)
+        self.cdf = np.cumsum(pmf, axis=1)
+    def mean(self, label):
+        i = self.rows[label]
+        return float(self.certain[i] + self.pmf[i] @ np.arange(self.pmf.shape[1]))
+    def at_least(self, label, k):
+        """
+        P(count >= k)
+        """
+        i = self.rows[label]
+        k = int(math.ceil(k)) - self.certain[i]
+        if k <= 0:
+            return 1.0
+        if k >= self.pmf.shape[1]:
+            return 0.0
+        return float(round(self.tail[i, k], 12))
+    def quantile(self, label, q):
+        """
+        Smallest count c such that P(count <= c) >= q
+        """
+        i = self.rows[label]
+        return int(self.certain[i] + np.argmax(self.cdf[i] >= q - 1e-12))
+    def uncertain(self):
+        """
+        Labels whose count isn't known for sure
+        """
+        return [label for label, i in self.rows.items() if self.pmf[i, 0] < 1]
+
+
+def count_distributions(bases, statuses_to_count=(ACTUAL, REMOVE, FIND), by_region=False):
+    """
+    Distribution of how many of each asset there are, when some features only exist with a probability (bear/0.5).
+    The mean is what count_features gives.
+    :param bases: dictionary of BaseLocation objects
+    :param statuses_to_count: as for count_features
+    :param by_region: give one distribution per region
+    :return: CountDistribution labelled by asset name, or a dictionary of region : CountDistribution
+    >>> bases, colours = process_input('loottable4.json')
+    >>> dist = count_distributions(bases)
+    >>> round(dist.mean('polaroid'), 6) == round(count_features(bases)['polaroid'], 6)
+    True
+    >>> dist.quantile('polaroid', 0.05), dist.quantile('polaroid', 0.5), dist.quantile('polaroid', 0.95)
+    (16, 21, 26)
+    >>> dist.at_least('polaroid', 21)
+    0.554689128141
+    >>> compacted, colours = process_input('loottable4.json', compact=True)
+    >>> count_distributions(compacted).at_least('prybar', 15) == dist.at_least('prybar', 15) # consecutive uncertain prybars folded
+    True
+    >>> regional = count_distributions(bases, by_region=True)
+    >>> round(sum(regional[r].mean('polaroid') for r in regional), 6) == round(dist.mean('polaroid'), 6)
+    True
+    """
+    store = FeatureStore(bases)
+    m = store.mask(statuses_to_count)
+    if not by_region:
+        pmf, certain = poisson_binomial(store.asset[m], store.probability[m], np.ones(m.sum()), len(ASSET_KEYS),
+                                        cells=store.cells[m])
+        return CountDistribution(ASSET_KEYS, pmf, certain)
+
+    regions = []
+    base_region = []
+    for b in store.names:
+        if bases[b].region not in regions:
+            regions.append(bases[b].region)
+        base_region.append(regions.index(bases[b].region))
+    groups = np.array(base_region, dtype=int)[store.base] * len(ASSET_KEYS) + store.asset
+    pmf, certain = poisson_binomial(groups[m], store.probability[m], np.ones(m.sum()), len(regions) * len(ASSET_KEYS),
+                                    cells=store.cells[m])
+    per_region = {}
+    for r, region in enumerate(regions):
+        rows = slice(r * len(ASSET_KEYS), (r + 1) * len(ASSET_KEYS))
+        per_region[region] = CountDistribution(ASSET_KEYS, pmf[rows], certain[rows])
+    return per_region
+
+
+def print_distribution(dist, heading='', show_fixed=True):
+    """
+    Print the assets whose count is uncertain, with their likely range, and how likely the fixed number
+    for the sandbox (from the legend) is reached
+    :param dist: CountDistribution, see count_distributions
+    :param show_fixed: add the chance of reaching the fixed number, which only makes sense for the whole island
+    >>> bases, colours = process_input('mybases.json')
+    >>> print_distribution(count_distributions(bases))
+    asset          mean   5%  50%  95%  P(>= fixed)
+    bedroll        8.00    7    8    9  0.704
+    polaroid      21.00   18   21   24  0.585
+    bear          29.38   28   29   31  0.421
+    """
+    rows = dist.uncertain()
+    if not rows:
+        return
+    if heading:
+        print(heading)
+    print(f"{'asset':<12} {'mean':>6} {'5%':>4} {'50%':>4} {'95%':>4}" + show_fixed * '  P(>= fixed)')
+    fixed = {}
+    if show_fixed:
+        fixed = {i.key: i.fixednum for i in ICONS if type(i.fixednum) == float}
+    for a in rows:
+        line = f'{a:<12} {dist.mean(a):>6.2f} {dist.quantile(a, 0.05):>4} {dist.quantile(a, 0.5):>4} {dist.quantile(a, 0.95):>4}'
+        if a in fixed:
+            line += f'  {dist.at_least(a, fixed[a]):.3f}'
+        print(line)
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+        bases, colours = process_input(fname)
+        if len(sys.argv) > 2 and '-r' in sys.argv[2:]:
+            regional = count_distributions(bases, by_region=True)
+            for region in regional:
+                print_distribution(regional[region], heading=region, show_fixed=False)
+        else:
+            print_distribution(count_distributions(bases))
+    else:
+        doctest.testmod()
+        print('To run: python3 distributions.py mybases.json')
+        print('Optional parameters to add after the input json filename:')
+        print('\t-r \t\t one report per region')
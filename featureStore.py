@@ -0,0 +1,452 @@
+from keysAndDefs import *
+
+# assets are numbered in legend order (empty first), so counts come back in the same order as ASSETS
+ASSET_KEYS = list(ASSETS)
+ASSET_IDS = {a: i for i, a in enumerate(ASSET_KEYS)}
+
+FIXED_NUMBERS = None # see fixed_numbers
+
+
+def fixed_numbers():
+    """
+    Expected number of each asset in any sandbox, from the legend
+    :return: numpy array indexed by asset id (see ASSET_IDS), NaN where the number varies
+    >>> float(fixed_numbers()[ASSET_IDS['forge']])
+    4.0
+    """
+    global FIXED_NUMBERS
+    if FIXED_NUMBERS is None:
+        FIXED_NUMBERS = np.full(len(ASSET_KEYS), np.nan)
+        for la in ICONS:
+            if type(la.fixednum) == float:
+                FIXED_NUMBERS[ASSET_IDS[la.key]] = la.fixednum
+    return FIXED_NUMBERS
+
+WEIGHT_KEYS = {} # (status, material, asset name) tuples shared between bases, see feature_weights
+
+COLUMNS = ('base', 'row', 'col', 'asset', 'status', 'material', 'probability', 'qty', 'cells', 'given')
+COLUMN_TYPES = {'probability': float, 'qty': float, 'given': bool} # otherwise np.int32
+
+
+def code_id(code):
+    """
+    Integer id of a status or material, assigned the first time it is seen. Statuses and materials
+    share one table (CODES) since counting asks for a mix of both, e.g. (ACTUAL, REMOVE, FIND)
+    :param code: e.g. 'actual' or 'fir'
+    :return: int
+    >>> code_id(ACTUAL) == code_id(ACTUAL)
+    True
+    >>> code_id(ACTUAL) != code_id(PLANNED)
+    True
+    """
+    if code not in CODES:
+        CODES[code] = len(CODES)
+    return CODES[code]
+
+
+def feature_columns(features):
+    """
+    Store a 2D list of BaseFeatures column-wise, one entry per cell
+    :param features: list of rows of BaseFeature objects, as in BaseLocation.features
+    :return: dictionary of column name : numpy array, for every column except 'base'
+    >>> from TLDBaseViz import BaseFeature
+    >>> cols = feature_columns([[BaseFeature('forge'), BaseFeature('-hammer')], [BaseFeature('stick:20')]])
+    >>> cols['row'].tolist(), cols['col'].tolist()
+    ([0, 0, 1], [0, 1, 0])
+    >>> [ASSET_KEYS[i] for i in cols['asset']]
+    ['forge', 'hammer', 'stick']
+    >>> cols['qty'].tolist(), cols['cells'].tolist()
+    ([1.0, 1.0, 20.0], [1, 1, 1])
+    >>> feature_columns([[BaseFeature('forge'), BaseFeature('forge/0.5')]])['given'].tolist()
+    [False, True]
+    >>> int(cols['material'][1]) == CODES[TAKE]
+    True
+    """
+    rows, cols, assets, statuses, materials, probabilities, qtys, cells, given = [], [], [], [], [], [], [], [], []
+    for r, row in enumerate(features):
+        for c, feature in enumerate(row):
+            rows.append(r)
+            cols.append(c)
+            assets.append(ASSET_IDS[feature.name])
+            statuses.append(code_id(feature.status))
+            materials.append(code_id(feature.material))
+            probabilities.append(feature.probability)
+            qtys.append(feature.qty)
+            cells.append(feature.cells)
+            given.append(type(feature.probability) == float)
+    return {'row': np.array(rows, dtype=np.int32),
+            'col': np.array(cols, dtype=np.int32),
+            'asset': np.array(assets, dtype=np.int32),
+            'status': np.array(statuses, dtype=np.int32),
+            'material': np.array(materials, dtype=np.int32),
+            'probability': np.array(probabilities, dtype=float),
+            'qty': np.array(qtys, dtype=float),
+            'cells': np.array(cells, dtype=np.int32),
+            'given': np.array(given, dtype=bool)}
+
+
+def as_count(value):
+    """
+    Plain Python number for a count, an int where the count is whole
+    >>> as_count(np.float64(4.0)), as_count(np.float64(2.5))
+    (4, 2.5)
+    """
+    value = float(value)
+    if value.is_integer():
+        return int(value)
+    return value
+
+
+class FeatureStore:
+    def __init__(self, bases):
+        """
+        Features of every base in parallel arrays, so that counting across the whole island
+        is a handful of numpy operations rather than a walk over every cell.
+        :param bases: dictionary of BaseLocation objects
+        >>> from TLDBaseViz import process_input
+        >>> bases, colours = process_input('tests/testinput.json')
+        >>> store = FeatureStore(bases)
+        >>> len(store) == sum(len(row) for b in bases for row in bases[b].features)
+        True
+        >>> store.names[store.base[0]] == list(bases)[0]
+        True
+        """
+        self.names = list(bases)
+        parts = [bases[b].columns for b in self.names]
+        lengths = [len(p['asset']) for p in parts]
+        self.base = np.repeat(np.arange(len(self.names), dtype=np.int32), lengths)
+        for column in COLUMNS[1:]:
+            if parts:
+                setattr(self, column, np.concatenate([p[column] for p in parts]))
+            else:
+                setattr(self, column, np.zeros(0, dtype=COLUMN_TYPES.get(column, np.int32)))
+        self.weight = self.probability * self.cells
+    def __len__(self):
+        return len(self.asset)
+    def mask(self, codes):
+        """
+        Which cells have any of the given statuses or materials
+        :param codes: e.g. (ACTUAL, REMOVE, FIND)
+        :return: boolean numpy array
+        """
+        ids = [CODES[c] for c in codes if c in CODES]
+        return np.isin(self.status, ids) | np.isin(self.material, ids)
+    def counts(self, codes):
+        """
+        Expected number of each asset among cells with any of the given statuses or materials,
+        weighting each cell by its probability (quantities such as stick:20 still count once)
+        :param codes: e.g. (ACTUAL, REMOVE, FIND)
+        :return: numpy array indexed by asset id (see ASSET_IDS)
+        >>> from TLDBaseViz import process_input
+        >>> bases, colours = process_input('mybases.json')
+        >>> store = FeatureStore(bases)
+        >>> float(store.counts([ACTUAL, REMOVE, FIND])[ASSET_IDS['forge']])
+        4.0
+        """
+        m = self.mask(codes)
+        return np.bincount(self.asset[m], weights=self.weight[m], minlength=len(ASSET_KEYS))
+    def guessed(self, codes):
+        """
+        Which assets are counted (see counts) in at least one cell with a probability given in the input, e.g. forge/0.5
+        :param codes: e.g. (ACTUAL, REMOVE, FIND)
+        :return: boolean numpy array indexed by asset id (see ASSET_IDS)
+        """
+        m = self.mask(codes) & self.given
+        return np.bincount(self.asset[m], minlength=len(ASSET_KEYS)) > 0
+
+
+def feature_weights(features):
+    """
+    Expected number of each asset in a 2D list of BaseFeatures, split by status and material
+    :param features: list of rows of BaseFeature objects, as in BaseLocation.features
+    :return: tuple of (status, material, asset name), tuple of the count of each
+    >>> from TLDBaseViz import BaseFeature
+    >>> feature_weights([[BaseFeature('forge'), BaseFeature('-hammer')], [BaseFeature('-hammer'), BaseFeature('stick:20')]])
+    ((('actual', 'base', 'forge'), ('actual', 'take', 'hammer'), ('actual', 'base', 'stick')), (1, 2, 1))
+    """
+    weights = {}
+    for row in features:
+        for feature in row:
+            key = (feature.status, feature.material, feature.name)
+            weights[key] = weights.get(key, 0) + feature.probability * feature.cells
+    # kept by BaseWorld for every base, so share the key tuples, and keep two flat tuples rather than a pair per key
+    return tuple(WEIGHT_KEYS.setdefault(key, key) for key in weights), tuple(weights.values())
+
+
+INDEX_FIELDS = ('name', 'status', 'material', 'note')
+NEGATE = '!'
+EITHER = '|'
+FIELD_DELIM = '='
+
+
+def feature_tokens(feature):
+    """
+    What a feature can be looked up by in a FeatureIndex
+    :param feature: BaseFeature object
+    :return: list of (field, value)
+    >>> from TLDBaseViz import BaseFeature
+    >>> feature_tokens(BaseFeature('-hammer'))
+    [('name', 'hammer'), ('status', 'actual'), ('material', 'take')]
+    >>> feature_tokens(BaseFeature('#+From Quonset'))
+    [('name', 'empty'), ('status', 'planned'), ('material', 'bring'), ('note', 'from'), ('note', 'quonset')]
+    """
+    tokens = [('name', feature.name), ('status', feature.status), ('material', feature.material)]
+    note = ''.join(c if c.isalnum() else ' ' for c in feature.alt_text.lower())
+    for word in note.split():
+        tokens.append(('note', word))
+    return tokens
+
+
+class FeatureIndex:
+    def __init__(self, bases=()):
+        """
+        Inverted index from asset name, status, material and words of #notes to the cells they appear in,
+        so that questions like "where are all the hammers still to be taken" need no walk over every base.
+        :param bases: dictionary of BaseLocation objects
+        >>> from TLDBaseViz import process_input
+        >>> bases, colours = process_input('tests/testinput.json')
+        >>> index = FeatureIndex(bases)
+        >>> index.query('hacksaw take')
+        [('Quonset', 3, 5)]
+        >>> len(index.query('curing')), len(index.query('curing !planned')), len(index.query('curing planned|bring'))
+        (8, 4, 4)
+        >>> index.query('name=trunk material=fir')
+        [('Quonset', 7, 3)]
+        >>> postings = len(index.postings)
+        >>> index.remove('Quonset')
+        >>> index.query('hacksaw take')
+        []
+        >>> index.add('Quonset', bases['Quonset'])
+        >>> len(index.postings) == postings
+        True
+        """
+        self.postings = {} # (field, value) : set of (base name, row, column)
+        self.cells = {} # base name : set of (base name, row, column)
+        self.tokens = {} # base name : set of (field, value) it has postings under, so removing it only visits those
+        for b in bases:
+            self.add(b, bases[b])
+    def add(self, name, bob):
+        self.remove(name)
+        cells = set()
+        tokens = set()
+        for r, row in enumerate(bob.features):
+            for c, feature in enumerate(row):
+                cell = (name, r, c)
+                cells.add(cell)
+                for token in feature_tokens(feature):
+                    self.postings.setdefault(token, set()).add(cell)
+                    tokens.add(token)
+        self.cells[name] = cells
+        self.tokens[name] = tokens
+    def remove(self, name):
+        if name not in self.cells:
+            return
+        for token in self.tokens.pop(name):
+            cells = self.postings[token]
+            cells.difference_update(self.cells[name])
+            if not cells:
+                del self.postings[token]
+        del self.cells[name]
+    def lookup(self, term):
+        """
+        Cells matching one term: a value (e.g. hammer, planned, fir, or a word from a note), optionally
+        restricted to one field as in name=fir, with alternatives separated by |
+        :param term: e.g. 'hammer|prybar'
+        :return: set of (base name, row, column)
+        :raises ValueError: for a field that isn't one of INDEX_FIELDS
+        >>> FeatureIndex().lookup('colour=red')
+        Traceback (most recent call last):
+        ...
+        ValueError: unknown field colour in colour=red, expecting one of name, status, material, note
+        """
+        found = set()
+        for alternative in term.lower().split(EITHER):
+            if FIELD_DELIM in alternative:
+                field, value = alternative.split(FIELD_DELIM, 1)
+                if field not in INDEX_FIELDS:
+                    raise ValueError(f"unknown field {field} in {alternative}, expecting one of {', '.join(INDEX_FIELDS)}")
+                found |= self.postings.get((field, value), set())
+            else:
+                for field in INDEX_FIELDS:
+                    found |= self.postings.get((field, alternative), set())
+        return found
+    def query(self, text):
+        """
+        Cells matching every term in the query, where a term starting with ! must not match
+        :param text: terms separated by spaces, e.g. 'hammer|prybar !take'
+        :return: sorted list of (base name, row, column)
+        """
+        found = None
+        excluded = set()
+        for term in text.split():
+            if term.startswith(NEGATE):
+                excluded |= self.lookup(term[len(NEGATE):])
+            elif found is None:
+                found = self.lookup(term)
+            else:
+                found &= self.lookup(term)
+        if found is None:
+            found = set().union(*self.cells.values())
+        return sorted(found - excluded)
+
+
+class BaseWorld(dict):
+    def __init__(self, bases=()):
+        """
+        Dictionary of base name : BaseLocation that keeps running totals of every asset by region,
+        status and material as bases are added, replaced or removed, so that counting across the island
+        does not need to look at every cell again. After changing the features of a base in place,
+        call refresh with its name.
+        :param bases: dictionary of BaseLocation objects to start with
+        >>> from TLDBaseViz import process_input, BaseLocation, parse_input
+        >>> bases, colours = process_input('tests/testinput.json')
+        >>> world = BaseWorld(bases)
+        >>> world.counts([ACTUAL]).tolist() == FeatureStore(bases).counts([ACTUAL]).tolist()
+        True
+        >>> float(world.counts([ACTUAL])[ASSET_IDS['trunk']])
+        7.0
+        >>> del world['Quonset']
+        >>> float(world.counts([ACTUAL])[ASSET_IDS['trunk']])
+        0.0
+        >>> world['Quonset'] = bases['Quonset']
+        >>> world['Quonset'].features[6][0] = world['Quonset'].features[0][0]
+        >>> world.refresh('Quonset')
+        >>> float(world.counts([ACTUAL])[ASSET_IDS['trunk']])
+        6.0
+        >>> float(world.counts([ACTUAL], region='DesolationPoint')[ASSET_IDS['trunk']])
+        0.0
+        >>> while world:
+        ...     name, bob = world.popitem()
+        >>> any(world.totals.values())
+        False
+        >>> world |= bases
+        >>> world.counts([ACTUAL]).tolist() == FeatureStore(bases).counts([ACTUAL]).tolist()
+        True
+        """
+        super().__init__()
+        self.totals = {} # region : {(status, material, asset name) : count}, keys shared as in feature_weights
+        self._weights = {} # base name : (region, *feature_weights) as last added, so it can be taken off again
+        self._index = None
+        for b in bases:
+            self[b] = bases[b]
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+    def _add(self, name, bob):
+        keys, counts = feature_weights(bob.features)
+        self._weights[name] = (bob.region, keys, counts)
+        if self._index is not None:
+            self._index.add(name, bob)
+        totals = self.totals.setdefault(bob.region, {})
+        for key, n in zip(keys, counts):
+            totals[key] = totals.get(key, 0) + n
+    def _remove(self, name):
+        region, keys, counts = self._weights.pop(name)
+        if self._index is not None:
+            self._index.remove(name)
+        totals = self.totals[region]
+        for key, n in zip(keys, counts):
+            totals[key] -= n
+            if abs(totals[key]) < 1e-9:
+                del totals[key]
+    def __setitem__(self, name, bob):
+        if name in self._weights:
+            self._remove(name)
+        super().__setitem__(name, bob)
+        self._add(name, bob)
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self._remove(name)
+    def pop(self, name, *default):
+        if name in self:
+            self._remove(name)
+        return super().pop(name, *default)
+    def popitem(self):
+        name, bob = super().popitem()
+        self._remove(name)
+        return name, bob
+    def clear(self):
+        super().clear()
+        self.totals = {}
+        self._weights = {}
+        self._index = None
+    def update(self, *args, **kwargs):
+        for name, bob in dict(*args, **kwargs).items():
+            self[name] = bob
+    def __ior__(self, other):
+        self.update(other)
+        return self
+    def setdefault(self, name, bob=None):
+        if name not in self:
+            self[name] = bob
+        return self[name]
+    def refresh(self, name):
+        """
+        Update the totals after the features of a base have been changed in place
+        :param name: base name
+        """
+        self[name] = self[name]
+        self[name]._columns = None
+    @property
+    def index(self):
+        """
+        FeatureIndex of all the bases, built on first use and then kept up to date like the totals
+        >>> from TLDBaseViz import process_input
+        >>> bases, colours = process_input('tests/testinput.json')
+        >>> bases.index.query('hacksaw take')
+        [('Quonset', 3, 5)]
+        >>> del bases['Quonset']
+        >>> bases.index.query('hacksaw take')
+        []
+        """
+        if self._index is None:
+            self._index = FeatureIndex(self)
+        return self._index
+    def counts(self, codes, region=None):
+        """
+        Expected number of each asset with any of the given statuses or materials, from the running totals
+        :param codes: e.g. (ACTUAL, REMOVE, FIND)
+        :param region: only count bases in this region
+        :return: numpy array indexed by asset id (see ASSET_IDS)
+        """
+        counts = np.zeros(len(ASSET_KEYS))
+        for reg, totals in self.totals.items():
+            if region is None or reg == region:
+                for (status, material, asset), n in totals.items():
+                    if status in codes or material in codes:
+                        counts[ASSET_IDS[asset]] += n
+        return counts
+    def guessed(self, codes, region=None):
+        """
+        Which assets are counted (see counts) with a probability given in the input, e.g. forge/0.5,
+        as their running totals are then floats
+        :param codes: e.g. (ACTUAL, REMOVE, FIND)
+        :param region: only count bases in this region
+        :return: boolean numpy array indexed by asset id (see ASSET_IDS)
+        >>> from TLDBaseViz import process_input
+        >>> bases, colours = process_input('mybases.json')
+        >>> bases.guessed([ACTUAL, REMOVE, FIND]).tolist() == FeatureStore(bases).guessed([ACTUAL, REMOVE, FIND]).tolist()
+        True
+        """
+        guessed = np.zeros(len(ASSET_KEYS), dtype=bool)
+        for reg, totals in self.totals.items():
+            if region is None or reg == region:
+                for (status, material, asset), n in totals.items():
+                    if (status in codes or material in codes) and type(n) == float:
+                        guessed[ASSET_IDS[asset]] = True
+        return guessed
+
+
+def feature_counter(bases):
+    """
+    Something to count features with: the running totals of a BaseWorld, otherwise a FeatureStore
+    :param bases: dictionary of BaseLocation objects
+    :return: object with counts(codes) and guessed(codes) methods
+    """
+    if isinstance(bases, BaseWorld):
+        return bases
+    return FeatureStore(bases)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,188 @@
+from distances import *
+
+
+def min_cost_matching(cost):
+    """
+    Pair rows with columns so that the total cost is as small as possible (the Hungarian method,
+    with the inner search over columns done by numpy). If there are more rows than columns,
+    some rows are left out, and the other way round.
+    :param cost: 2D array of costs, which must be finite
+    :return: list of (row, column) pairs
+    >>> min_cost_matching([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+    [(0, 1), (1, 0), (2, 2)]
+    >>> min_cost_matching([[1, 9], [9, 1], [0, 0]])
+    [(0, 0), (2, 1)]
+    >>> min_cost_matching(np.zeros((0, 3)))
+    []
+    >>> import itertools
+    >>> rng = np.random.default_rng(1)
+    >>> for trial in range(20):
+    ...     c = rng.integers(0, 20, (5, 5))
+    ...     best = min(sum(c[i, p[i]] for i in range(5)) for p in itertools.permutations(range(5)))
+    ...     assert sum(c[i, j] for i, j in min_cost_matching(c)) == best
+    """
+    cost = np.asarray(cost, dtype=float)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    # 1-indexed as in the usual statement of the method, column 0 is a dummy
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    matched_row = np.zeros(m + 1, dtype=int) # row matched to each column, 0 for none
+    way = np.zeros(m + 1, dtype=int)
+
+    # start from reduced costs, and match straight away every row that has a free column at no extra cost.
+    # Columns can only be reduced when every one of them will be matched.
+    u[1:] = cost.min(axis=1)
+    if n == m:
+        v[1:] = (cost - u[1:, None]).min(axis=0)
+    tight = np.isclose(cost - u[1:, None] - v[None, 1:], 0)
+    unmatched = []
+    for i in range(1, n + 1):
+        free = np.flatnonzero(tight[i - 1] & (matched_row[1:] == 0))
+        if len(free):
+            matched_row[free[0] + 1] = i
+        else:
+            unmatched.append(i)
+
+    for i in unmatched:
+        matched_row[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = matched_row[j0]
+            free = ~used
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(candidates[1:].argmin()) + 1
+            delta = candidates[j1]
+            u[matched_row[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if matched_row[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            matched_row[j0] = matched_row[j1]
+            j0 = j1
+
+    pairs = [(int(matched_row[j]) - 1, j - 1) for j in range(1, m + 1) if matched_row[j]]
+    if transposed:
+        pairs = [(j, i) for i, j in pairs]
+    return sorted(pairs)
+
+
+def haul_markers(bases, material):
+    """
+    Every item flagged to take (-item) or bring (+item), one entry per item, so stick:3 gives three.
+    Notes (#+From Quonset) are left out.
+    :param bases: dictionary of BaseLocation objects
+    :param material: TAKE or BRING
+    :return: dictionary of asset name : list of (base name, row, column)
+    >>> bases, colours = process_input('tests/testinput.json')
+    >>> haul_markers(bases, BRING)
+    {'maglens': [('Quonset', 8, 5)], 'hammer': [('QMFishHut', 0, 2), ('Riken', 2, 0)], 'woodworking': [('Hibernia', 3, 1)], 'cookpot': [('MTFarm', 3, 1)]}
+    >>> len(haul_markers(bases, TAKE)['dpammo'])
+    3
+    """
+    store = FeatureStore(bases)
+    markers = {}
+    for k in np.flatnonzero(store.mask([material]) & (store.asset != ASSET_IDS[EMPTY])):
+        units = max(1, int(round(store.qty[k])))
+        cell = (store.names[store.base[k]], int(store.row[k]), int(store.col[k]))
+        markers.setdefault(ASSET_KEYS[store.asset[k]], []).extend(units * [cell])
+    return markers
+
+
+def plan_hauls(bases, edges, weights=None):
+    """
+    Pair every item to take with a place to bring it, per asset, so that the total travel is as short as possible,
+    then order the trips so that each one starts as close as possible to where the last one ended.
+    :param bases: dictionary of BaseLocation objects
+    :param edges: list of connections, as loaded from the JSON by parse_input
+    :param weights: dictionary of connection kind : cost, see travel_distances
+    :return: ordered list of hauls, each a dictionary with asset, take and bring cells (base, row, column),
+             distance and route; dictionary of asset : unmatched take cells; same for unmatched bring cells
+    >>> bases, colours = process_input('mybases.json')
+    >>> b, e = parse_input('mybases.json')
+    >>> hauls, left_take, left_bring = plan_hauls(bases, e)
+    >>> hauls[0]['asset'], hauls[0]['take'], hauls[0]['bring'], hauls[0]['distance']
+    ('suitcase', ('VacantDepot', 10, 1), ('WorkerResidence', 6, 1), 22.0)
+    >>> all(len(h['route']) - 1 == h['distance'] for h in hauls)
+    True
+    >>> left_bring['quality'] # more places are waiting for quality than have one to give
+    [('BunkerGamma', 3, 0), ('MainHangar', 2, 1), ('LastLonelyHouse', 2, 2)]
+    """
+    td = travel_distances(bases, edges, weights)
+    takes = haul_markers(bases, TAKE)
+    brings = haul_markers(bases, BRING)
+
+    hauls = []
+    left_take = {}
+    left_bring = {}
+    for asset in ASSET_KEYS:
+        take_cells = takes.get(asset, [])
+        bring_cells = brings.get(asset, [])
+        pairs = []
+        if take_cells and bring_cells:
+            dist = td.dist[np.ix_([td.ids[t[0]] for t in take_cells], [td.ids[b[0]] for b in bring_cells])]
+            finite = np.isfinite(dist)
+            # unreachable pairs cost more than any matching of reachable ones, then get dropped
+            unreachable = (dist[finite].max(initial=0) + 1) * min(dist.shape) + 1
+            pairs = [(i, j) for i, j in min_cost_matching(np.where(finite, dist, unreachable)) if finite[i, j]]
+            for i, j in pairs:
+                hauls.append({'asset': asset, 'take': take_cells[i], 'bring': bring_cells[j],
+                              'distance': float(dist[i, j])})
+        matched_take = {i for i, j in pairs}
+        matched_bring = {j for i, j in pairs}
+        if len(matched_take) < len(take_cells):
+            left_take[asset] = [t for i, t in enumerate(take_cells) if i not in matched_take]
+        if len(matched_bring) < len(bring_cells):
+            left_bring[asset] = [b for j, b in enumerate(bring_cells) if j not in matched_bring]
+
+    # greedily start each trip from wherever the last one ended
+    ordered = []
+    here = None
+    while hauls:
+        if here is None:
+            k = 0
+        else:
+            k = int(np.argmin([td.dist[here, td.ids[h['take'][0]]] for h in hauls]))
+        haul = hauls.pop(k)
+        haul['route'] = td.route(haul['take'][0], haul['bring'][0])
+        ordered.append(haul)
+        here = td.ids[haul['bring'][0]]
+    return ordered, left_take, left_bring
+
+
+def cell_name(cell):
+    return f'{cell[0]} (row {cell[1]}, column {cell[2]})'
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+        bases, colours = process_input(fname)
+        b, edges = parse_input(fname)
+        hauls, left_take, left_bring = plan_hauls(bases, edges)
+        for n, h in enumerate(hauls):
+            print(f"{n + 1}. {h['asset']}: {cell_name(h['take'])} -> {cell_name(h['bring'])},",
+                  f"{h['distance']:g} steps:", ' > '.join(h['route']))
+        for a in left_take:
+            print('Nowhere to bring', a, 'from', ', '.join(cell_name(c) for c in left_take[a]))
+        for a in left_bring:
+            print('Nothing to take for', a, 'at', ', '.join(cell_name(c) for c in left_bring[a]))
+    else:
+        doctest.testmod()
+        print('To run: python3 hauling.py mybases.json')
@@ -1,4 +1,5 @@
 from utils import *
+import hashlib
 
 BASES = 'bases'
 ACTUAL = 'actual'
@@ -36,6 +37,14 @@ TOP= 'top'
 LEFT = 'left'
 RIGHT = 'right'
 REVERSE = {SOUTH:NORTH, NORTH:SOUTH, EAST:WEST, WEST:EAST, BOTTOM:TOP, TOP:BOTTOM, LEFT:RIGHT, RIGHT:LEFT}
+# corners that keep a connection leaving/arriving on the side facing its direction
+CORNER_OPTIONS = {NORTH: ([TOP + ',' + LEFT, TOP + ',' + RIGHT], [BOTTOM + ',' + LEFT, BOTTOM + ',' + RIGHT]),
+                  SOUTH: ([BOTTOM + ',' + LEFT, BOTTOM + ',' + RIGHT], [TOP + ',' + LEFT, TOP + ',' + RIGHT]),
+                  EAST: ([TOP + ',' + RIGHT, BOTTOM + ',' + RIGHT], [TOP + ',' + LEFT, BOTTOM + ',' + LEFT]),
+                  WEST: ([TOP + ',' + LEFT, BOTTOM + ',' + LEFT], [TOP + ',' + RIGHT, BOTTOM + ',' + RIGHT])}
+
+CHECK_ERROR = 'error'
+CHECK_WARNING = 'warning'
 
 # the colours provided
 COLOURS = 'colours'
@@ -97,26 +106,171 @@ def parse_colours(colours):
     >>> parse_colours(c)['tinder']
     '#623e29'
     """
-    hexes = {}
-    for c in colours:
-        if 'oklch' in colours[c]:
-            lchstr = colours[c].split('oklch(')[1].split(')')[0]
-            if ' ' in lchstr:
-                lchstr = lchstr.split(' ')
-            else:
-                lchstr = lchstr.split(',')
-
-            assert len(lchstr) == 3, "impoperly formatted oklch colour"
-            hex = oklch_to_hex(float(lchstr[0]), float(lchstr[1]), float(lchstr[2]))
-        else:
-            hex = colours[c]
+    hexes = dict(colours)
+    lch_keys = [c for c in colours if 'oklch' in colours[c]]
+    for c, hex in zip(lch_keys, oklchs_to_hex([parse_oklch(colours[c]) for c in lch_keys])):
         hexes[c] = hex
     return hexes
 
 
+def parse_oklch(text):
+    """
+    Numbers from a CSS oklch colour, separated by spaces or commas
+    >>> parse_oklch('oklch(0.7 0.1 170)'), parse_oklch('oklch(0.7,0.1,170)')
+    ((0.7, 0.1, 170.0), (0.7, 0.1, 170.0))
+    """
+    lchstr = text.split('oklch(')[1].split(')')[0]
+    if ' ' in lchstr:
+        lchstr = lchstr.split(' ')
+    else:
+        lchstr = lchstr.split(',')
+
+    assert len(lchstr) == 3, "impoperly formatted oklch colour"
+    return float(lchstr[0]), float(lchstr[1]), float(lchstr[2])
+
+
+PALETTE_CACHE = '.cache' # folder, next to the style file, of converted palettes
+PALETTE_VERSION = 2 # change to ignore palettes cached by an older parse_colours (2: gamut mapping bisects until converged)
+
+
+def cached_colours(style_file, colours=None):
+    """
+    parse_colours for a style file, cached on disk under the hash of the file's contents,
+    so that once a style has been converted, loading it again needs no colour maths (or numpy)
+    :param style_file: JSON filepath, see parse_styling
+    :param colours: its colours, if already loaded
+    :return: dict of colour name : hex code
+    >>> c, d, cs, ps = parse_styling('styling.json')
+    >>> cached_colours('styling.json') == parse_colours(c)
+    True
+    >>> os.path.exists(palette_cache_file('styling.json'))
+    True
+    """
+    cache_file = palette_cache_file(style_file)
+    try:
+        with open(cache_file, 'r') as f:
+            hexes = json.load(f)
+        count('palette cache hits')
+        return hexes
+    except (OSError, ValueError):
+        count('palette cache misses')
+    if colours is None:
+        colours = parse_styling(style_file)[0]
+    hexes = parse_colours(colours)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        with open(cache_file + '.tmp', 'w') as f:
+            json.dump(hexes, f)
+        os.replace(cache_file + '.tmp', cache_file)
+    except OSError:
+        pass # e.g. read-only folder, just convert again next time
+    return hexes
+
+
+def palette_cache_file(style_file):
+    with open(style_file, 'rb') as f:
+        digest = hashlib.sha256(f.read() + str(PALETTE_VERSION).encode()).hexdigest()
+    return os.path.join(os.path.dirname(style_file), PALETTE_CACHE, digest + '.json')
+
+
 STYLE_FILE = 'styling.json'
 raw_colours, DASHSTYLE, FILLS, STROKES = parse_styling(STYLE_FILE)
-HEXES = parse_colours(raw_colours)
+
+
+class Palette(dict):
+    """
+    Dictionary of colour name : hex colour, see LazyPalette
+    """
+    pass
+
+
+class PaletteColour(str):
+    """
+    Hex colour that remembers its name in the palette it came from, so whatever is drawn with it can be told apart
+    by what it means (e.g. stone) rather than by its colour, which other names may share (see theme_classes)
+    >>> c = palette_colour({'outdoor': '#72aba7', 'stone': '#72aba7'}, 'stone')
+    >>> c, c.key, c == '#72aba7'
+    ('#72aba7', 'stone', True)
+    """
+    def __new__(cls, hex, key):
+        colour = super().__new__(cls, hex)
+        colour.key = key
+        return colour
+    def __reduce__(self):
+        return self.__class__, (str(self), self.key)
+
+
+PALETTE_COLOURS = {} # (hex, name) : PaletteColour, so each is only made once
+
+
+def palette_colour(colours, key):
+    """
+    colours[key] as a PaletteColour
+    """
+    hex = colours[key]
+    if (hex, key) not in PALETTE_COLOURS:
+        PALETTE_COLOURS[(hex, key)] = PaletteColour(hex, key)
+    return PALETTE_COLOURS[(hex, key)]
+
+
+def palette_colours(colours):
+    """
+    Copy of a palette with every colour a PaletteColour
+    """
+    return Palette({k: palette_colour(colours, k) for k in colours})
+
+
+class LazyPalette(Palette):
+    """
+    Palette that only loads the colours of a style file (see cached_colours) the first time it's read,
+    since converting them needs numpy and most of the startup time would go on it.
+    Once filled it turns into a plain Palette, so reading it costs no more than any dictionary,
+    and it stays the same object.
+    >>> c, d, cs, ps = parse_styling('styling.json')
+    >>> palette = LazyPalette('styling.json', c)
+    >>> dict.__len__(palette)
+    0
+    >>> palette['tinder'], len(palette), 'fir' in palette
+    ('#623e29', 20, True)
+    >>> type(palette).__name__, palette == parse_colours(c)
+    ('Palette', True)
+    """
+    def __init__(self, style_file, raw=None):
+        super().__init__()
+        self.style_file = style_file
+        self.raw = raw
+    def fill(self):
+        dict.update(self, cached_colours(self.style_file, self.raw))
+        self.__class__ = Palette
+        return self
+    def __getitem__(self, key):
+        return self.fill()[key]
+    def __contains__(self, key):
+        return key in self.fill()
+    def __iter__(self):
+        return iter(self.fill())
+    def __len__(self):
+        return len(self.fill())
+    def __eq__(self, other):
+        return self.fill() == other
+    __hash__ = None
+    def __repr__(self):
+        return repr(self.fill())
+    def __reduce__(self):
+        return self.fill().__reduce__()
+    def keys(self):
+        return self.fill().keys()
+    def values(self):
+        return self.fill().values()
+    def items(self):
+        return self.fill().items()
+    def get(self, key, default=None):
+        return self.fill().get(key, default)
+    def copy(self):
+        return self.fill().copy()
+
+
+HEXES = LazyPalette(STYLE_FILE, raw_colours)
 
 OUTDOOR_OPACITY = 0.25
 FONTFAM = 'Arial'
@@ -168,9 +322,11 @@ DELIM = '\t'
 
 ORDERING = {}
 ASSETS = {EMPTY:'empty.svg'}
+ASSET_PATHS = {EMPTY:'assets/empty.svg'}
 TODO_TYPES = {EMPTY:BASE}
-MOVABLES = [EMPTY]
+MOVABLES = {EMPTY}
 ICONS = []
+CODES = {} # integer ids of statuses and materials, filled in by featureStore.code_id
 
 with open(LEGEND, 'r') as f:
     for line in f:
@@ -180,12 +336,14 @@ with open(LEGEND, 'r') as f:
             ICONS.append(la)
             ORDERING[la.key] = la.description
             ASSETS[la.key] = la.filename
+            ASSET_PATHS[la.key] = 'assets/' + la.filename
             TODO_TYPES[la.key] = la.material
             if la.movable:
-                MOVABLES.append(la.key)
+                MOVABLES.add(la.key)
 
 
 if __name__ == '__main__':
+    import doctest
     doctest.testmod()
 
 
@@ -0,0 +1,23 @@
+import importlib
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported when one of its attributes is first used, so that
+    loading and checking a save doesn't pay for (or need) libraries only used to draw or convert colours
+    >>> m = LazyModule('fractions')
+    >>> m.Fraction(1, 2)
+    Fraction(1, 2)
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -1,15 +1,16 @@
 from numbers import Number
-import doctest
-import numpy as np
+from lazyModule import LazyModule
+
+np = LazyModule('numpy')
 
 # colorm lib:
-LMS2LRGB = np.array(
+LMS2LRGB_ROWS = (
     [
         [4.0767416621, -3.3077115913, 0.2309699292],
         [-1.2684380046, 2.6097574011, -0.3413193965],
         [-0.0041960863, -0.7034186147, 1.707614701],
     ]
-).T
+)
 # culori lib:
 # LMS2LRGB = np.array(
 #     [
@@ -21,13 +22,13 @@ LMS2LRGB = np.array(
 
 # # LRGB2LMS = np.linalg.inv(LMS2LRGB)
 # colorm lib:
-LRGB2LMS = np.array(
+LRGB2LMS_ROWS = (
     [
         [0.4122214708018041, 0.53633253634543, 0.05144599285276585],
         [0.2119034982505858, 0.6806995451361225, 0.1073969566132915],
         [0.08830246188874209, 0.2817188376235317, 0.6299787004877261],
     ]
-).T
+)
 # culori lib:
 # LRGB2LMS = np.array(
 #     [
@@ -38,13 +39,13 @@ LRGB2LMS = np.array(
 # ).T
 
 # colorm lib:
-OKLAB2CLMS = np.array(
+OKLAB2CLMS_ROWS = (
     [
         [1.0, 0.3963377774, 0.2158037573],
         [1.0, -0.1055613458, -0.0638541728],
         [1.0, -0.0894841775, -1.291485548],
     ]
-).T
+)
 # culori lib:
 # OKLAB2CLMS = np.array(
 #     [
@@ -56,13 +57,13 @@ OKLAB2CLMS = np.array(
 
 # # CLMS2OKLAB = np.linalg.inv(OKLAB2CLMS)
 # colorm lib:
-CLMS2OKLAB = np.array(
+CLMS2OKLAB_ROWS = (
     [
         [0.2104542682745812, 0.7936177747300267, -0.004072043004608028],
         [1.977998532388508, -2.428592241936286, 0.4505937095477779],
         [0.02590404248765818, 0.7827717124269177, -0.8086757549145759],
     ]
-).T
+)
 # culori lib:
 # CLMS2OKLAB = np.array(
 #     [
@@ -72,6 +73,16 @@ CLMS2OKLAB = np.array(
 #     ]
 # ).T
 
+# numpy arrays of the matrices above, built the first time they're used (so importing doesn't need numpy)
+MATRICES = {}
+MATRIX_ROWS = {'LMS2LRGB': LMS2LRGB_ROWS, 'LRGB2LMS': LRGB2LMS_ROWS, 'OKLAB2CLMS': OKLAB2CLMS_ROWS, 'CLMS2OKLAB': CLMS2OKLAB_ROWS}
+
+
+def conversion_matrix(name):
+    if name not in MATRICES:
+        MATRICES[name] = np.array(MATRIX_ROWS[name]).T
+    return MATRICES[name]
+
 
 def args2array(*args):
     if len(args) == 1:
@@ -98,23 +109,7 @@ def rgb2oklch(rgb, *args):
     >>> rgb2oklch([230, 230, 230]) # hue can be anything because it's grey
     array([0.92493954, 0.        , 0.        ])
     """
-    rgb = args2array(rgb, *args)
-    if np.issubdtype(rgb.dtype, np.integer):
-        # normalize (sometimes called srgb)
-        rgb = rgb / 255.0
-
-    # to linear RGB
-    sign = np.sign(rgb)
-    rgb = np.fabs(rgb)
-    lrgb = ((rgb + 0.055) / 1.055) ** 2.4
-    lrgb[smol] = rgb[smol := rgb <= 0.04045] / 12.92
-    lrgb *= sign
-
-    # to lms
-    lms = lrgb @ LRGB2LMS
-
-    # to oklab
-    oklab = np.cbrt(lms) @ CLMS2OKLAB
+    oklab = rgb2oklab(rgb, *args)
 
     # to oklch
     oklch = np.zeros_like(oklab)
@@ -135,6 +130,40 @@ def rgb2oklch(rgb, *args):
     return oklch
 
 
+def rgb2oklab(rgb, *args):
+    """
+    Convert from sRGB (0-255 integers, or 0-1 floats) to OKLab
+    >>> rgb2oklab([[255, 255, 255], [0, 0, 0]])[:, 0].round(6).tolist()
+    [1.0, 0.0]
+    """
+    rgb = args2array(rgb, *args)
+    if np.issubdtype(rgb.dtype, np.integer):
+        # normalize (sometimes called srgb)
+        rgb = rgb / 255.0
+
+    # to linear RGB
+    sign = np.sign(rgb)
+    rgb = np.fabs(rgb)
+    lrgb = ((rgb + 0.055) / 1.055) ** 2.4
+    lrgb[smol] = rgb[smol := rgb <= 0.04045] / 12.92
+    lrgb *= sign
+
+    # to lms
+    lms = lrgb @ conversion_matrix('LRGB2LMS')
+
+    # to oklab
+    return np.cbrt(lms) @ conversion_matrix('CLMS2OKLAB')
+
+
+def oklab2rgb(oklab, *args):
+    """
+    Convert from OKLab to 8-bit sRGB, clipping anything out of gamut
+    >>> oklab2rgb(rgb2oklab([58, 137, 250], [177, 115, 173])).tolist()
+    [[58, 137, 250], [177, 115, 173]]
+    """
+    return _rgb_8bit(_oklab2rgb(args2array(oklab, *args)).clip(0, 1))
+
+
 def _oklch2rgb(oklch, *args):
     """
 
@@ -167,12 +196,22 @@ def _oklch2rgb(oklch, *args):
     oklab[..., 1] = chroma * np.cos(huerad)
     oklab[..., 2] = chroma * np.sin(huerad)
 
+    return _oklab2rgb(oklab)
+
+
+def _oklab2rgb(oklab):
+    return _lrgb2rgb(_oklab2lrgb(oklab))
+
+
+def _oklab2lrgb(oklab):
     # to cubic-root lms
-    clms = oklab @ OKLAB2CLMS
+    clms = oklab @ conversion_matrix('OKLAB2CLMS')
 
     # to lrgb
-    lrgb = (clms * clms * clms) @ LMS2LRGB
+    return (clms * clms * clms) @ conversion_matrix('LMS2LRGB')
+
 
+def _lrgb2rgb(lrgb):
     # to normalized rgb (sometimes called srgb)
     sign = np.sign(lrgb)
     lrgb = np.fabs(lrgb)
@@ -182,6 +221,18 @@ def _oklch2rgb(oklch, *args):
 
     return rgb
 
+
+def _oog_lrgb(lrgb):
+    # same as _oog_srgb(_lrgb2rgb(lrgb)), since the transfer function keeps 0 and 1 where they are,
+    # but only rows that are right at the top of the range pay for the transfer function
+    top = lrgb.max(axis=-1)
+    oog = (top > 1) | (lrgb.min(axis=-1) < 0)
+    edge = np.fabs(top - 1) < 1e-9
+    if np.any(edge):
+        oog[edge] = _oog_srgb(_lrgb2rgb(lrgb[edge]))
+    return oog
+
+
 def _rgb_8bit(rgb):
     # scale and round values
     return np.round(rgb * 255).astype(np.uint8)
@@ -191,11 +242,22 @@ def _oog_srgb(rgb):
     return np.any((rgb > 1) | (rgb < 0), axis=-1)
 
 
-def oklch2rgb(oklch, *args):
+def out_of_gamut(oklch, *args):
+    """
+    Which colours are outside sRGB, before oklch2rgb brings them in
+    >>> out_of_gamut([[0.5, 0.05, 100], [0.6, 0.4, 30]]).tolist()
+    [False, True]
+    """
+    return _oog_srgb(_oklch2rgb(args2array(oklch, *args)))
+
+
+def oklch2rgb(oklch, *args, lut=False):
     """
     Convert from oklch to sRGB
     :param oklch:
     :param args:
+    :param lut: start bisecting out of gamut colours from a bracket read off a grid (see gamut_bracket),
+                faster for large arrays, and within a step of the colour found without it
     :return:
     >>> oklch2rgb([0.63212109, 0.0958, 325.99])
     array([168, 117, 169], dtype=uint8)
@@ -223,29 +285,143 @@ def oklch2rgb(oklch, *args):
     oog = _oog_srgb(rgb)
     if not np.any(oog):
         return _rgb_8bit(rgb)
-    oog_oklch = oklch[oog]
-    end = oog_oklch[..., 1]
-    clamped = np.copy(oog_oklch)
-    clamped[..., 1] = 0
-    start = np.zeros_like(end)
-    last_good = np.zeros_like(end)
-    # max SRGB chroma value is ~0.3224; round it up to 0.5 and use
-    # resolution = chroma_range / (2 ** 13) = 0.5 / (2 ** 13) = 1 / (2 ** 14)
-    resolution = 1 / (1 << 14)
-    while np.any(end - start > resolution):
-        # a bit inefficient since we don't remove the ones that have met the
-        # terminating condition
-        clamped[..., 1] = start + (end - start) / 2
-        oog_clamped = _oog_srgb(_oklch2rgb(clamped))
-        end[oog_clamped] = clamped[oog_clamped, 1]
-        start[nogg] = clamped[nogg := ~oog_clamped, 1]
-        last_good[nogg] = start[nogg]
-    clamped[oog_clamped, 1] = last_good[oog_clamped]
+    clamped = oklch[oog]
+    start = np.zeros(len(clamped))
+    end = clamped[..., 1]
+    if lut:
+        start, end = gamut_bracket(clamped)
+    clamped[..., 1] = max_chroma(clamped, start, end)
     rgb[oog] = _oklch2rgb(clamped)
     return _rgb_8bit(rgb)
 
 
+# max SRGB chroma value is ~0.3224; round it up to 0.5 and use
+# resolution = chroma_range / (2 ** 13) = 0.5 / (2 ** 13) = 1 / (2 ** 14)
+GAMUT_RESOLUTION = 1 / (1 << 14)
+
+
+def max_chroma(oklch, start, end):
+    """
+    Largest chroma, to within GAMUT_RESOLUTION, at which colours with these luminances and hues are in sRGB,
+    by bisection. Each colour stops as soon as its own interval is small enough, and only the colours still
+    going are converted in each round.
+    :param oklch: array of colours, one per row (the chroma column isn't used)
+    :param start: array of chromas known to be in gamut
+    :param end: array of chromas known to be out of gamut
+    :return: array of chromas, each the last one found in gamut
+    >>> max_chroma(np.array([[0.63, 0.5, 326]]), np.zeros(1), np.full(1, 0.5)).tolist()
+    [0.29302978515625]
+    """
+    start = np.array(start, dtype=float)
+    end = np.array(end, dtype=float)
+    # the colours still being bisected, packed at the front of these buffers
+    index = np.flatnonzero(end - start > GAMUT_RESOLUTION)
+    low = start[index]
+    high = end[index]
+    huerad = np.deg2rad(oklch[index, 2])
+    cos = np.cos(huerad)
+    sin = np.sin(huerad)
+    oklab = np.empty((len(index), 3))
+    oklab[:, 0] = oklch[index, 0]
+    while len(index):
+        mid = low + (high - low) / 2
+        np.multiply(mid, cos, out=oklab[:, 1])
+        np.multiply(mid, sin, out=oklab[:, 2])
+        oog = _oog_lrgb(_oklab2lrgb(oklab))
+        high = np.where(oog, mid, high)
+        low = np.where(oog, low, mid)
+        going = high - low > GAMUT_RESOLUTION
+        if not going.all():
+            start[index[~going]] = low[~going]
+            index, low, high, cos, sin, oklab = (index[going], low[going], high[going],
+                                                cos[going], sin[going], oklab[going])
+    return start
+
+
+GAMUT_LUTS = {} # (luminance steps, hue steps) : table, see gamut_lut
+# how far either side of the chroma read off the grid to bracket, see gamut_bracket.
+# On the default grid 90% of colours are within a bisection step of what's read off, and 98% within this.
+GAMUT_MARGIN = 1 / (1 << 12)
+
+
+def gamut_lut(l_steps=65, h_steps=361):
+    """
+    Max sRGB chroma on a grid of luminance (0 to 1) by hue (0 to 360 degrees), worked out the first time it's asked for
+    >>> lut = gamut_lut()
+    >>> lut.shape, float(lut[0, 0]), float(lut[-1, 0])
+    ((65, 361), 0.0, 0.0)
+    """
+    if (l_steps, h_steps) not in GAMUT_LUTS:
+        grid = np.stack(np.meshgrid(np.linspace(0, 1, l_steps), [0.5], np.linspace(0, 360, h_steps), indexing='ij'),
+                        axis=-1).reshape(-1, 3)
+        chroma = max_chroma(grid, np.zeros(len(grid)), grid[:, 1])
+        GAMUT_LUTS[(l_steps, h_steps)] = chroma.reshape(l_steps, h_steps)
+    return GAMUT_LUTS[(l_steps, h_steps)]
+
+
+def gamut_bracket(oklch, lut=None):
+    """
+    Narrow chroma interval holding the max in-gamut chroma of each colour, interpolated from the grid around it
+    (see gamut_lut) and checked, so bisecting from it takes a few rounds instead of 14.
+    Colours whose check fails get the full interval.
+    :param oklch: array of out of gamut colours, one per row
+    :param lut: grid from gamut_lut
+    :return: array of chromas in gamut, array of chromas out of gamut
+    >>> colours = np.array([[0.63, 0.5, 326], [0.2, 0.3, 40]])
+    >>> start, end = gamut_bracket(colours)
+    >>> (end - start).tolist()
+    [0.00048828125, 0.00048828125]
+    >>> bool(np.all(np.fabs(max_chroma(colours, start, end) - max_chroma(colours, np.zeros(2), colours[:, 1])) < 2 * GAMUT_RESOLUTION))
+    True
+    """
+    if lut is None:
+        lut = gamut_lut()
+    l_steps, h_steps = lut.shape
+    li = oklch[:, 0] * (l_steps - 1)
+    hi = (oklch[:, 2] % 360) / 360 * (h_steps - 1)
+    l0 = np.minimum(li.astype(int), l_steps - 2)
+    h0 = np.minimum(hi.astype(int), h_steps - 2)
+    lf = li - l0
+    hf = hi - h0
+    guess = ((lut[l0, h0] * (1 - hf) + lut[l0, h0 + 1] * hf) * (1 - lf)
+             + (lut[l0 + 1, h0] * (1 - hf) + lut[l0 + 1, h0 + 1] * hf) * lf)
+    start = np.maximum(guess - GAMUT_MARGIN, 0)
+    end = np.minimum(guess + GAMUT_MARGIN, oklch[:, 1])
+
+    trial = np.concatenate([oklch, oklch])
+    trial[:, 1] = np.concatenate([start, end])
+    oog = _oog_srgb(_oklch2rgb(trial))
+    good = ~oog[:len(oklch)] & (oog[len(oklch):] | (end == oklch[:, 1])) & (start <= end)
+    start[~good] = 0
+    end[~good] = oklch[~good, 1]
+    return start, end
+
+
+def gamut_benchmark(n=10 ** 6, seed=0):
+    """
+    Time oklch2rgb on n random colours (most of them out of gamut), with and without gamut_bracket
+    :return: dictionary of seconds taken
+    """
+    import time
+    rng = np.random.default_rng(seed)
+    colours = rng.uniform(0, 1, (n, 3)) * [1, 0.4, 360]
+    times = {}
+    gamut_lut()
+    for lut in (False, True):
+        t = time.perf_counter()
+        oklch2rgb(colours, lut=lut)
+        times['lut' if lut else 'bisection'] = time.perf_counter() - t
+    return times
+
+
 if __name__ == '__main__':
+    import doctest
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        n = int(float(sys.argv[2])) if len(sys.argv) > 2 else 10 ** 6
+        for k, t in gamut_benchmark(n).items():
+            print(f'{k:<10} {n} colours {t:.2f} s ({n / t / 1e6:.2f} M colours/s)')
+        sys.exit()
     print(rgb2oklch(58, 137, 250))
     print('res', rgb2oklch([58, 137, 250]))
     print(rgb2oklch([58, 137, 250], [127, 120, 127], [255, 255, 255]))
@@ -1,8 +1,10 @@
-import doctest
-import drawsvg as draw
-from bs4 import BeautifulSoup
+from lazyModule import LazyModule
+from profiling import phase, count, is_profiling, start_profiling, stop_profiling, MemoryBudgetExceeded, MIB
 import sys
 
+draw = LazyModule('drawsvg')
+bs4 = LazyModule('bs4')
+
 # we use this information to figure out commas
 SEG_COORDS = {'M':2, 'S':4, 'L':2, 'Z':0, 'C':6, 'Q':4, 'A':7, 'V':1, 'H':1 }
 
@@ -161,9 +163,10 @@ def parse_path_style(p, output_warnings=True):
         return defaults
 
 
-def draw_path(d, s, style, transform='', opacity=1.0):
+def draw_path(d, s, style, transform='', opacity=1.0, parsed=None):
     """
     :param s:
+    :param parsed: segments of s from handle_implicit_path_coordinates, if already known
     :return:
     >>> d = draw.Drawing(200, 200)
     >>> s = 'M 106.14893,154.92896 105.12057,156.28805 C 105.12157,155.41162 104.84358,154.55791 104.32682,153.851 L 104.47152,153.65876 C 105.31488,152.54463 106.99228,153.81276 106.14892,154.92897 Z'
@@ -189,8 +192,9 @@ def draw_path(d, s, style, transform='', opacity=1.0):
         p = draw.Path(fill=fill, stroke=stroke, stroke_width=stroke_width, opacity=opacity)
 
     #s = s.replace(' ','')
-    sections = separate_svg_path(s)
-    parsed = handle_implicit_path_coordinates(sections)
+    if parsed is None:
+        sections = separate_svg_path(s)
+        parsed = handle_implicit_path_coordinates(sections)
 
     for seg in parsed:
         seg_type, coords = seg
@@ -221,25 +225,30 @@ def draw_path(d, s, style, transform='', opacity=1.0):
     return parsed
 
 
-def import_svg(d, fname,
-               x = 0, y = 0, wid = 100, hei=100,
-               rounding_precision=3, rounding_func=round,
-               make_new_drawing=False, id_name='import',
-               group_transform='', fill='none', opacity=1.0, output_warnings=False):
+ICON_CACHE = {}
+
+
+def load_svg(fname, output_warnings=False):
     """
-    Take a string representing an SVG path and turn it into a new string that
-    represents the path in drawsvg.
-    :param s: a path string. Must be all absolute.
-    :return:
-    >>> d = draw.Drawing(50, 50)
-    >>> d = import_svg(d, 'assets/hacksaw.svg')
-    >>> d.save_svg('tests/test2.svg')
+    Read and parse the paths of an SVG file, keeping the result so each file is only parsed once.
+    :param fname: SVG filename
+    :return: dictionary with the width and height of the SVG, and its paths as [path string, parsed segments, style, transform]
+    >>> icon = load_svg('assets/hacksaw.svg')
+    >>> icon['width'], icon['height'], len(icon['paths'])
+    (23.978001, 23.978001, 3)
+    >>> load_svg('assets/hacksaw.svg') is icon
+    True
     """
+    if fname in ICON_CACHE:
+        count('icon cache hits')
+        return ICON_CACHE[fname]
+    count('icon cache misses')
+
     svg_code = ''
     with open(fname, 'r') as f:
         svg_code = f.read()
 
-    soup = BeautifulSoup(svg_code, 'xml')
+    soup = bs4.BeautifulSoup(svg_code, 'xml')
 
     svg_width = float(soup.find('svg')['width'])
     svg_height = float(soup.find('svg')['height'])
@@ -248,11 +257,44 @@ def import_svg(d, fname,
         if output_warnings:
             print('\tWARNING:VIEWBOX', viewbox, svg_width, svg_height, file=sys.stderr)
 
+    paths = []
+    for p in soup.find_all('path'):
+        curr_path = p['d']
+        style_dict = parse_path_style(p, output_warnings=output_warnings)
+        try:
+            transform = p['transform']
+        except:
+            transform = ''
+        parsed = handle_implicit_path_coordinates(separate_svg_path(curr_path))
+        paths.append([curr_path, parsed, style_dict, transform])
+
+    icon = {'width': svg_width, 'height': svg_height, 'paths': paths}
+    ICON_CACHE[fname] = icon
+    return icon
+
+
+def import_svg(d, fname,
+               x = 0, y = 0, wid = 100, hei=100,
+               rounding_precision=3, rounding_func=round,
+               make_new_drawing=False, id_name='import',
+               group_transform='', fill='none', opacity=1.0, output_warnings=False, recolour=None):
+    """
+    Take a string representing an SVG path and turn it into a new string that
+    represents the path in drawsvg.
+    :param s: a path string. Must be all absolute.
+    :param recolour: if given, function applied to every fill and stroke colour (after fill is applied)
+    :return:
+    >>> d = draw.Drawing(50, 50)
+    >>> d = import_svg(d, 'assets/hacksaw.svg')
+    >>> d.save_svg('tests/test2.svg')
+    """
+    icon = load_svg(fname, output_warnings=output_warnings)
+    svg_width = icon['width']
+    svg_height = icon['height']
+
     if make_new_drawing:
         d = draw.Drawing(svg_width, svg_height)
 
-    paths = soup.find_all('path')
-
     scale_x = wid / svg_width
     group_transform = f'translate({x}, {y}) scale({scale_x})'
     if group_transform:
@@ -260,22 +302,130 @@ def import_svg(d, fname,
     else:
         g = draw.Group(id=id_name)
 
-    for p in paths:
-        curr_path = p['d']
-        style_dict = parse_path_style(p, output_warnings=output_warnings)
-        try:
-            transform = p['transform']
-        except:
-            transform = ''
+    for curr_path, parsed, style_dict, transform in icon['paths']:
         #print('\n', fname, style_dict)
         if fill != 'none':
+            style_dict = dict(style_dict)
             style_dict['fill'] = fill
+        if recolour is not None:
+            style_dict = dict(style_dict)
+            for k in ('fill', 'stroke'):
+                if k in style_dict and style_dict[k] != 'none':
+                    style_dict[k] = recolour(style_dict[k])
         #print(fname, style_dict)
-        draw_path(g, curr_path, style_dict, transform=transform, opacity=opacity)
+        draw_path(g, curr_path, style_dict, transform=transform, opacity=opacity, parsed=parsed)
     d.append(g)
     return d
 
 
+def parse_transform(s):
+    """
+    Turn an SVG transform attribute into an affine matrix. Only translate, scale, and matrix are supported.
+    :param s: transform string
+    :return: (a, b, c, d, e, f) as in the SVG matrix() transform
+    >>> parse_transform('translate(5.0000003,17)')
+    (1.0, 0.0, 0.0, 1.0, 5.0000003, 17.0)
+    >>> parse_transform('matrix(-0.26458333,0,0,0.26458333,211.12911,-66.144822)')
+    (-0.26458333, 0.0, 0.0, 0.26458333, 211.12911, -66.144822)
+    >>> parse_transform('translate(3, 4) scale(2)')
+    (2.0, 0.0, 0.0, 2.0, 3.0, 4.0)
+    >>> parse_transform('')
+    (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    """
+    m = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    for part in s.replace(')', ')\n').splitlines():
+        if '(' not in part:
+            continue
+        name, args = part.split('(')
+        name = name.strip()
+        args = [float(a) for a in args.replace(')', '').replace(',', ' ').split()]
+        if name == 'translate':
+            if len(args) == 1:
+                args.append(0.0)
+            t = (1.0, 0.0, 0.0, 1.0, args[0], args[1])
+        elif name == 'scale':
+            if len(args) == 1:
+                args.append(args[0])
+            t = (args[0], 0.0, 0.0, args[1], 0.0, 0.0)
+        elif name == 'matrix':
+            t = tuple(args)
+        else:
+            raise ValueError('unsupported transform ' + name)
+        m = multiply_transforms(m, t)
+    return m
+
+
+def multiply_transforms(m, t):
+    a, b, c, d, e, f = m
+    ta, tb, tc, td, te, tf = t
+    return (a*ta + c*tb, b*ta + d*tb, a*tc + c*td, b*tc + d*td, a*te + c*tf + e, b*te + d*tf + f)
+
+
+def transformed_path_data(icon, x=0, y=0, wid=100, rounding_precision=3):
+    """
+    Path strings of an icon moved into place, the same way import_svg would place it, so that the paths
+    of several icons can be joined into one path element.
+    :param icon: parsed SVG from load_svg
+    :return: list of [style, path string] in canvas coordinates, or None if the icon can't be converted
+    (arcs under a transform that isn't a uniform scale)
+    >>> icon = load_svg('assets/hacksaw.svg')
+    >>> style, path_data = transformed_path_data(icon, x=10, y=20, wid=20)[0]
+    >>> path_data[:38]
+    'M29.654,22.586 L27.609,21.04 C26.524,2'
+    >>> style
+    {'fill': '#000000', 'stroke': 'none', 'stroke-width': 0.221}
+    """
+    scale_x = wid / icon['width']
+    group = (scale_x, 0.0, 0.0, scale_x, float(x), float(y))
+    pieces = []
+    for curr_path, parsed, style_dict, transform in icon['paths']:
+        a, b, c, d, e, f = multiply_transforms(group, parse_transform(transform))
+        uniform = b == 0 and c == 0 and abs(a) == abs(d)
+
+        def point(px, py):
+            return f'{round(a*px + c*py + e, rounding_precision):g},{round(b*px + d*py + f, rounding_precision):g}'
+
+        out = []
+        curr_x, curr_y = 0, 0
+        start_x, start_y = 0, 0
+        for seg_type, coords in parsed:
+            if seg_type == 'M':
+                curr_x, curr_y = coords
+                start_x, start_y = coords
+                out.append('M' + point(*coords))
+            elif seg_type in ('L', 'H', 'V'):
+                if seg_type == 'H':
+                    coords = [coords[0], curr_y]
+                elif seg_type == 'V':
+                    coords = [curr_x, coords[0]]
+                curr_x, curr_y = coords
+                out.append('L' + point(*coords))
+            elif seg_type in ('C', 'Q', 'S'):
+                curr_x, curr_y = coords[-2:]
+                out.append(seg_type + ' '.join(point(*coords[i:i+2]) for i in range(0, len(coords), 2)))
+            elif seg_type == 'A':
+                if not uniform:
+                    return None
+                rx, ry, angle, large_arc, sweep = coords[:5]
+                if a * d < 0:
+                    angle, sweep = -angle, 1 - sweep
+                curr_x, curr_y = coords[5:]
+                out.append(f'A{round(rx*abs(a), rounding_precision):g},{round(ry*abs(a), rounding_precision):g},'
+                           f'{angle:g},{large_arc:g},{sweep:g},' + point(curr_x, curr_y))
+            elif seg_type == 'Z':
+                curr_x, curr_y = start_x, start_y
+                out.append('Z')
+
+        try:
+            stroke_width = float(str(style_dict.get('stroke-width', 0)).replace('px', ''))
+        except ValueError:
+            return None
+        style = {'fill': style_dict.get('fill', 'none'), 'stroke': style_dict.get('stroke', 'none'),
+                 'stroke-width': round(stroke_width * abs(a), rounding_precision)}
+        pieces.append([style, ' '.join(out)])
+    return pieces
+
+
 def recreate_svg(input_fname, output_fname):
     """
     Recreate an SVG from input
@@ -293,4 +443,5 @@ def recreate_svg(input_fname, output_fname):
 
 
 if __name__ == '__main__':
+    import doctest
     doctest.testmod()
\ No newline at end of file
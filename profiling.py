@@ -0,0 +1,225 @@
+import contextlib
+import json
+import linecache
+import time
+import tracemalloc
+
+PROFILER = None # the Profiler recording, if any, see start_profiling
+NO_PHASE = contextlib.nullcontext()
+MIB = 1 << 20
+TOP_ALLOCATIONS = 10
+TRACE_IGNORE = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>',
+                '<unknown>')
+
+
+class MemoryBudgetExceeded(MemoryError):
+    pass
+
+
+class Profiler:
+    def __init__(self, pstats_file=None, memory=False, memory_budget=None):
+        """
+        Wall time and number of calls of each phase of a run, plus counters of things done along the way
+        (icons drawn, cache hits...). Phases inside other phases are recorded under both names, e.g. 'draw/legend'.
+        :param pstats_file: if given, also run cProfile over the whole run and write its stats here
+        :param memory: also trace memory with tracemalloc (slow): the peak of each phase, and the lines that had
+                       allocated the most when the most memory was held at the end of a phase
+        :param memory_budget: bytes. A phase that peaks above this raises MemoryBudgetExceeded. Implies memory
+        >>> p = Profiler()
+        >>> with p.phase('draw'):
+        ...     for i in range(3):
+        ...         with p.phase('icon'):
+        ...             p.count('icons')
+        >>> p.phases['draw/icon'][0], p.counters['icons']
+        (3, 3)
+        >>> print(p.table()) # doctest: +ELLIPSIS
+        phase                             calls     seconds
+        draw                                  1 ...
+          icon                                3 ...
+        icons                                 3
+        >>> p = Profiler(memory_budget=MIB)
+        >>> p.start()
+        >>> with p.phase('build'):
+        ...     with p.phase('small'):
+        ...         small = bytearray(1000)
+        ...     big = bytearray(2 * MIB)
+        Traceback (most recent call last):
+        ...
+        profiling.MemoryBudgetExceeded: build peaked at 2.0 MiB, over the budget of 1.0 MiB
+        >>> p.stop()
+        >>> p.phases['build/small'][2] < MIB < p.phases['build'][2], p.over_budget
+        (True, 'build')
+        >>> p.top_allocations()[0][0].endswith('big = bytearray(2 * MIB)')
+        True
+        """
+        self.phases = {} # phase path : [calls, seconds, peak bytes]
+        self.counters = {}
+        self.stack = []
+        self.pstats_file = pstats_file
+        self.cprofile = None
+        if pstats_file:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.memory_budget = memory_budget
+        self.memory = memory or memory_budget is not None
+        self.peaks = [] # highest memory so far in each phase on the stack, not counting since the last reset_peak
+        self.peak = 0
+        self.over_budget = None # phase that went over budget
+        self.snapshot = None
+        self.snapshot_stats = None
+        self.snapshot_memory = 0
+        self.snapshot_phase = None
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.stack.append(name)
+        path = '/'.join(self.stack)
+        if path not in self.phases:
+            self.phases[path] = [0, 0.0, 0]
+        if self.memory:
+            self.fold_peak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self.peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.phases[path]
+            record[0] += 1
+            record[1] += time.perf_counter() - start
+            self.stack.pop()
+            if self.memory:
+                self.end_memory(path, record)
+    def fold_peak(self, peak):
+        # tracemalloc keeps only one peak, so before resetting it for a phase, hand it to the one around it
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        self.peak = max(self.peak, peak)
+    def end_memory(self, path, record):
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(self.peaks.pop(), peak)
+        record[2] = max(record[2], peak)
+        tracemalloc.reset_peak()
+        self.fold_peak(peak)
+        over = self.memory_budget is not None and peak > self.memory_budget and self.over_budget is None
+        if over or (not self.stack and current > self.snapshot_memory):
+            self.take_snapshot(path, current)
+        if over:
+            self.over_budget = path
+            raise MemoryBudgetExceeded(f'{path} peaked at {peak / MIB:.1f} MiB, '
+                                       f'over the budget of {self.memory_budget / MIB:.1f} MiB')
+    def take_snapshot(self, path, current):
+        self.snapshot = tracemalloc.take_snapshot() # filter_traces takes far longer than this, so skip lines later
+        self.snapshot_stats = None
+        self.snapshot_memory = current
+        self.snapshot_phase = path
+    def top_allocations(self, n=TOP_ALLOCATIONS):
+        """
+        :return: list of (file:line and source, bytes, blocks) of the lines holding the most memory at the snapshot
+        """
+        if self.snapshot is None:
+            return []
+        if self.snapshot_stats is None:
+            self.snapshot_stats = self.snapshot.statistics('lineno')
+        top = []
+        for stat in self.snapshot_stats:
+            frame = stat.traceback[0]
+            if frame.filename in TRACE_IGNORE:
+                continue
+            if len(top) == n:
+                break
+            source = linecache.getline(frame.filename, frame.lineno).strip()
+            top.append((f'{frame.filename}:{frame.lineno} {source}', stat.size, stat.count))
+        return top
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+    def start(self):
+        if self.memory:
+            tracemalloc.start()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.pstats_file)
+        if self.memory and tracemalloc.is_tracing():
+            self.fold_peak(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    def as_dict(self):
+        out = {'phases': {p: {'calls': c, 'seconds': round(s, 6)} for p, (c, s, m) in self.phases.items()},
+               'counters': dict(self.counters)}
+        if self.memory:
+            for p, (c, s, m) in self.phases.items():
+                out['phases'][p]['peak_bytes'] = m
+            out['memory'] = {'peak_bytes': self.peak, 'budget_bytes': self.memory_budget,
+                             'over_budget': self.over_budget, 'snapshot_phase': self.snapshot_phase,
+                             'top_allocations': [{'line': l, 'bytes': b, 'blocks': n}
+                                                 for l, b, n in self.top_allocations()]}
+        return out
+    def save_json(self, fname):
+        with open(fname, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+    def table(self):
+        lines = [f"{'phase':<30} {'calls':>8} {'seconds':>11}" + (f" {'peak MiB':>10}" if self.memory else '')]
+        for p, (calls, seconds, peak) in self.phases.items():
+            depth = p.count('/')
+            name = '  ' * depth + p.split('/')[-1]
+            lines.append(f'{name:<30} {calls:>8} {seconds:>11.4f}' + (f' {peak / MIB:>10.1f}' if self.memory else ''))
+        for k, v in self.counters.items():
+            lines.append(f'{k:<30} {v:>8}')
+        if self.memory:
+            budget = '' if self.memory_budget is None else f' of a budget of {self.memory_budget / MIB:.1f}'
+            lines.append(f'peak memory {self.peak / MIB:.1f} MiB{budget}')
+            if self.snapshot is not None:
+                lines.append(f'most memory held after {self.snapshot_phase}, {self.snapshot_memory / MIB:.1f} MiB, by:')
+                for line, size, blocks in self.top_allocations():
+                    lines.append(f'{size / MIB:>8.2f} MiB {blocks:>8} blocks  {line}')
+        return '\n'.join(lines)
+
+
+def start_profiling(pstats_file=None, memory=False, memory_budget=None):
+    """
+    Start recording phases and counters (see Profiler) until stop_profiling
+    """
+    global PROFILER
+    PROFILER = Profiler(pstats_file, memory, memory_budget)
+    PROFILER.start()
+    return PROFILER
+
+
+def stop_profiling():
+    global PROFILER
+    profiler = PROFILER
+    PROFILER = None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def phase(name):
+    """
+    Context manager timing a phase of the run, if profiling; otherwise it does nothing
+    >>> with phase('parse'):
+    ...     pass
+    >>> p = start_profiling()
+    >>> with phase('parse'):
+    ...     count('bases', 10)
+    >>> stop_profiling().as_dict()['counters']
+    {'bases': 10}
+    """
+    if PROFILER is None:
+        return NO_PHASE
+    return PROFILER.phase(name)
+
+
+def count(name, n=1):
+    if PROFILER is not None:
+        PROFILER.count(name, n)
+
+
+def is_profiling():
+    return PROFILER is not None
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,149 @@
+from lazyModule import LazyModule
+import collections
+import io
+import os
+
+draw = LazyModule('drawsvg')
+draw_types = LazyModule('drawsvg.types')
+draw_drawing = LazyModule('drawsvg.drawing')
+draw_raster = LazyModule('drawsvg.raster')
+
+TEMP_SUFFIX = '.part' # added to the filepath being written until it's finished
+
+
+class SVGStream:
+    def __init__(self, fname, width, height, css=(), prepare=None):
+        """
+        An SVG file written one element at a time as they are appended, rather than all at once at the end as with
+        drawsvg's Drawing.save_svg, so the drawing never has to be held in memory. Given the same elements in the
+        same order, the file is the same, byte for byte. Elements can't be changed once appended, and can't use
+        defs (gradients, markers...), which drawsvg writes before everything else.
+        Until it's closed the drawing goes to a temporary file next to fname, so fname is only ever replaced by a
+        whole drawing; abort (or leaving a with block by an exception) throws the temporary file away.
+        :param fname: SVG filepath
+        :param css: list of style blocks, which have to come first
+        :param prepare: if given, function called with each element (and each group opened) just before it's written
+        >>> def bases(): # the same elements, made afresh for each drawing
+        ...     return [draw.Group([draw.Text('Quonset', 5, 0, 10)], id='Quonset'), draw.Path(stroke='red').M(0, 0).L(5, 5)]
+        >>> d = draw.Drawing(40, 20)
+        >>> d.append(draw.Rectangle(0, 0, 40, 20, fill='white'))
+        >>> d.append(draw.Group(bases(), id='bases'))
+        >>> with SVGStream('tests/stream.svg', 40, 20) as s:
+        ...     s.append(draw.Rectangle(0, 0, 40, 20, fill='white'))
+        ...     g = s.open_group(id='bases')
+        ...     for el in bases():
+        ...         g.append(el)
+        ...     s.close_group()
+        >>> with open('tests/stream.svg', 'r') as f:
+        ...     f.read() == d.as_svg()
+        True
+        >>> with SVGStream('tests/stream.svg', 40, 20) as s:
+        ...     s.append(draw.Rectangle(0, 0, 40, 20, fill='white'))
+        ...     g = s.open_group(id='bases')
+        ...     raise ValueError('stopped drawing')
+        Traceback (most recent call last):
+        ...
+        ValueError: stopped drawing
+        >>> with open('tests/stream.svg', 'r') as f:
+        ...     f.read() == d.as_svg()
+        True
+        >>> os.path.exists(s.temp_fname)
+        False
+        """
+        self.fname = fname
+        self.width = width
+        self.height = height
+        self.prepare = prepare
+        self.drawing = draw.Drawing(width, height) # stays empty, gives the header and how to write elements
+        for c in css:
+            self.drawing.append_css(c)
+        self.context = self.drawing.context
+        self.open_groups = [] # for each group open, whether anything has been written in it yet
+        id_index = 0
+        def id_gen(base=''):
+            nonlocal id_index
+            id_index += 1
+            return f'{self.drawing.id_prefix}{base}{id_index - 1}'
+        self.id_map = collections.defaultdict(id_gen)
+
+        self.temp_fname = fname + TEMP_SUFFIX
+        self.file = open(self.temp_fname, 'w', encoding='utf-8')
+        header = self.drawing.as_svg()
+        self.file.write(header[:-len(draw_drawing.SVG_END)])
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+    def start_element(self):
+        if self.open_groups and not self.open_groups[-1]:
+            self.file.write('\n')
+            self.open_groups[-1] = True
+    def append(self, element):
+        """
+        Write an element, inside the innermost open group if there is one
+        """
+        if self.prepare is not None:
+            self.prepare(element)
+        self.start_element()
+        seen = set()
+        def is_duplicate(obj):
+            # only within this element, as everything before it is gone, and ids of gone objects get reused
+            dup = id(obj) in seen
+            seen.add(id(obj))
+            return dup
+        local = draw_types.LocalContext(self.context, element, self.drawing)
+        defs = io.StringIO()
+        element.write_svg_defs(self.id_map, is_duplicate, defs, local, False)
+        if defs.getvalue():
+            raise ValueError(f'{element.TAG_NAME} element needs defs, which SVGStream can not write')
+        element.write_svg_element(self.id_map, is_duplicate, self.file, local, True)
+        seen.clear()
+        element.write_svg_element(self.id_map, is_duplicate, self.file, local, False)
+        self.file.write('\n')
+    def open_group(self, **args):
+        """
+        Start a group; everything appended until close_group is written inside it
+        :param args: the group's attributes, as for draw.Group
+        :return: this stream, to append to
+        """
+        group = draw.Group(**args)
+        if self.prepare is not None:
+            self.prepare(group)
+        self.start_element()
+        self.file.write('<g')
+        draw_types.LocalContext(self.context, group, self.drawing).write_tag_args(group.args, self.file, self.id_map)
+        self.file.write('>')
+        self.open_groups.append(False)
+        return self
+    def close_group(self):
+        self.open_groups.pop()
+        self.file.write('</g>\n')
+    def close(self):
+        if not self.file.closed:
+            while self.open_groups:
+                self.close_group()
+            self.file.write(draw_drawing.SVG_END)
+            self.file.close()
+            os.replace(self.temp_fname, self.fname)
+    def abort(self):
+        """
+        Stop writing and throw away what has been written, leaving whatever was at fname before
+        """
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.temp_fname)
+
+
+def svg_to_png(svg_file, png_file):
+    """
+    Convert an SVG file to PNG as drawsvg's Drawing.save_png does, but reading the file rather than a drawing
+    """
+    draw_raster.delay_import_cairo().svg2png(url=svg_file, write_to=png_file)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,198 @@
+from TLDBaseViz import *
+import math
+import numpy as np
+
+REGION_SIDE = 8 # regions are squares of this many bases a side on the grid
+EXTRA_EDGES = 0.3 # chance of connecting each pair of bases above one another, besides those needed to connect everything
+# weights of how many rows of features a base has, and how many features a row has (1, 2, ...), roughly as in mybases.json
+ROW_WEIGHTS = (0.55, 0.25, 0.11, 0.05, 0.02, 0.01, 0.01)
+ROW_LENGTH_WEIGHTS = (0.45, 0.22, 0.13, 0.1, 0.04, 0.04, 0.02)
+PREFIX_WEIGHTS = {'': 0.6, TOREMOVE: 0.1, TOBRING: 0.08, TOFIND: 0.17, TOMAKE: 0.05}
+PROBABILITY_RATE = 0.1 # fraction of features that are only likely, e.g. ?hammer/.25
+PROBABILITIES = ('.5', '.33', '.25', '.2', '.17', '.14')
+QUANTITY_RATE = 0.03 # fraction of movable features with a quantity, e.g. stick:3
+MAX_QUANTITY = 20
+KIND_WEIGHTS = {'todo': 0.6, 'path': 0.25, 'oneway': 0.04, 'charcoal': 0.03, 'paint': 0.03, 'cattail': 0.02,
+                'tinder': 0.01, 'mixed': 0.02}
+# chances of each flag of a base; cabin fever risk is also set for every base with a loading screen
+FLAG_RATES = {INDOORS: 0.7, LOADING: 0.45, CABINFEVERRISK: 0.15, CUSTOMIZABLE: 0.33, EXPLORED: 0.8}
+
+
+def feature_vocabulary(colours=raw_colours):
+    """
+    Every feature token the generator can use, with prefixes only where they're allowed
+    (bringing needs something movable, making needs a material with a colour)
+    :return: list of tokens, array of their chances, array of whether each is movable
+    >>> tokens, p, movable = feature_vocabulary()
+    >>> '+hammer' in tokens, '+workbench' in tokens, '-workbench' in tokens, round(float(p.sum()), 6)
+    (True, False, True, 1.0)
+    """
+    allowed = {prefix: [] for prefix in PREFIX_WEIGHTS}
+    for la in ICONS:
+        for prefix in PREFIX_WEIGHTS:
+            if prefix == TOBRING and not la.movable:
+                continue
+            if prefix == TOMAKE and TODO_TYPES[la.key] not in colours:
+                continue
+            allowed[prefix].append(la.key)
+    tokens = []
+    p = []
+    movable = []
+    for prefix in allowed:
+        for key in allowed[prefix]:
+            tokens.append(prefix + key)
+            p.append(PREFIX_WEIGHTS[prefix] / len(allowed[prefix]))
+            movable.append(key in MOVABLES)
+    p = np.array(p)
+    return tokens, p / p.sum(), np.array(movable)
+
+
+def sample_lengths(rng, weights, n):
+    return rng.choice(len(weights), size=n, p=np.array(weights) / sum(weights)) + 1
+
+
+def sample_features(rng, n):
+    """
+    Rows of feature tokens for n bases
+    :param rng: numpy random Generator
+    :return: list of lists of rows, each row being tokens joined by commas
+    """
+    rows_per_base = sample_lengths(rng, ROW_WEIGHTS, n)
+    row_lengths = sample_lengths(rng, ROW_LENGTH_WEIGHTS, int(rows_per_base.sum()))
+    total = int(row_lengths.sum())
+
+    tokens, p, movable = feature_vocabulary()
+    picks = rng.choice(len(tokens), size=total, p=p)
+    # suffixes: none, then each probability, then each quantity
+    suffixes = [''] + [PROBABILITY_DELIM + s for s in PROBABILITIES] + [QTY_MARKER + str(q) for q in range(2, MAX_QUANTITY + 1)]
+    suffix = np.zeros(total, dtype=int)
+    likely = rng.random(total) < PROBABILITY_RATE
+    suffix[likely] = 1 + rng.integers(len(PROBABILITIES), size=int(likely.sum()))
+    counted = ~likely & movable[picks] & (rng.random(total) < QUANTITY_RATE)
+    suffix[counted] = 1 + len(PROBABILITIES) + rng.integers(MAX_QUANTITY - 1, size=int(counted.sum()))
+
+    cells = [tokens[t] + suffixes[s] for t, s in zip(picks.tolist(), suffix.tolist())]
+    row_ends = np.cumsum(row_lengths).tolist()
+    rows = [','.join(cells[start:end]) for start, end in zip([0] + row_ends[:-1], row_ends)]
+    base_ends = np.cumsum(rows_per_base).tolist()
+    return [rows[start:end] for start, end in zip([0] + base_ends[:-1], base_ends)]
+
+
+def grid_edges(rng, n, columns, extra_edges=EXTRA_EDGES):
+    """
+    Connections between neighbours on a grid, every base in a row to the next, and the first base of each row to the
+    one below, so everything is connected, plus some other bases to the ones below them
+    :return: arrays of source index, sink index, and whether the connection goes east (otherwise south)
+    >>> src, snk, east = grid_edges(np.random.default_rng(0), 7, 3, extra_edges=1)
+    >>> src.tolist(), snk.tolist(), east.tolist()
+    ([0, 1, 3, 4, 0, 3, 1, 2], [1, 2, 4, 5, 3, 6, 4, 5], [True, True, True, True, False, False, False, False])
+    """
+    ids = np.arange(n)
+    col = ids % columns
+    across = ids[(col < columns - 1) & (ids + 1 < n)]
+    first = ids[(col == 0) & (ids + columns < n)]
+    others = ids[(col > 0) & (ids + columns < n)]
+    others = others[rng.random(len(others)) < extra_edges]
+    down = np.concatenate([first, others])
+    src = np.concatenate([across, down])
+    snk = np.concatenate([across + 1, down + columns])
+    return src, snk, np.arange(len(src)) < len(across)
+
+
+def generate_world(n, seed=0, region_side=REGION_SIDE, extra_edges=EXTRA_EDGES):
+    """
+    A made-up world of n bases on a grid, for testing with more bases than any real save. Bases are grouped into
+    square regions, connected to their neighbours in the direction they are on the grid, between corners facing
+    each other, and everything can be reached from everything else. The same seed always gives the same world.
+    :param n: number of bases
+    :param seed: random seed
+    :param region_side: regions are squares of this many bases a side
+    :param extra_edges: chance of each other connection between bases above one another
+    :return: dictionary as in an input JSON file
+    >>> world = generate_world(300, seed=1)
+    >>> with open('tests/synthetic.json', 'w') as f:
+    ...     json.dump(world, f)
+    >>> [i for i in check_save('tests/synthetic.json') if i['check'] not in ('fixed-number', 'balance')]
+    []
+    >>> b, e = parse_input('tests/synthetic.json')
+    >>> list(b)[:2], list(b['% Region0_0'])[:3]
+    (['% Region0_0', '% Region0_1'], ['Base0_0', 'Base0_1', 'Base0_2'])
+    >>> edges = parse_edges(e)
+    >>> seen, to_visit = {'Base0_0'}, ['Base0_0']
+    >>> while to_visit:
+    ...     for sink in edges[to_visit.pop()]:
+    ...         if sink not in seen:
+    ...             seen.add(sink)
+    ...             to_visit.append(sink)
+    >>> len(seen)
+    300
+    >>> generate_world(300, seed=1) == world, generate_world(300, seed=2) == world
+    (True, False)
+    """
+    rng = np.random.default_rng(seed)
+    columns = math.ceil(math.sqrt(n))
+    ids = np.arange(n)
+    row, col = ids // columns, ids % columns
+    names = [f'Base{r}_{c}' for r, c in zip(row.tolist(), col.tolist())]
+    region_row, region_col = (row // region_side).tolist(), (col // region_side).tolist()
+
+    flags = {k: rng.random(n) < FLAG_RATES[k] for k in FLAG_RATES}
+    flags[CABINFEVERRISK] |= flags[LOADING]
+    flags = {k: flags[k].tolist() for k in flags}
+    features = sample_features(rng, n)
+
+    bases = {}
+    for i in sorted(range(n), key=lambda i: (region_row[i], region_col[i], i)):
+        region = f'Region{region_row[i]}_{region_col[i]}'
+        group = COMMENT + ' ' + region
+        if group not in bases:
+            bases[group] = {}
+        bases[group][names[i]] = {REGION: region, CUSTOMIZABLE: flags[CUSTOMIZABLE][i], LOADING: flags[LOADING][i],
+                                  CABINFEVERRISK: flags[CABINFEVERRISK][i], INDOORS: flags[INDOORS][i],
+                                  EXPLORED: flags[EXPLORED][i], FEATURES: features[i]}
+
+    src, snk, east = grid_edges(rng, n, columns, extra_edges)
+    m = len(src)
+    # give about half the connections from the other end, as a save would
+    flip = rng.random(m) < 0.5
+    src, snk = np.where(flip, snk, src).tolist(), np.where(flip, src, snk).tolist()
+    directions = np.where(east, np.where(flip, WEST, EAST), np.where(flip, NORTH, SOUTH)).tolist()
+    source_side, sink_side = rng.integers(2, size=(2, m)).tolist()
+    kinds = [k for k in KIND_WEIGHTS if k in DASHSTYLE]
+    weights = np.array([KIND_WEIGHTS[k] for k in kinds])
+    kind = rng.choice(len(kinds), size=m, p=weights / weights.sum()).tolist()
+    edges = []
+    for j in range(m):
+        source_options, sink_options = CORNER_OPTIONS[directions[j]]
+        edges.append([names[src[j]], directions[j], source_options[source_side[j]], names[snk[j]],
+                      sink_options[sink_side[j]], kinds[kind[j]]])
+    return {BASES: bases, CONNECTIONS: edges}
+
+
+def write_world(n, fname=None, seed=0, **kwargs):
+    """
+    Generate a world (see generate_world) and save it as JSON
+    :param fname: filepath, by default synthetic_<n>_<seed>.json
+    :return: filepath written
+    """
+    if fname is None:
+        fname = f'synthetic_{n}_{seed}.json'
+    world = generate_world(n, seed=seed, **kwargs)
+    with open(fname, 'w') as f:
+        json.dump(world, f)
+    return fname
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 1:
+        seed = 0
+        if '--seed' in sys.argv:
+            seed = int(sys.argv[sys.argv.index('--seed') + 1])
+        out = None
+        if '--out' in sys.argv:
+            out = sys.argv[sys.argv.index('--out') + 1]
+        print('Wrote', write_world(int(sys.argv[1]), out, seed))
+    else:
+        doctest.testmod()
+        print('To run: python3 synthetic.py 100000 [--seed 0] [--out world.json]')
@@ -0,0 +1,192 @@
+from TLDBaseViz import *
+import numpy as np
+import re
+
+INVERT = 'invert'
+CHROMA = 'chroma'
+HUE = 'hue'
+TRANSFORM_DELIM = '+' # to combine transforms in one variant, e.g. invert+hue=180
+VALUE_DELIM = '='
+MIN_CONTRAST = 3 # WCAG 2 minimum contrast for graphics and large text
+CONTRAST_AGAINST = (BG, BASE_BG) # what everything else is drawn on
+
+
+def parse_variant(text):
+    """
+    Read a variant written as transforms joined by +: invert (lightness), chroma=<scale>, hue=<degrees to rotate>
+    :param text: e.g. 'invert+chroma=0.8'
+    :return: (invert, chroma scale, hue rotation)
+    >>> parse_variant('invert+chroma=0.8'), parse_variant('hue=-30')
+    ((True, 0.8, 0.0), (False, 1.0, -30.0))
+    """
+    invert, chroma, hue = False, 1.0, 0.0
+    for t in text.split(TRANSFORM_DELIM):
+        name, _, value = t.partition(VALUE_DELIM)
+        if name == INVERT:
+            invert = not invert
+        elif name == CHROMA:
+            chroma *= float(value)
+        elif name == HUE:
+            hue += float(value)
+        else:
+            raise ValueError(f'unknown transform {t}, use {INVERT}, {CHROMA}=<scale> or {HUE}=<degrees>')
+    return invert, chroma, hue
+
+
+def style_oklch(colours):
+    """
+    The colours of a style file as one array of OKLCH values, converting any that aren't written as oklch
+    :param colours: dictionary of colour name : colour, as from parse_styling
+    :return: list of names, array with a row of (l, c, h) for each
+    >>> names, lch = style_oklch({'bg': 'oklch(0.95 0.02 190)', 'take': '#ffffff'})
+    >>> names, lch.round(3).tolist()
+    (['bg', 'take'], [[0.95, 0.02, 190.0], [1.0, 0.0, 0.0]])
+    """
+    names = list(colours)
+    lch = np.zeros((len(names), 3))
+    other = []
+    for i, k in enumerate(names):
+        if 'oklch' in colours[k]:
+            lch[i] = parse_oklch(colours[k])
+        else:
+            other.append(i)
+    if other:
+        lch[other] = rgb2oklch(np.array([hex_to_rgb(colours[names[i]]) for i in other]))
+    return names, lch
+
+
+def variant_palettes(lch, variants):
+    """
+    Every variant of a palette at once
+    :param lch: array of (l, c, h), one row per colour
+    :param variants: list of (invert, chroma scale, hue rotation), see parse_variant
+    :return: array of (l, c, h) of shape (variants, colours, 3)
+    >>> variant_palettes(np.array([[0.2, 0.1, 350]]), [(False, 1, 0), (True, 0.5, 20)]).round(6).tolist()
+    [[[0.2, 0.1, 350.0]], [[0.8, 0.05, 10.0]]]
+    """
+    invert, chroma, hue = (np.array(v, dtype=float)[:, None] for v in zip(*variants))
+    out = np.empty((len(variants),) + lch.shape)
+    out[..., 0] = np.where(invert > 0, 1 - lch[:, 0], lch[:, 0])
+    out[..., 1] = lch[:, 1] * chroma
+    out[..., 2] = (lch[:, 2] + hue) % 360
+    return out
+
+
+def relative_luminance(rgb):
+    """
+    WCAG relative luminance of 8-bit sRGB colours
+    >>> relative_luminance(np.array([[255, 255, 255], [0, 0, 0]])).tolist()
+    [1.0, 0.0]
+    """
+    c = rgb / 255
+    lin = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return lin @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def contrast_ratio(a, b):
+    """
+    WCAG contrast ratio between luminances, from 1 (none) to 21 (black on white)
+    """
+    return (np.maximum(a, b) + 0.05) / (np.minimum(a, b) + 0.05)
+
+
+class ThemeVariants:
+    def __init__(self, colours, variants):
+        """
+        Variants of a palette, converted to sRGB and checked together
+        :param colours: dictionary of colour name : colour, as from parse_styling
+        :param variants: list of variant strings, see parse_variant
+        >>> c, d, cs, ps = parse_styling('styling.json')
+        >>> tv = ThemeVariants(c, ['invert', 'hue=180', 'invert+chroma=1.5'])
+        >>> tv.palette(0)['bg'], tv.palette(1)['take'] == oklch_to_hex(0.6, 0.12, 30)
+        ('#000101', True)
+        >>> tv.clipped(1)
+        ['basebg', 'bring', 'oneway', 'paint', 'destroy', 'clearpath', 'mixed', 'find', 'todo']
+        >>> tv.low_contrast(1)[:4]
+        [('cedar', 'bg', 2.32), ('cedar', 'basebg', 2.55), ('path', 'bg', 2.4), ('path', 'basebg', 2.64)]
+        >>> len(tv.low_contrast(0)), len(tv.low_contrast(2)) # light colours that become dark on a dark background
+        (16, 17)
+        """
+        self.names, lch = style_oklch(colours)
+        self.variants = list(variants)
+        self.lch = variant_palettes(lch, [parse_variant(v) for v in self.variants])
+        self.lch[..., 0] = self.lch[..., 0].clip(0, 1)
+        flat = self.lch.reshape(-1, 3)
+        self.out_of_gamut = out_of_gamut(flat).reshape(self.lch.shape[:2])
+        self.rgb = oklch2rgb(flat).reshape(self.lch.shape).astype(int)
+        self.hexes = [[rgb_to_hex(*c) for c in v] for v in self.rgb.tolist()]
+
+        luminance = relative_luminance(self.rgb)
+        against = [self.names.index(k) for k in CONTRAST_AGAINST if k in self.names]
+        self.against = [self.names[i] for i in against]
+        # variants x colours x backgrounds
+        self.contrast = contrast_ratio(luminance[:, :, None], luminance[:, against][:, None, :])
+        self.contrast[:, against, :] = np.inf # backgrounds aren't drawn on each other
+    def palette(self, v):
+        return dict(zip(self.names, self.hexes[v]))
+    def clipped(self, v):
+        """
+        Colours of a variant that are outside sRGB, so have been shown with less chroma
+        """
+        return [self.names[i] for i in np.flatnonzero(self.out_of_gamut[v])]
+    def low_contrast(self, v, min_contrast=MIN_CONTRAST):
+        """
+        :return: list of (colour name, background name, contrast) below min_contrast
+        """
+        return [(self.names[i], self.against[j], round(float(self.contrast[v, i, j]), 2))
+                for i, j in zip(*np.nonzero(self.contrast[v] < min_contrast))]
+    def style_json(self, v, style):
+        """
+        A style file's contents with this variant's colours, written as oklch
+        :param style: the style file's JSON, as a dictionary
+        """
+        style = dict(style)
+        style[COLOURS] = {k: 'oklch({:.4g} {:.4g} {:.4g})'.format(*lch) for k, lch in zip(self.names, self.lch[v].tolist())}
+        return style
+
+
+def write_variants(style_file, variants, folder=None):
+    """
+    Write a style file for each variant, next to the original, and print what to watch out for
+    :param style_file: style JSON filepath
+    :param variants: list of variant strings, see parse_variant
+    :return: list of filepaths written
+    >>> write_variants('styling.json', ['chroma=0.5'], folder='tests')
+    styling_chroma_0.5.json
+        out of gamut, chroma reduced: destroy
+        low contrast: cedar on bg 2.31, cedar on basebg 2.52, path on bg 2.26, path on basebg 2.46, stone on bg 2.29, stone on basebg 2.49, clearpath on bg 2.3, clearpath on basebg 2.5
+    ['tests/styling_chroma_0.5.json']
+    >>> parse_styling('tests/styling_chroma_0.5.json')[0]['take']
+    'oklch(0.6 0.06 210)'
+    """
+    with open(style_file, 'r') as f:
+        style = json.load(f)
+    tv = ThemeVariants(style[COLOURS], variants)
+    if folder is None:
+        folder = os.path.dirname(style_file)
+    written = []
+    for v, name in enumerate(tv.variants):
+        fname = os.path.basename(style_file).replace('.json', '_' + re.sub(r'[^\w.-]+', '_', name) + '.json')
+        print(fname)
+        if tv.clipped(v):
+            print('    out of gamut, chroma reduced:', ', '.join(tv.clipped(v)))
+        if tv.low_contrast(v):
+            print('    low contrast:', ', '.join(f'{c} on {b} {r}' for c, b, r in tv.low_contrast(v)))
+        path = os.path.join(folder, fname)
+        with open(path, 'w') as f:
+            json.dump(tv.style_json(v, style), f, indent=1)
+        written.append(path)
+    return written
+
+
+if __name__ == '__main__':
+    import doctest
+    if len(sys.argv) > 2:
+        write_variants(sys.argv[1], sys.argv[2:])
+    else:
+        doctest.testmod()
+        print('To run: python3 themes.py styling.json invert hue=180 invert+chroma=0.8')
+        print(f'Each argument after the style file is a variant, made of transforms joined by {TRANSFORM_DELIM}:')
+        print(f'\t{INVERT} \t\t\t swap light and dark')
+        print(f'\t{CHROMA}=<scale> \t\t multiply chroma (colourfulness)')
+        print(f'\t{HUE}=<degrees> \t\t rotate hue')
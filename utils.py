@@ -68,10 +68,62 @@ def oklch_to_hex(l, c, h):
     rgb = oklch2rgb(adjusted)
     return rgb_to_hex(*rgb)
 
+def oklchs_to_hex(lchs):
+    """
+    Convert many colours from OKlch to hex at once, with a single oklch2rgb call
+    (same results as oklch_to_hex on each).
+    :param lchs: list of (l, c, h)
+    :return: list of hex strings
+    >>> oklchs_to_hex([(96.8211630743405/100, 0.2087535023088284, 109.73795453564486), (0.63, 0.09, 326)])
+    ['#ffff14', '#a676a6']
+    >>> oklchs_to_hex([])
+    []
+    """
+    if not lchs:
+        return []
+    lchs = np.array(lchs, dtype=float).reshape(-1, 3)
+    percent = lchs[:, 0] > 1
+    if np.any(percent):
+        print('Invalid input luminence', lchs[percent, 0].tolist())
+        lchs[percent, 0] /= 100
+    return [rgb_to_hex(*rgb) for rgb in oklch2rgb(lchs).tolist()]
+
 def rgb_to_hex(r,g,b):
     # https://stackoverflow.com/questions/3380726/converting-an-rgb-color-tuple-to-a-hexidecimal-string
     return "#{:02x}{:02x}{:02x}".format(r,g,b)
 
+# colour names used in the code, rather than in style files
+NAMED_COLOURS = {'white': '#ffffff', 'black': '#000000', 'purple': '#800080', 'green': '#008000'}
+
+def hex_to_rgb(hex):
+    """
+    >>> hex_to_rgb('#ff8000'), hex_to_rgb('#f80'), hex_to_rgb('purple')
+    ((255, 128, 0), (255, 136, 0), (128, 0, 128))
+    """
+    hex = NAMED_COLOURS.get(hex.lower(), hex).lstrip('#')
+    if len(hex) == 3:
+        hex = ''.join(2 * h for h in hex)
+    return int(hex[0:2], 16), int(hex[2:4], 16), int(hex[4:6], 16)
+
+def oklab_shades(hexes, background, levels):
+    """
+    Opaque colours that look like each colour drawn translucent over a background, mixed in OKLab
+    so each step looks evenly spaced.
+    :param hexes: list of colours
+    :param background: colour underneath
+    :param levels: number of steps from fully transparent (just the background) to opaque
+    :return: list, for each colour, of levels + 1 hex strings; the i-th is the colour at opacity i/levels
+    >>> oklab_shades(['#000000', '#623e29'], '#ffffff', 4)
+    [['#ffffff', '#aeaeae', '#636363', '#222222', '#000000'], ['#ffffff', '#d6cbc5', '#af9a8e', '#886a5a', '#623e29']]
+    """
+    if not hexes:
+        return []
+    colours = rgb2oklab(np.array([hex_to_rgb(h) for h in hexes]))
+    under = rgb2oklab(np.array(hex_to_rgb(background)))
+    alphas = np.linspace(0, 1, levels + 1)[None, :, None]
+    mixed = oklab2rgb(under + alphas * (colours[:, None, :] - under))
+    return [[rgb_to_hex(*rgb) for rgb in shades] for shades in mixed.tolist()]
+
 
 
 
@@ -105,4 +157,5 @@ def add_implicit_segments(s):
 
 
 if __name__ == '__main__':
+    import doctest
     doctest.testmod()
\ No newline at end of file